@@ -1,4 +1,5 @@
 """命令行入口模块"""
+import re
 import click
 import subprocess
 from rich.table import Table
@@ -6,17 +7,28 @@ from rich.console import Console
 from nexus_vpn.utils.logger import log
 from nexus_vpn.core.system import SystemChecker
 from nexus_vpn.core.installer import Installer
-from nexus_vpn.core.user_mgr import UserManager
-from nexus_vpn.protocols.v2ray import V2RayManager
+from nexus_vpn.core.user_mgr import UserManager, USER_TYPES, LIST_FORMATS
+from nexus_vpn.core.stats_mgr import StatsManager
+from nexus_vpn.core.reality_mgr import RealityManager
+from nexus_vpn.core.state import ServerState
+from nexus_vpn.core.bundle import Bundle, BundleError
+from nexus_vpn.core.kernel_tuning import load_profile, read_live, drift
+from nexus_vpn.core.nic_tuning import NicTuner
+from nexus_vpn.protocols.v2ray import V2RayManager, XrayConfigError
+from nexus_vpn.protocols.xray_tuning import PROFILES
+from nexus_vpn.protocols.share_render import IMAGE_FORMATS, png_available
+from nexus_vpn.utils.download import DEFAULT_CACHE_DIR
 
 console = Console()
 
 # 允许检查的服务名白名单
 ALLOWED_SERVICES = {"nexus-xray", "strongswan", "strongswan-starter", "ipsec"}
+# Xray 分片实例 nexus-xray@N
+SHARD_SERVICE_RE = re.compile(r"^nexus-xray@\d+$")
 
 
 def check_service(name):
-    if name not in ALLOWED_SERVICES:
+    if name not in ALLOWED_SERVICES and not SHARD_SERVICE_RE.match(name):
         return "[red]invalid[/red]"
     try:
         res = subprocess.run(
@@ -60,30 +72,91 @@ def check_bbr():
         return "[red]Unknown[/red]"
 
 
+def check_flow_offload():
+    """(状态, 详情)"""
+    try:
+        offload = Installer.flow_offload_status()
+    except (OSError, subprocess.SubprocessError):
+        return "[red]Unknown[/red]", ""
+    if not offload["configured"]:
+        return "[dim]未启用[/dim]", ""
+    if not offload["active"]:
+        return "[red]未生效[/red]", "nexus_vpn 表中没有 flowtable"
+    flows = "未知" if offload["flows"] is None else offload["flows"]
+    return "[green]已生效[/green]", f"快速路径连接数: {flows}"
+
+
+def check_sysctl_drift(limit=5):
+    """(状态, 详情)：内核参数档位与当前值的偏离"""
+    profile = load_profile()
+    if profile is None:
+        return "[dim]未部署[/dim]", ""
+    diffs = drift(profile, read_live(profile))
+    if not diffs:
+        return f"[green]一致 ({len(profile)} 项)[/green]", ""
+    details = [f"{key}: {actual if actual is not None else '不可读'} ≠ {expected}"
+               for key, expected, actual in diffs[:limit]]
+    if len(diffs) > limit:
+        details.append(f"... 另有 {len(diffs) - limit} 项")
+    return f"[yellow]{len(diffs)} 项偏离[/yellow]", "\n".join(details)
+
+
 @click.group()
 def cli():
     """🛡️ nexus-vpn: 综合代理与 VPN 部署工具"""
     pass
 
 
+def download_options(f):
+    """install / update xray 共用的下载选项"""
+    f = click.option('--mirror', default=None,
+                     help='Xray 发布包镜像根地址（目录结构同 GitHub releases/download）')(f)
+    f = click.option('--cache-dir', default=None,
+                     help=f'下载缓存目录，多台服务器可共享（默认 {DEFAULT_CACHE_DIR}）')(f)
+    return f
+
+
 @cli.command()
 @click.option('--domain', prompt='请输入服务器域名/IP', help='服务器公网IP或域名')
 @click.option('--proto', default='vless', type=click.Choice(['vless']), help='协议类型')
 @click.option('--reality-dest', 'reality_dests', multiple=True, default=['www.microsoft.com:443'], help='Reality 偷取的目标网站（可多次指定）')
-def install(domain, proto, reality_dests):
+@click.option('--xray-shards', type=click.IntRange(min=1), default=None, help='Xray 实例数（多核分片，默认沿用现有部署或 1）')
+@click.option('--profile', type=click.Choice(sorted(PROFILES)), default=None, help='Xray 性能调优档位（按内存与核数计算，默认沿用现有部署）')
+@click.option('--probe/--no-probe', default=True, help='指定多个 Reality 目标时按握手延迟排序（默认开启）')
+@click.option('--flow-offload/--no-flow-offload', default=None,
+              help='为 IKEv2 转发流量启用 nftables flowtable 快速路径（默认沿用现有部署）')
+@click.option('--bundle', 'bundle_path', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='离线安装包（bundle create 生成），从包内文件安装，不访问软件源与 GitHub')
+@download_options
+def install(domain, proto, reality_dests, xray_shards, profile, probe, flow_offload, bundle_path, cache_dir, mirror):
     """[部署] 执行全自动安装与初始化"""
     log.info(f"开始部署 Nexus-VPN | 目标: {domain}")
     SystemChecker.check_os()
-    installer = Installer(domain, proto, reality_dests)
-    installer.run()
+    if xray_shards is None:
+        xray_shards = V2RayManager.get_shard_count()
+    if bundle_path:
+        try:
+            with Bundle.open(bundle_path) as bundle:
+                Installer(domain, proto, reality_dests, xray_shards, bundle=bundle, flow_offload=flow_offload).run()
+        except BundleError as e:
+            raise click.ClickException(str(e))
+    else:
+        Installer(domain, proto, reality_dests, xray_shards, cache_dir, mirror, flow_offload=flow_offload).run()
 
     if proto == 'vless':
-        info = V2RayManager.create_config(domain, reality_dests)
+        if probe:
+            reality_dests = RealityManager.order_dests(reality_dests)
+        try:
+            info = V2RayManager.create_config(domain, reality_dests, shards=xray_shards, profile=profile)
+        except XrayConfigError as e:
+            raise click.ClickException(str(e))
         V2RayManager.print_connection_info(domain, info)
 
     from nexus_vpn.protocols.ikev2 import IKEv2Manager
     IKEv2Manager.generate_config(domain)
     log.info("IKEv2 VPN 已初始化完成 (Cert + EAP 模式)")
+    # 离线安装时不查询出口 IP
+    ServerState.refresh(domain, lookup=not bundle_path)
 
 
 @cli.command()
@@ -101,9 +174,10 @@ def update():
 
 @update.command(name='xray')
 @click.option('--version', 'target_version', default=None, help='指定版本号（如 1.8.6），留空则获取最新版')
-def update_xray(target_version):
+@download_options
+def update_xray(target_version, cache_dir, mirror):
     """更新 Xray Core 到指定版本"""
-    Installer.update_xray(target_version)
+    Installer.update_xray(target_version, cache_dir, mirror)
 
 
 @update.command(name='strongswan')
@@ -112,6 +186,66 @@ def update_strongswan():
     Installer.update_strongswan()
 
 
+@cli.group()
+def bundle():
+    """[离线] 生成离线安装包"""
+    pass
+
+
+@bundle.command(name='create')
+@click.option('--output', '-o', default='nexus-vpn-bundle.tar.gz', show_default=True, help='输出文件')
+@click.option('--xray-version', default=Installer.XRAY_VERSION, show_default=True, help='打包的 Xray 版本')
+@download_options
+def bundle_create(output, xray_version, cache_dir, mirror):
+    """在联网主机上打包 Xray 与系统依赖（需与目标主机发行版、架构一致）"""
+    try:
+        Bundle.create(output, xray_version, cache_dir, mirror)
+    except BundleError as e:
+        raise click.ClickException(str(e))
+
+
+@cli.group()
+def tune():
+    """[调优] 主机网络性能调优"""
+    pass
+
+
+@tune.command(name='nic')
+@click.option('--iface', default=None, help='要调优的网卡（默认为默认路由所在网卡）')
+@click.option('--dry-run', is_flag=True, help='只显示当前分布与调整计划，不做修改')
+@click.option('--persist/--no-persist', default=True, help='注册开机时重新调优的 systemd 单元（默认开启）')
+def tune_nic(iface, dry_run, persist):
+    """按 CPU 分配网卡队列、RPS/XPS 与中断亲和性"""
+    if iface is None:
+        try:
+            iface = Installer._default_iface()
+        except (OSError, subprocess.CalledProcessError):
+            iface = None
+        if not iface:
+            raise click.ClickException("未找到默认路由所在网卡，请用 --iface 指定")
+    tuner = NicTuner(iface)
+    if not tuner.exists():
+        raise click.ClickException(f"网卡不存在: {iface}")
+
+    if dry_run:
+        snap = tuner.snapshot()
+        tuner.print_report(snap)
+        plan = NicTuner.plan(snap)
+        if plan["channels"]:
+            console.print(f"combined 队列数: {snap['channels'][1]} → {plan['channels']}")
+        console.print(f"RPS: {plan['rps'] or '无接收队列'}\nXPS: {plan['xps'] or '无发送队列'}\n"
+                      f"中断 → CPU: {plan['irqs'] or '未找到网卡中断'}")
+        return
+
+    if subprocess.run(["systemctl", "is-active", "--quiet", "irqbalance"]).returncode == 0:
+        log.warning("irqbalance 正在运行，可能会覆盖中断亲和性（可执行 systemctl disable --now irqbalance）")
+    result = tuner.tune()
+    tuner.print_report(result["before"], result["after"])
+    if persist:
+        tuner.persist()
+        log.success(f"已注册开机调优: {NicTuner.SERVICE_NAME}.service")
+
+
 @cli.group()
 def user():
     """[用户] 管理 VPN/代理 用户"""
@@ -135,9 +269,15 @@ def user_del(vpn_type, username):
 
 
 @user.command(name='list')
-def user_list():
-    """列出所有用户"""
-    UserManager.list_users()
+@click.option('--format', 'output_format', type=click.Choice(LIST_FORMATS), default='table', show_default=True,
+              help='输出格式（json/jsonl/csv 逐行输出，适合脚本处理）')
+@click.option('--type', 'vpn_types', type=click.Choice(USER_TYPES), multiple=True, help='只列出指定类型（可多次指定）')
+@click.option('--filter', 'pattern', default=None, help='按用户名筛选，支持 * ? 通配符，否则按子串匹配')
+@click.option('--limit', type=click.IntRange(min=1), default=None, help='最多列出的用户数')
+@click.option('--offset', type=click.IntRange(min=0), default=0, show_default=True, help='跳过前 N 个用户')
+def user_list(output_format, vpn_types, pattern, limit, offset):
+    """列出用户（按添加顺序）"""
+    UserManager.list_users(output_format, vpn_types, pattern, limit, offset)
 
 
 @user.command(name='info')
@@ -148,6 +288,117 @@ def user_info(vpn_type, username):
     UserManager.info(vpn_type, username)
 
 
+def share_options(f):
+    """import/export 共用的输出选项"""
+    f = click.option('--workers', type=click.IntRange(min=1), default=None,
+                     help='并行渲染进程数（默认 CPU 核数）')(f)
+    f = click.option('--format', 'image_format', type=click.Choice(IMAGE_FORMATS), default='svg',
+                     show_default=True, help='二维码图片格式')(f)
+    f = click.option('--output-dir', default='nexus-export', show_default=True,
+                     help='分享链接与二维码输出目录')(f)
+    return f
+
+
+def check_image_format(image_format):
+    if image_format == 'png' and not png_available():
+        raise click.UsageError("PNG 输出需要 pypng，请先执行: pip install 'nexus-vpn[png]'")
+
+
+@user.command(name='import')
+@click.option('--type', 'vpn_type', type=click.Choice(USER_TYPES), default=None,
+              help='文件中未指定 type 的用户使用的类型')
+@share_options
+@click.argument('file', type=click.Path(exists=True, dir_okay=False))
+def user_import(vpn_type, output_dir, image_format, workers, file):
+    """批量导入用户（CSV/JSON，列: type,username,password,action）"""
+    check_image_format(image_format)
+    UserManager.import_users(vpn_type, file, output_dir, image_format, workers)
+
+
+@user.command(name='export')
+@click.option('--type', 'vpn_type', type=click.Choice(['v2ray']), required=True)
+@share_options
+def user_export(vpn_type, output_dir, image_format, workers):
+    """导出所有用户的分享链接与二维码（链接未变化的用户跳过）"""
+    check_image_format(image_format)
+    UserManager.export_users(vpn_type, output_dir, image_format, workers)
+
+
+@cli.group()
+def stats():
+    """[统计] 查看用户流量统计"""
+    pass
+
+
+@stats.command(name='v2ray')
+@click.option('--top', 'limit', default=10, show_default=True, type=click.IntRange(min=1), help='显示流量最高的前 N 个用户')
+def stats_v2ray(limit):
+    """查询 V2Ray 用户流量（读后清零并累计到历史文件）"""
+    StatsManager.show(limit)
+
+
+@cli.group()
+def reality():
+    """[Reality] 目标探测与健康监控"""
+    pass
+
+
+@reality.command(name='probe')
+@click.argument('dests', nargs=-1)
+def reality_probe(dests):
+    """测量 Reality 目标的 TCP/TLS 1.3 握手延迟（默认探测当前部署的候选）"""
+    from nexus_vpn.protocols.reality_probe import rank
+    RealityManager.print_results(rank(dests or V2RayManager.get_reality_dests()))
+
+
+@reality.command(name='monitor')
+@click.option('--interval', default=300, show_default=True, type=click.IntRange(min=10), help='检查间隔（秒）')
+@click.option('--once', is_flag=True, help='只检查一次（适合 cron/systemd timer）')
+def reality_monitor(interval, once):
+    """当前目标劣化或不可达时自动切换到最快的候选目标"""
+    if once:
+        try:
+            RealityManager.check()
+        except XrayConfigError as e:
+            raise click.ClickException(str(e))
+    else:
+        RealityManager.monitor(interval)
+
+
+@cli.group()
+def state():
+    """[元数据] 服务器域名/IP/Reality 参数缓存"""
+    pass
+
+
+@state.command(name='show')
+def state_show():
+    """显示缓存的服务器元数据"""
+    data = ServerState.load()
+    if not data:
+        raise click.ClickException("尚未生成元数据缓存，请执行: nexus-vpn state refresh")
+    table = Table(title=f"🗂️ 服务器元数据 ({ServerState.PATH})", show_header=False)
+    table.add_column("项", style="cyan")
+    table.add_column("值")
+    reality = data.get('reality') or {}
+    table.add_row("域名", data.get('domain') or "[dim]N/A[/dim]")
+    table.add_row("公网 IP", ", ".join(data.get('public_ips') or []) or "[dim]N/A[/dim]")
+    table.add_row("Reality 公钥", reality.get('public_key') or "[dim]N/A[/dim]")
+    table.add_row("shortIds", ", ".join(reality.get('short_ids') or []) or "[dim]N/A[/dim]")
+    table.add_row("端口", ", ".join(f"{k}: {v}" for k, v in (data.get('ports') or {}).items()))
+    console.print(table)
+
+
+@state.command(name='refresh')
+@click.option('--domain', default=None, help='更新服务器域名/IP（默认保留已缓存的值）')
+@click.option('--lookup/--no-lookup', default=True, help='是否通过外部服务查询出口 IP（默认开启）')
+def state_refresh(domain, lookup):
+    """从当前配置重新采集服务器元数据"""
+    data = ServerState.refresh(domain, lookup)
+    log.success(f"元数据已更新: 域名 {data.get('domain') or 'N/A'}，"
+                f"公网 IP {', '.join(data['public_ips']) or 'N/A'}")
+
+
 @cli.command()
 def status():
     """[状态] 检查服务运行状态"""
@@ -156,8 +407,17 @@ def status():
     table.add_column("状态信息", style="bold")
     table.add_column("附加详情", style="dim")
 
-    xray_status = check_service("nexus-xray")
-    xray_port = f"TCP/443: {check_port(443, 'tcp')}"
+    shards = V2RayManager.get_shard_count()
+    if shards > 1:
+        # 分片模式下 443 由 nftables 转发，逐个检查实例与其实际监听端口
+        xray_status = "\n".join(f"@{i}: {check_service(f'nexus-xray@{i}')}" for i in range(shards))
+        xray_port = "\n".join(
+            f"TCP/{V2RayManager.SHARD_BASE_PORT + i}: {check_port(V2RayManager.SHARD_BASE_PORT + i, 'tcp')}"
+            for i in range(shards)
+        )
+    else:
+        xray_status = check_service("nexus-xray")
+        xray_port = f"TCP/443: {check_port(443, 'tcp')}"
     table.add_row("Xray (VLESS)", xray_status, xray_port)
 
     # 检测 strongswan 服务名
@@ -183,6 +443,8 @@ def status():
         fw = "[red]Unknown[/red]"
 
     table.add_row("Kernel", check_bbr(), f"IP Forward: {fw}")
+    table.add_row("Sysctl", *check_sysctl_drift())
+    table.add_row("Flowtable", *check_flow_offload())
     console.print(table)
 
 
@@ -0,0 +1,228 @@
+"""离线安装包
+
+`nexus-vpn bundle create` 在联网的主机上把 Xray 发布包与系统依赖（.deb/.rpm 及其递归依赖）
+连同 manifest.json 打成一个 tar.gz；`nexus-vpn install --bundle` 在目标主机上解包、
+按清单校验 sha256 后从本地文件安装，不执行 apt-get update，也不访问 GitHub。
+打包主机应与目标主机使用相同的发行版版本与架构。
+"""
+import os
+import json
+import time
+import shutil
+import tarfile
+import platform
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from nexus_vpn.utils.logger import log
+from nexus_vpn.utils.sudo import sudo_run
+from nexus_vpn.utils.download import fetch_verified, sha256_file, DownloadError
+from nexus_vpn.core.installer import Installer
+
+BUNDLE_FORMAT = 1
+MANIFEST = "manifest.json"
+OS_RELEASE = "/etc/os-release"
+
+
+class BundleError(Exception):
+    """安装包无法创建、格式不符或校验失败"""
+
+
+def _os_release():
+    info = {}
+    try:
+        with open(OS_RELEASE) as f:
+            for line in f:
+                key, sep, value = line.strip().partition("=")
+                if sep:
+                    info[key] = value.strip('"')
+    except OSError:
+        pass
+    return {"id": info.get("ID"), "version_id": info.get("VERSION_ID"), "arch": platform.machine()}
+
+
+def _package_manager():
+    if shutil.which("apt-get"):
+        return "apt"
+    if shutil.which("yum") or shutil.which("dnf"):
+        return "yum"
+    raise BundleError("未找到 apt-get 或 yum")
+
+
+def _apt_closure(packages):
+    """packages 及其递归依赖（不含推荐包与虚包）"""
+    res = subprocess.run(
+        ["apt-cache", "depends", "--recurse", "--no-recommends", "--no-suggests", "--no-conflicts",
+         "--no-breaks", "--no-replaces", "--no-enhances"] + list(packages),
+        capture_output=True, text=True, check=True)
+    names = [line.strip() for line in res.stdout.splitlines()
+             if line and not line[0].isspace() and not line.startswith("<")]
+    return list(dict.fromkeys(names))
+
+
+def _download_packages(manager, packages, dest):
+    if manager == "apt":
+        names = _apt_closure(packages)
+        log.info(f"下载 {len(names)} 个 .deb 包（含依赖）...")
+        subprocess.run(["apt-get", "download"] + names, cwd=dest, check=True, stdout=subprocess.DEVNULL)
+        return
+    # 与 install_dependencies 一致：先在打包主机启用 EPEL，epel-release 本身也放进安装包
+    packages = Installer.rpm_packages(packages)
+    if Installer._missing_packages(["epel-release"], rpm=True):
+        sudo_run(["yum", "install", "-y", "epel-release"], stdout=subprocess.DEVNULL, check=True)
+    if shutil.which("dnf"):
+        subprocess.run(["dnf", "download", "--resolve", "--alldeps", "--destdir", dest] + list(packages),
+                       check=True, stdout=subprocess.DEVNULL)
+    elif shutil.which("yumdownloader"):
+        subprocess.run(["yumdownloader", "--resolve", "--destdir", dest] + list(packages),
+                       check=True, stdout=subprocess.DEVNULL)
+    else:
+        raise BundleError("下载 .rpm 需要 dnf 或 yum-utils（yumdownloader）")
+
+
+def _package_info(manager, path):
+    """(包名, 版本)"""
+    if manager == "apt":
+        out = subprocess.run(["dpkg-deb", "-f", path, "Package", "Version"],
+                             capture_output=True, text=True, check=True).stdout
+        fields = dict(line.split(": ", 1) for line in out.splitlines() if ": " in line)
+        return fields["Package"], fields["Version"]
+    out = subprocess.run(["rpm", "-qp", "--qf", "%{NAME}\t%{EPOCHNUM}:%{VERSION}-%{RELEASE}", path],
+                         capture_output=True, text=True, check=True).stdout
+    name, version = out.split("\t")
+    return name, version
+
+
+class Bundle:
+    """已解包并通过校验的离线安装包"""
+
+    def __init__(self, root, manifest):
+        self.root = root
+        self.manifest = manifest
+
+    @property
+    def xray_version(self):
+        return self.manifest["xray"]["version"]
+
+    @property
+    def xray_zip(self):
+        return os.path.join(self.root, self.manifest["xray"]["file"])
+
+    @staticmethod
+    def create(output, xray_version=None, cache_dir=None, mirror=None):
+        """在联网主机上生成离线安装包
+
+        Returns:
+            dict: 写入包内的清单
+        """
+        xray_version = xray_version or Installer.XRAY_VERSION
+        manager = _package_manager()
+        with tempfile.TemporaryDirectory(prefix="nexus-bundle-") as tmp:
+            log.info(f"下载 Xray v{xray_version}...")
+            try:
+                xray_zip = fetch_verified(Installer.get_xray_download_url(xray_version, mirror), cache_dir=cache_dir)
+            except DownloadError as e:
+                raise BundleError(str(e)) from e
+            xray_file = f"xray/{Installer.XRAY_ASSET}"
+            os.makedirs(os.path.join(tmp, "xray"))
+            shutil.copyfile(xray_zip, os.path.join(tmp, xray_file))
+
+            pkg_dir = os.path.join(tmp, "packages")
+            os.makedirs(pkg_dir)
+            try:
+                _download_packages(manager, Installer.PACKAGES, pkg_dir)
+            except subprocess.CalledProcessError as e:
+                raise BundleError(f"下载系统依赖失败: {e}") from e
+
+            packages = []
+            for name in sorted(os.listdir(pkg_dir)):
+                path = os.path.join(pkg_dir, name)
+                pkg_name, version = _package_info(manager, path)
+                packages.append({"file": f"packages/{name}", "name": pkg_name, "version": version,
+                                 "sha256": sha256_file(path)})
+            manifest = {
+                "format": BUNDLE_FORMAT,
+                "created_at": int(time.time()),
+                "os": _os_release(),
+                "xray": {"version": xray_version, "file": xray_file, "sha256": sha256_file(os.path.join(tmp, xray_file))},
+                "package_manager": manager,
+                "packages": packages,
+            }
+            with open(os.path.join(tmp, MANIFEST), "w") as f:
+                json.dump(manifest, f, indent=2)
+
+            with tarfile.open(output, "w:gz") as tar:
+                for name in [MANIFEST, xray_file] + [p["file"] for p in packages]:
+                    tar.add(os.path.join(tmp, name), arcname=name)
+        log.success(f"离线安装包已生成: {output}（Xray v{xray_version}，{len(packages)} 个系统包）")
+        return manifest
+
+    @staticmethod
+    @contextmanager
+    def open(path):
+        """解包到临时目录并校验，退出时删除临时目录"""
+        with tempfile.TemporaryDirectory(prefix="nexus-bundle-") as tmp:
+            try:
+                with tarfile.open(path, "r:*") as tar:
+                    for member in tar.getmembers():
+                        if not (member.isfile() or member.isdir()) or member.name.startswith("/") \
+                                or ".." in member.name.split("/"):
+                            raise BundleError(f"安装包包含非法条目: {member.name}")
+                    kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+                    tar.extractall(tmp, **kwargs)
+                with open(os.path.join(tmp, MANIFEST)) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError, tarfile.TarError) as e:
+                raise BundleError(f"无法读取安装包 {path}: {e}") from e
+            if manifest.get("format") != BUNDLE_FORMAT:
+                raise BundleError(f"不支持的安装包格式: {manifest.get('format')}")
+
+            for entry in [manifest["xray"]] + manifest.get("packages", []):
+                file_path = os.path.join(tmp, entry["file"])
+                if not os.path.isfile(file_path) or sha256_file(file_path) != entry["sha256"]:
+                    raise BundleError(f"安装包文件校验失败: {entry['file']}")
+
+            host = _os_release()
+            if manifest.get("os") != host:
+                built = manifest.get("os") or {}
+                log.warning(f"安装包生成于 {built.get('id')} {built.get('version_id')} ({built.get('arch')})，"
+                            f"当前主机为 {host['id']} {host['version_id']} ({host['arch']})，依赖可能不匹配")
+            yield Bundle(tmp, manifest)
+
+    def _pending_debs(self):
+        """未安装或比已安装版本更新的 .deb（避免降级已有的系统包）"""
+        res = subprocess.run(["dpkg-query", "-W", "-f", "${Package}\t${Version}\t${db:Status-Abbrev}\n"],
+                             capture_output=True, text=True)
+        installed = {}
+        for line in res.stdout.splitlines():
+            parts = line.split("\t")
+            if len(parts) == 3 and parts[2].startswith("ii"):
+                installed[parts[0]] = parts[1]
+        pending = []
+        for pkg in self.manifest["packages"]:
+            have = installed.get(pkg["name"])
+            if have == pkg["version"]:
+                continue
+            if have is not None and subprocess.run(
+                    ["dpkg", "--compare-versions", pkg["version"], "le", have]).returncode == 0:
+                continue
+            pending.append(os.path.join(self.root, pkg["file"]))
+        return pending
+
+    def install_packages(self):
+        """从包内文件安装系统依赖，不访问软件源"""
+        env = os.environ.copy()
+        env["DEBIAN_FRONTEND"] = "noninteractive"
+        if self.manifest["package_manager"] == "apt":
+            files = self._pending_debs()
+            if not files:
+                log.info("安装包中的系统依赖均已安装")
+                return
+            log.info(f"从安装包安装 {len(files)} 个 .deb...")
+            sudo_run(["apt-get", "install", "-y", "--no-download"] + files, env=env,
+                     stdout=subprocess.DEVNULL, check=True)
+        else:
+            files = [os.path.join(self.root, p["file"]) for p in self.manifest["packages"]]
+            log.info(f"从安装包安装 {len(files)} 个 .rpm...")
+            sudo_run(["yum", "install", "-y", "--disablerepo=*"] + files,
+                     stdout=subprocess.DEVNULL, check=True)
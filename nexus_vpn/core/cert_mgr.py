@@ -10,9 +10,12 @@ from nexus_vpn.utils.sudo import sudo_run, sudo_write_file, sudo_read_file, sudo
 class CertManager:
     PKI_DIR = "/etc/nexus-vpn/pki"
     P12_PASSWORD = os.environ.get("NEXUS_P12_PASSWORD", "nexusvpn")
+    # 用户证书有效期（天）
+    USER_CERT_DAYS = 3650
+    LOCK_RESOURCE = "pki"
     
     @staticmethod
-    def _validate_name(name):
+    def validate_name(name):
         """验证域名或用户名，防止命令注入"""
         if not name or not re.match(r'^[a-zA-Z0-9._-]+$', name):
             raise ValueError(f"无效的名称: {name}")
@@ -20,7 +23,7 @@ class CertManager:
 
     @staticmethod
     def setup_ca(domain):
-        domain = CertManager._validate_name(domain)
+        domain = CertManager.validate_name(domain)
         if os.path.exists(f"{CertManager.PKI_DIR}/ca.crt"):
             return
         
@@ -71,7 +74,7 @@ class CertManager:
             )
             with open(tmp_server_crt, "w") as f:
                 subprocess.run(
-                    ["ipsec", "pki", "--issue", "--lifetime", "3650",
+                    ["ipsec", "pki", "--issue", "--lifetime", str(CertManager.USER_CERT_DAYS),
                      "--cacert", tmp_ca_crt, "--cakey", tmp_ca_key,
                      "--dn", f"CN={domain}", f"--san={domain}",
                      "--flag", "serverAuth", "--flag", "ikeIntermediate", "--outform", "pem"],
@@ -100,7 +103,7 @@ class CertManager:
 
     @staticmethod
     def issue_user_cert(username):
-        username = CertManager._validate_name(username)
+        username = CertManager.validate_name(username)
         user_key = f"{CertManager.PKI_DIR}/private/{username}.key"
         user_crt = f"{CertManager.PKI_DIR}/certs/{username}.crt"
         p12_path = f"{CertManager.PKI_DIR}/certs/{username}.p12"
@@ -142,7 +145,7 @@ class CertManager:
             )
             with open(tmp_user_crt, "w") as f:
                 subprocess.run(
-                    ["ipsec", "pki", "--issue", "--lifetime", "3650",
+                    ["ipsec", "pki", "--issue", "--lifetime", str(CertManager.USER_CERT_DAYS),
                      "--cacert", tmp_ca_crt, "--cakey", tmp_ca_key,
                      "--dn", f"CN={username}", f"--san={username}",
                      "--flag", "clientAuth", "--outform", "pem"],
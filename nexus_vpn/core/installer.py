@@ -1,25 +1,82 @@
 import os
 import json
+import time
+import glob
 import subprocess
 import shutil
 import urllib.request
 import zipfile
 import tempfile
+from rich.table import Table
+from rich.console import Console
 from nexus_vpn.utils.logger import log
+from nexus_vpn.utils.steps import Step, StepFailed, run_steps
+from nexus_vpn.utils.download import fetch_verified, DownloadError
 from nexus_vpn.utils.sudo import sudo_run, sudo_write_file, sudo_read_file, sudo_makedirs, sudo_chmod, sudo_move, sudo_remove
+from nexus_vpn.core.kernel_tuning import (build_profile, render_profile, SYSCTL_PROFILE_PATH,
+                                          MODULES_LOAD_PATH, MODPROBE_PATH)
+from nexus_vpn.core.registry import UserRegistry
+from nexus_vpn.core.nic_tuning import NicTuner
 from nexus_vpn.protocols.ikev2 import IKEv2Manager
+from nexus_vpn.protocols.v2ray import V2RayManager
+
+console = Console()
+
+LEGACY_SYSCTL_CONF = "/etc/sysctl.conf"
+LEGACY_SYSCTL_MARKER = "# NexusVPN settings"
+LEGACY_SYSCTL_KEYS = {"net.ipv4.ip_forward", "net.ipv6.conf.all.forwarding",
+                      "net.core.default_qdisc", "net.ipv4.tcp_congestion_control"}
+
+STEP_STATUS_LABELS = {"ok": "[green]完成[/green]", "failed": "[red]失败[/red]", "skipped": "[dim]未执行[/dim]"}
 
 class Installer:
     XRAY_VERSION = "1.8.4"
     XRAY_RELEASE_API = "https://api.github.com/repos/XTLS/Xray-core/releases/latest"
+    XRAY_DOWNLOAD_BASE = "https://github.com/XTLS/Xray-core/releases/download"
+    XRAY_ASSET = "Xray-linux-64.zip"
+    SHARD_UNIT_PATH = "/etc/systemd/system/nexus-xray@.service"
+    SHARD_NFT_PATH = "/etc/nexus-vpn/xray-shards.nft"
+    SHARD_NFT_TABLE = "nexus_xray"
+    NAT_NFT_PATH = "/etc/nexus-vpn/nat.nft"
+    NAT_NFT_TABLE = "nexus_vpn"
+    # 开机时加载 NAT 规则（在 nftables.service 之后，避免被其 flush ruleset 清掉）
+    NAT_UNIT_PATH = "/etc/systemd/system/nexus-vpn-nat.service"
+    NAT_FLOWTABLE = "ft"
+    CONNTRACK_PROC = "/proc/net/nf_conntrack"
+    # 同时执行的安装步骤数
+    MAX_WORKERS = 4
+    # 为分片监听端口保留的本地端口数
+    MAX_SHARD_PORTS = 256
+    PACKAGES = ["curl", "wget", "openssl", "unzip", "strongswan", "strongswan-pki",
+                "libcharon-extra-plugins", "iptables", "iptables-persistent", "nftables"]
+    # RPM 发行版上的包名：EPEL 的 strongswan 已包含 pki 与插件
+    RPM_PACKAGE_NAMES = {"strongswan-pki": None, "libcharon-extra-plugins": None,
+                         "iptables-persistent": "iptables-services"}
+    APT_LISTS_DIR = "/var/lib/apt/lists"
+    APT_UPDATE_STAMP = "/var/lib/apt/periodic/update-success-stamp"
+    # 软件包索引在此时间内更新过则不再执行 apt-get update（秒）
+    APT_LISTS_MAX_AGE = 24 * 3600
     
     @staticmethod
-    def get_xray_download_url(version):
-        return f"https://github.com/XTLS/Xray-core/releases/download/v{version}/Xray-linux-64.zip"
+    def get_xray_download_url(version, mirror=None):
+        """发布包地址；mirror 为与 GitHub releases/download 目录结构相同的镜像根地址"""
+        base = (mirror or Installer.XRAY_DOWNLOAD_BASE).rstrip("/")
+        return f"{base}/v{version}/{Installer.XRAY_ASSET}"
     
-    def __init__(self, domain, proto, reality_dests):
+    def __init__(self, domain, proto, reality_dests, xray_shards=1, cache_dir=None, mirror=None, bundle=None,
+                 flow_offload=None):
+        """
+        Args:
+            bundle: 已解包的离线安装包（Bundle），指定时不访问网络
+            flow_offload: 是否为转发流量启用 nftables flowtable，None 表示沿用现有部署
+        """
         self.domain = domain
         self.proto = proto
+        self.xray_shards = max(1, int(xray_shards))
+        self.cache_dir = cache_dir
+        self.mirror = mirror
+        self.bundle = bundle
+        self.flow_offload = flow_offload
         # 兼容单个字符串和列表
         if isinstance(reality_dests, str):
             self.reality_dests = [reality_dests]
@@ -35,72 +92,235 @@ class Installer:
         if xray_installed and pki_exists:
             log.info("检测到已有安装，执行增量更新...")
         
-        log.info(">>> 阶段 1: 安装系统依赖...")
-        self.install_dependencies()
-        
-        log.info(">>> 阶段 2: 部署 Xray Core...")
-        self.install_xray()
-        
-        log.info(">>> 阶段 3: 配置网络与 NAT...")
-        self.setup_network()
-
-        log.info(">>> 阶段 4: 初始化 PKI 环境...")
-        # setup_ca 内部已经是幂等的（检查 ca.crt 是否存在）
-        IKEv2Manager.init_pki(self.domain)
+        start = time.perf_counter()
+        try:
+            results = run_steps(self.steps(), Installer.MAX_WORKERS)
+        except StepFailed as e:
+            Installer.print_timings(e.results, time.perf_counter() - start)
+            log.error(str(e))
+            raise e.error
+        Installer.print_timings(results, time.perf_counter() - start)
         
         log.success("基础环境安装完毕。")
 
+    def steps(self):
+        """安装步骤及依赖关系：下载 Xray、安装系统包与写入 sysctl 互不依赖，同时进行"""
+        # 分片模式的服务单元依赖 nftables 包
+        service_after = ["xray_binary"] + (["deps"] if self.xray_shards > 1 else [])
+        return [
+            Step("deps", self.install_dependencies, title="安装系统依赖"),
+            Step("xray_binary", self.install_xray_binary, title="下载 Xray Core"),
+            Step("sysctl", self.setup_sysctl, title="写入内核参数"),
+            Step("xray_service", self.install_xray_service, after=service_after, title="部署 Xray 服务"),
+            Step("nat", self.setup_nat, after=["deps"], title="配置 NAT 转发"),
+            Step("apparmor", self.setup_apparmor, after=["deps"], title="配置 AppArmor"),
+            # setup_ca 内部已经是幂等的（检查 ca.crt 是否存在），需要 strongswan-pki 提供的 ipsec pki
+            Step("pki", lambda: IKEv2Manager.init_pki(self.domain), after=["deps"], title="初始化 PKI 环境"),
+        ]
+
+    @staticmethod
+    def print_timings(results, elapsed):
+        """输出各步骤耗时；总耗时小于各步骤之和的部分即为并发节省的时间"""
+        table = Table(title="⏱️ 安装步骤耗时", show_header=True, header_style="bold cyan")
+        table.add_column("步骤", style="cyan")
+        table.add_column("状态")
+        table.add_column("耗时", justify="right")
+        for r in results:
+            seconds = f"{r['seconds']:.1f} s" if r['seconds'] is not None else "-"
+            table.add_row(r['title'], STEP_STATUS_LABELS[r['status']], seconds)
+        total = sum(r['seconds'] or 0 for r in results)
+        table.caption = f"总耗时 {elapsed:.1f} s（各步骤合计 {total:.1f} s）"
+        console.print(table)
+
+    def packages(self):
+        return list(Installer.PACKAGES)
+
+    @staticmethod
+    def _missing_packages(pkgs, rpm=False):
+        """一次 dpkg-query / rpm -q 查询，返回尚未安装的包（保持原顺序）"""
+        try:
+            if rpm:
+                # 未安装的包输出 "package X is not installed"
+                res = subprocess.run(["rpm", "-q", "--qf", "%{NAME}\n"] + pkgs, capture_output=True, text=True)
+                installed = {line for line in res.stdout.splitlines() if line and " " not in line}
+            else:
+                # 未知包名会让 dpkg-query 返回非零，已知包仍会输出
+                res = subprocess.run(["dpkg-query", "-W", "-f", "${Package}\t${db:Status-Abbrev}\n"] + pkgs,
+                                     capture_output=True, text=True)
+                installed = {line.split("\t")[0] for line in res.stdout.splitlines()
+                             if line.split("\t")[-1].startswith("ii")}
+        except OSError:
+            installed = set()
+        return [p for p in pkgs if p not in installed]
+
+    @staticmethod
+    def _apt_lists_fresh():
+        """软件包索引是否在 APT_LISTS_MAX_AGE 内更新过"""
+        stamps = glob.glob(os.path.join(Installer.APT_LISTS_DIR, "*Release")) + [Installer.APT_UPDATE_STAMP]
+        mtimes = [os.path.getmtime(p) for p in stamps if os.path.exists(p)]
+        return bool(mtimes) and time.time() - max(mtimes) < Installer.APT_LISTS_MAX_AGE
+
+    @staticmethod
+    def rpm_packages(pkgs):
+        """换成 RPM 发行版上的包名；strongswan 来自 EPEL，epel-release 排在最前"""
+        names = (Installer.RPM_PACKAGE_NAMES.get(p, p) for p in pkgs)
+        return ["epel-release"] + [n for n in names if n]
+
     def install_dependencies(self):
-        pkgs = ["curl", "wget", "openssl", "unzip", "strongswan", "strongswan-pki",
-                "libcharon-extra-plugins", "iptables", "iptables-persistent"]
+        if self.bundle:
+            self.bundle.install_packages()
+            return
+        pkgs = self.packages()
         
         env = os.environ.copy()
         env["DEBIAN_FRONTEND"] = "noninteractive"
         
         try:
             if shutil.which("apt-get"):
-                sudo_run(["apt-get", "update", "-y"], env=env, 
-                         stdout=subprocess.DEVNULL, check=True)
-                sudo_run(["apt-get", "install", "-y"] + pkgs, env=env,
-                         stdout=subprocess.DEVNULL, check=True)
+                missing = Installer._missing_packages(pkgs)
+                if not missing:
+                    log.info("系统依赖均已安装，跳过")
+                    return
+                fresh = Installer._apt_lists_fresh()
+                if not fresh:
+                    sudo_run(["apt-get", "update", "-y"], env=env, 
+                             stdout=subprocess.DEVNULL, check=True)
+                try:
+                    sudo_run(["apt-get", "install", "-y"] + missing, env=env,
+                             stdout=subprocess.DEVNULL, check=True)
+                except subprocess.CalledProcessError:
+                    if not fresh:
+                        raise
+                    # 索引虽在有效期内，但可能已不包含所需版本
+                    log.info("安装失败，更新软件包索引后重试")
+                    sudo_run(["apt-get", "update", "-y"], env=env,
+                             stdout=subprocess.DEVNULL, check=True)
+                    sudo_run(["apt-get", "install", "-y"] + missing, env=env,
+                             stdout=subprocess.DEVNULL, check=True)
             elif shutil.which("yum"):
-                sudo_run(["yum", "install", "-y", "epel-release"],
-                         stdout=subprocess.DEVNULL, check=True)
-                sudo_run(["yum", "install", "-y"] + pkgs,
-                         stdout=subprocess.DEVNULL, check=True)
+                missing = Installer._missing_packages(Installer.rpm_packages(pkgs), rpm=True)
+                if not missing:
+                    log.info("系统依赖均已安装，跳过")
+                    return
+                if "epel-release" in missing:
+                    missing.remove("epel-release")
+                    sudo_run(["yum", "install", "-y", "epel-release"],
+                             stdout=subprocess.DEVNULL, check=True)
+                if missing:
+                    sudo_run(["yum", "install", "-y"] + missing,
+                             stdout=subprocess.DEVNULL, check=True)
         except subprocess.CalledProcessError as e:
             log.warning(f"依赖安装可能有警告: {e}")
 
     def install_xray(self):
-        bin_path = "/usr/local/bin/xray"
-        if not os.path.exists(bin_path):
-            Installer._download_and_install_xray(Installer.XRAY_VERSION)
+        self.install_xray_binary()
+        self.install_xray_service()
+
+    def install_xray_binary(self):
+        if os.path.exists("/usr/local/bin/xray"):
+            return
+        if self.bundle:
+            Installer._install_xray_zip(self.bundle.xray_zip, self.bundle.xray_version)
+        else:
+            Installer._download_and_install_xray(Installer.XRAY_VERSION, self.cache_dir, self.mirror)
+
+    def install_xray_service(self):
+        if self.xray_shards > 1:
+            self._install_xray_shards()
+            return
         
-        svc = """[Unit]
+        svc = f"""[Unit]
 Description=Xray Service
 After=network.target
 [Service]
 User=root
-ExecStart=/usr/local/bin/xray run -config /usr/local/etc/xray/config.json
+ExecStart=/usr/local/bin/xray run -confdir {V2RayManager.confdir()}
 Restart=on-failure
 [Install]
 WantedBy=multi-user.target
 """
         sudo_write_file("/etc/systemd/system/nexus-xray.service", svc)
+        Installer._remove_xray_shards()
         sudo_run(["systemctl", "daemon-reload"], check=True)
         sudo_run(["systemctl", "enable", "nexus-xray"], check=True)
 
     @staticmethod
-    def _download_and_install_xray(version):
-        """下载并安装指定版本的 Xray"""
-        bin_path = "/usr/local/bin/xray"
-        url = Installer.get_xray_download_url(version)
+    def render_shard_ruleset(shards, public_port=443, base_port=V2RayManager.SHARD_BASE_PORT):
+        """生成把公网端口的新连接轮询分发到各 Xray 分片的 nftables 规则"""
+        table = Installer.SHARD_NFT_TABLE
+        port_map = ", ".join(f"{i} : {base_port + i}" for i in range(shards))
+        return f"""# 由 nexus-vpn 生成，请勿手工修改
+table inet {table}
+delete table inet {table}
+table inet {table} {{
+    chain prerouting {{
+        type nat hook prerouting priority dstnat; policy accept;
+        tcp dport {public_port} fib daddr type local redirect to :numgen inc mod {shards} map {{ {port_map} }}
+    }}
+}}
+"""
+
+    def _install_xray_shards(self):
+        """部署 N 个 Xray 实例（nexus-xray@0..N-1），由 nftables 轮询分流 443 端口"""
+        shards = self.xray_shards
+        sudo_makedirs(os.path.dirname(Installer.SHARD_NFT_PATH))
+        sudo_write_file(Installer.SHARD_NFT_PATH, Installer.render_shard_ruleset(shards))
+        
+        # 每个实例启动前都重新加载一次分流规则（规则文件自带 delete table，可重复执行）
+        svc = f"""[Unit]
+Description=Xray Service (shard %i)
+After=network.target
+[Service]
+User=root
+ExecStartPre=-/usr/sbin/nft -f {Installer.SHARD_NFT_PATH}
+ExecStart=/usr/local/bin/xray run -confdir {V2RayManager.shards_dir()}/%i
+Restart=on-failure
+[Install]
+WantedBy=multi-user.target
+"""
+        sudo_write_file(Installer.SHARD_UNIT_PATH, svc)
+        sudo_run(["systemctl", "daemon-reload"], check=True)
+        sudo_run(["systemctl", "disable", "--now", "nexus-xray"], stderr=subprocess.DEVNULL)
+        Installer._disable_xray_shards(keep=shards)
+        sudo_run(["systemctl", "enable"] + [f"nexus-xray@{i}" for i in range(shards)], check=True)
+        log.info(f"已配置 {shards} 个 Xray 实例，端口 {V2RayManager.SHARD_BASE_PORT}-"
+                 f"{V2RayManager.SHARD_BASE_PORT + shards - 1}")
+
+    @staticmethod
+    def _disable_xray_shards(keep=0):
+        """停用编号 >= keep 的分片实例"""
+        pattern = "/etc/systemd/system/multi-user.target.wants/nexus-xray@*.service"
+        for path in glob.glob(pattern):
+            index = os.path.basename(path)[len("nexus-xray@"):-len(".service")]
+            if index.isdigit() and int(index) >= keep:
+                sudo_run(["systemctl", "disable", "--now", f"nexus-xray@{index}"],
+                         stderr=subprocess.DEVNULL)
+
+    @staticmethod
+    def _remove_xray_shards():
+        """从分片模式切回单实例时清理分片单元和分流规则"""
+        if not os.path.exists(Installer.SHARD_UNIT_PATH):
+            return
+        Installer._disable_xray_shards()
+        sudo_run(["nft", "delete", "table", "inet", Installer.SHARD_NFT_TABLE],
+                 stderr=subprocess.DEVNULL)
+        for path in (Installer.SHARD_UNIT_PATH, Installer.SHARD_NFT_PATH, V2RayManager.shards_dir()):
+            sudo_remove(path)
+
+    @staticmethod
+    def _download_and_install_xray(version, cache_dir=None, mirror=None):
+        """下载（命中缓存时跳过）、校验并安装指定版本的 Xray"""
+        url = Installer.get_xray_download_url(version, mirror)
         
+        log.info(f"下载 Xray v{version}...")
+        # 与发布包同目录的 .dgst 文件给出 SHA-256
+        Installer._install_xray_zip(fetch_verified(url, cache_dir=cache_dir), version)
+
+    @staticmethod
+    def _install_xray_zip(zip_path, version):
+        """从发布包解压安装 Xray，旧版本备份为 xray.bak"""
+        bin_path = "/usr/local/bin/xray"
         with tempfile.TemporaryDirectory() as tmp:
-            zip_path = os.path.join(tmp, "xray.zip")
-            log.info(f"下载 Xray v{version}...")
-            urllib.request.urlretrieve(url, zip_path)
-            
             with zipfile.ZipFile(zip_path, 'r') as z:
                 z.extractall(tmp)
             
@@ -151,7 +371,7 @@ WantedBy=multi-user.target
             return None
 
     @staticmethod
-    def update_xray(target_version=None):
+    def update_xray(target_version=None, cache_dir=None, mirror=None):
         """更新 Xray Core"""
         current = Installer._get_current_xray_version()
         log.info(f"当前 Xray 版本: {current or '未安装'}")
@@ -168,13 +388,20 @@ WantedBy=multi-user.target
             log.info("已是最新版本，无需更新")
             return
         
-        # 停止服务
-        sudo_run(["systemctl", "stop", "nexus-xray"], stderr=subprocess.DEVNULL)
+        # 先下载并校验到缓存，失败时不中断服务
+        try:
+            fetch_verified(Installer.get_xray_download_url(target_version, mirror), cache_dir=cache_dir)
+        except DownloadError as e:
+            log.error(f"下载失败: {e}")
+            return
+        
+        # 分片模式下由 nexus-xray@N 承载，单实例单元与分片 0 共用 API 端口，不能启动
+        units = Installer._xray_units()
+        sudo_run(["systemctl", "stop"] + [unit for unit, _ in units], stderr=subprocess.DEVNULL)
         
         try:
-            Installer._download_and_install_xray(target_version)
-            # 重启服务
-            sudo_run(["systemctl", "start", "nexus-xray"], check=True)
+            Installer._download_and_install_xray(target_version, cache_dir, mirror)
+            Installer._start_xray_units(units)
             log.success(f"Xray 已从 {current} 更新到 {target_version}")
         except Exception as e:
             log.error(f"更新失败: {e}")
@@ -182,9 +409,25 @@ WantedBy=multi-user.target
             bin_path = "/usr/local/bin/xray"
             if os.path.exists(f"{bin_path}.bak"):
                 sudo_move(f"{bin_path}.bak", bin_path)
-                sudo_run(["systemctl", "start", "nexus-xray"], stderr=subprocess.DEVNULL)
+                sudo_run(["systemctl", "restart"] + [unit for unit, _ in units], stderr=subprocess.DEVNULL)
                 log.warning("已恢复到旧版本")
 
+    @staticmethod
+    def _xray_units():
+        """[(单元, VLESS 端口)]，未部署配置时端口为 None"""
+        if not V2RayManager.config_exists():
+            return [("nexus-xray", None)]
+        cfg = V2RayManager._load_base()
+        return list(zip(V2RayManager.service_units(cfg), V2RayManager._listen_ports(cfg)))
+
+    @staticmethod
+    def _start_xray_units(units):
+        """逐个启动并做健康检查，失败时抛出 RuntimeError"""
+        for unit, port in units:
+            sudo_run(["systemctl", "start", unit], check=True)
+            if port is not None and not V2RayManager._healthy(unit, port):
+                raise RuntimeError(f"{unit} 启动后端口 {port} 未就绪")
+
     @staticmethod
     def update_strongswan():
         """更新 StrongSwan 到最新版本"""
@@ -221,76 +464,230 @@ WantedBy=multi-user.target
             log.error(f"更新失败: {e}")
 
     def setup_network(self):
-        # 1. Sysctl - 幂等写入
-        sysctl_settings = {
-            "net.ipv4.ip_forward": "1",
-            "net.ipv6.conf.all.forwarding": "1",
-            "net.core.default_qdisc": "fq",
-            "net.ipv4.tcp_congestion_control": "bbr"
-        }
-        sysctl_path = "/etc/sysctl.conf"
-        
-        # 读取现有配置
-        existing_lines = []
-        if os.path.exists(sysctl_path):
-            try:
-                content = sudo_read_file(sysctl_path)
-                existing_lines = content.splitlines(keepends=True)
-            except Exception:
-                pass
-        
-        # 过滤掉我们要设置的项（避免重复）
-        filtered_lines = []
-        for line in existing_lines:
+        self.setup_sysctl()
+        self.setup_nat()
+        self.setup_apparmor()
+
+    @staticmethod
+    def _remove_legacy_sysctl(path=LEGACY_SYSCTL_CONF):
+        """删除旧版本追加到 /etc/sysctl.conf 的设置（该文件最后加载，会覆盖 sysctl.d 中的档位）"""
+        if not os.path.exists(path):
+            return
+        try:
+            lines = sudo_read_file(path).splitlines(keepends=True)
+        except Exception:
+            return
+        kept = []
+        in_block = False
+        for line in lines:
+            if line.strip() == LEGACY_SYSCTL_MARKER:
+                in_block = True
+                continue
             key = line.split("=")[0].strip()
-            if key not in sysctl_settings:
-                filtered_lines.append(line)
+            if in_block and key in LEGACY_SYSCTL_KEYS:
+                continue
+            in_block = in_block and not line.strip()
+            kept.append(line)
+        if kept != lines:
+            sudo_write_file(path, "".join(kept).rstrip("\n") + "\n" if kept else "")
+
+    def setup_sysctl(self):
+        # 保留 Xray 分片监听端口，避免被出站连接占用
+        base = V2RayManager.SHARD_BASE_PORT
+        profile = build_profile(reserved_ports=f"{base}-{base + Installer.MAX_SHARD_PORTS - 1}")
         
-        # 追加新配置
-        new_content = "".join(filtered_lines)
-        new_content += "\n# NexusVPN settings\n"
-        for key, value in sysctl_settings.items():
-            new_content += f"{key}={value}\n"
+        sudo_write_file(MODULES_LOAD_PATH, "nf_conntrack\n")
+        sudo_write_file(MODPROBE_PATH,
+                        f"options nf_conntrack hashsize={profile['net.netfilter.nf_conntrack_buckets']}\n")
+        sudo_run(["modprobe", "nf_conntrack"], stderr=subprocess.DEVNULL)
         
-        sudo_write_file(sysctl_path, new_content)
-        sudo_run(["sysctl", "-p"], stdout=subprocess.DEVNULL, check=True)
+        sudo_write_file(SYSCTL_PROFILE_PATH, render_profile(profile))
+        Installer._remove_legacy_sysctl()
+        # 个别键在旧内核上不可写或不存在，不影响其余设置生效；偏离项由 status 报告
+        result = sudo_run(["sysctl", "-e", "-p", SYSCTL_PROFILE_PATH],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            log.warning(f"部分内核参数未生效: {(result.stderr or '').strip()}")
 
-        # 2. IPTables NAT
+    @staticmethod
+    def _default_iface():
+        """默认路由所在的网卡"""
+        result = subprocess.run(["ip", "route", "show", "default"], capture_output=True, text=True, check=True)
+        parts = result.stdout.split()
+        for i, p in enumerate(parts):
+            if p == "dev" and i + 1 < len(parts):
+                return parts[i + 1]
+        return None
+
+    @staticmethod
+    def _iface_address(iface, family=4):
+        """网卡上的第一个全局地址，没有时返回 None"""
+        result = subprocess.run(["ip", f"-{family}", "-o", "addr", "show", "dev", iface, "scope", "global"],
+                                capture_output=True, text=True)
+        parts = result.stdout.split()
+        key = "inet" if family == 4 else "inet6"
+        for i, p in enumerate(parts):
+            if p == key and i + 1 < len(parts):
+                return parts[i + 1].split("/")[0]
+        return None
+
+    @staticmethod
+    def render_nat_ruleset(iface, address=None, address6=None, flowtable=False,
+                           subnet=IKEv2Manager.CLIENT_SUBNET, subnet6=IKEv2Manager.CLIENT_SUBNET6):
+        """生成 IKEv2 客户端出网的 NAT 与转发规则
+
+        源地址固定时用 SNAT，省去 MASQUERADE 每个连接查询出口地址；
+        未检测到地址时回退为 masquerade。没有全局 IPv6 地址时不转换 IPv6。
+        flowtable 为 True 时，已建立的 TCP/UDP 连接加入出口网卡上的 flowtable，
+        后续报文在 ingress 直接转发，不再经过完整的 netfilter 路径。
+        """
+        table = Installer.NAT_NFT_TABLE
+        ft = Installer.NAT_FLOWTABLE
+        snat = f"snat ip to {address}" if address else "masquerade"
+        v6_nat = (f"\n        ip6 saddr {subnet6} oifname \"{iface}\" snat ip6 to {address6}"
+                  if address6 else "")
+        v6_fwd = (f"\n        ip6 saddr {subnet6} oifname \"{iface}\" accept"
+                  f"\n        ip6 daddr {subnet6} iifname \"{iface}\" drop" if address6 else "")
+        flow_decl = flow_rules = ""
+        if flowtable:
+            flow_decl = f"""
+    flowtable {ft} {{
+        hook ingress priority 0; devices = {{ "{iface}" }};
+    }}"""
+            flow_rules = f"\n        ip saddr {subnet} meta l4proto {{ tcp, udp }} flow add @{ft}"
+            if address6:
+                flow_rules += f"\n        ip6 saddr {subnet6} meta l4proto {{ tcp, udp }} flow add @{ft}"
+        return f"""# 由 nexus-vpn 生成，请勿手工修改
+table inet {table}
+delete table inet {table}
+table inet {table} {{{flow_decl}
+    chain forward {{
+        type filter hook forward priority filter; policy accept;{flow_rules}
+        ct state established,related accept
+        ip saddr {subnet} oifname "{iface}" accept
+        ip daddr {subnet} iifname "{iface}" drop{v6_fwd}
+    }}
+    chain postrouting {{
+        type nat hook postrouting priority srcnat; policy accept;
+        ip saddr {subnet} oifname "{iface}" {snat}{v6_nat}
+    }}
+}}
+"""
+
+    @staticmethod
+    def _flowtable_configured():
+        """现有 NAT 规则文件是否启用了 flowtable"""
         try:
-            result = subprocess.run(
-                ["ip", "route", "show", "default"],
-                capture_output=True, text=True, check=True
-            )
-            # 解析默认网卡
-            parts = result.stdout.split()
-            iface = None
-            for i, p in enumerate(parts):
-                if p == "dev" and i + 1 < len(parts):
-                    iface = parts[i + 1]
-                    break
+            with open(Installer.NAT_NFT_PATH) as f:
+                return f"flowtable {Installer.NAT_FLOWTABLE} " in f.read()
+        except OSError:
+            return False
+
+    @staticmethod
+    def _load_nat_ruleset(ruleset):
+        sudo_write_file(Installer.NAT_NFT_PATH, ruleset)
+        try:
+            sudo_run(["nft", "-f", Installer.NAT_NFT_PATH], capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError as e:
+            return (e.stderr or str(e)).strip()
+        return None
+
+    @staticmethod
+    def _setup_nft_nat(iface, flowtable=False):
+        """写入并加载 NAT 规则文件（nft -f 整体生效，可重复执行），失败时返回 False"""
+        address = Installer._iface_address(iface)
+        address6 = Installer._iface_address(iface, 6)
+        sudo_makedirs(os.path.dirname(Installer.NAT_NFT_PATH))
+        error = Installer._load_nat_ruleset(Installer.render_nat_ruleset(iface, address, address6, flowtable))
+        if error and flowtable:
+            # 加载失败时规则整体不生效，去掉 flowtable 再试一次
+            log.warning(f"内核不支持 flowtable，不启用转发快速路径: {error}")
+            flowtable = False
+            error = Installer._load_nat_ruleset(Installer.render_nat_ruleset(iface, address, address6))
+        if error:
+            log.warning(f"加载 nftables 规则失败，改用 iptables: {error}")
+            return False
+        
+        svc = f"""[Unit]
+Description=Nexus-VPN NAT rules
+After=network.target nftables.service
+[Service]
+Type=oneshot
+RemainAfterExit=yes
+ExecStart=/usr/sbin/nft -f {Installer.NAT_NFT_PATH}
+ExecStop=-/usr/sbin/nft delete table inet {Installer.NAT_NFT_TABLE}
+[Install]
+WantedBy=multi-user.target
+"""
+        sudo_write_file(Installer.NAT_UNIT_PATH, svc)
+        sudo_run(["systemctl", "daemon-reload"], check=True)
+        sudo_run(["systemctl", "enable", "nexus-vpn-nat"], stderr=subprocess.DEVNULL)
+        # 清理旧版本添加的 iptables 规则
+        Installer._delete_iptables_nat(iface)
+        log.info(f"NAT 转发规则已加载（nftables，{iface} → {address or 'masquerade'}"
+                 f"{'，flowtable 快速路径' if flowtable else ''}）")
+        return True
+
+    @staticmethod
+    def flow_offload_status():
+        """flowtable 是否生效及当前被卸载到快速路径的连接数
+
+        Returns:
+            dict: {"configured": bool, "active": bool, "flows": int 或 None（无法读取连接跟踪表）}
+        """
+        status = {"configured": Installer._flowtable_configured(), "active": False, "flows": None}
+        if not status["configured"]:
+            return status
+        res = sudo_run(["nft", "list", "flowtable", "inet", Installer.NAT_NFT_TABLE, Installer.NAT_FLOWTABLE],
+                       capture_output=True, text=True)
+        status["active"] = res.returncode == 0
+        if status["active"]:
+            if shutil.which("conntrack"):
+                res = sudo_run(["conntrack", "-L"], capture_output=True, text=True)
+            else:
+                res = sudo_run(["cat", Installer.CONNTRACK_PROC], capture_output=True, text=True)
+            if res.returncode == 0:
+                # 软件卸载为 [OFFLOAD]，网卡硬件卸载为 [HW_OFFLOAD]
+                status["flows"] = sum(1 for line in res.stdout.splitlines() if "OFFLOAD]" in line)
+        return status
+
+    @staticmethod
+    def _delete_iptables_nat(iface):
+        sudo_run(
+            ["iptables", "-t", "nat", "-D", "POSTROUTING",
+             "-s", IKEv2Manager.CLIENT_SUBNET, "-o", iface, "-j", "MASQUERADE"],
+            stderr=subprocess.DEVNULL
+        )
+
+    def setup_nat(self):
+        try:
+            iface = Installer._default_iface()
+            if not iface:
+                return
+            flowtable = self.flow_offload
+            if flowtable is None:
+                flowtable = Installer._flowtable_configured()
+            if shutil.which("nft") and Installer._setup_nft_nat(iface, flowtable):
+                return
             
-            if iface:
-                # 清理旧规则（忽略错误）
-                sudo_run(
-                    ["iptables", "-t", "nat", "-D", "POSTROUTING",
-                     "-s", "10.10.10.0/24", "-o", iface, "-j", "MASQUERADE"],
-                    stderr=subprocess.DEVNULL
-                )
-                # 添加新规则
-                sudo_run(
-                    ["iptables", "-t", "nat", "-A", "POSTROUTING",
-                     "-s", "10.10.10.0/24", "-o", iface, "-j", "MASQUERADE"],
-                    check=True
-                )
-                # 保存规则
-                if shutil.which("netfilter-persistent"):
-                    sudo_run(["netfilter-persistent", "save"],
-                             stderr=subprocess.DEVNULL)
-                log.info(f"NAT 转发规则已添加至网卡: {iface}")
+            # 回退到 iptables
+            sudo_run(["nft", "delete", "table", "inet", Installer.NAT_NFT_TABLE],
+                     stderr=subprocess.DEVNULL)
+            Installer._delete_iptables_nat(iface)
+            sudo_run(
+                ["iptables", "-t", "nat", "-A", "POSTROUTING",
+                 "-s", IKEv2Manager.CLIENT_SUBNET, "-o", iface, "-j", "MASQUERADE"],
+                check=True
+            )
+            # 保存规则
+            if shutil.which("netfilter-persistent"):
+                sudo_run(["netfilter-persistent", "save"],
+                         stderr=subprocess.DEVNULL)
+            log.info(f"NAT 转发规则已添加至网卡: {iface}")
         except subprocess.CalledProcessError as e:
             log.warning(f"NAT 规则配置失败: {e}")
 
-        # 3. AppArmor
+    def setup_apparmor(self):
         if shutil.which("aa-complain"):
             sudo_run(["aa-complain", "/usr/lib/ipsec/charon"],
                      stderr=subprocess.DEVNULL)
@@ -299,16 +696,28 @@ WantedBy=multi-user.target
 
     @staticmethod
     def cleanup():
-        sudo_run(["systemctl", "stop", "nexus-xray", "strongswan-starter", "strongswan"],
+        sudo_run(["systemctl", "stop", "nexus-xray", "nexus-xray@*", "strongswan-starter", "strongswan"],
                  stderr=subprocess.DEVNULL)
+        sudo_run(["systemctl", "disable", "--now", "nexus-vpn-nat"], stderr=subprocess.DEVNULL)
+        sudo_run(["systemctl", "disable", NicTuner.SERVICE_NAME], stderr=subprocess.DEVNULL)
+        for table in (Installer.SHARD_NFT_TABLE, Installer.NAT_NFT_TABLE):
+            sudo_run(["nft", "delete", "table", "inet", table], stderr=subprocess.DEVNULL)
         
         paths_to_remove = [
             "/usr/local/bin/xray",
             "/usr/local/etc/xray",
             "/etc/nexus-vpn",
+            os.path.dirname(UserRegistry.DB_PATH),
             "/etc/ipsec.conf",
             "/etc/ipsec.secrets",
-            "/etc/systemd/system/nexus-xray.service"
+            "/etc/systemd/system/nexus-xray.service",
+            Installer.SHARD_UNIT_PATH,
+            Installer.NAT_UNIT_PATH,
+            NicTuner.SERVICE_PATH,
+            # 内核参数档位与模块配置，否则卸载后每次开机仍会应用
+            SYSCTL_PROFILE_PATH,
+            MODULES_LOAD_PATH,
+            MODPROBE_PATH
         ]
         for path in paths_to_remove:
             sudo_remove(path)
@@ -0,0 +1,129 @@
+"""内核网络参数档位
+
+按物理内存与 CPU 核数生成 /etc/sysctl.d/90-nexus-vpn.conf：套接字缓冲上限随内存增长，
+收包队列与监听队列随核数增长，连接跟踪表按内存的固定比例分配（每条约 300 字节），
+本地端口范围扩大并保留 Xray 分片监听端口。status 用 drift() 比较档位与 /proc/sys 中的实际值。
+"""
+import os
+from nexus_vpn.utils.host import total_memory_bytes, cpu_count
+
+SYSCTL_PROFILE_PATH = "/etc/sysctl.d/90-nexus-vpn.conf"
+PROC_SYS = "/proc/sys"
+# 开机时先加载 nf_conntrack，sysctl.d 中的 net.netfilter.* 才能生效
+MODULES_LOAD_PATH = "/etc/modules-load.d/nexus-vpn.conf"
+MODPROBE_PATH = "/etc/modprobe.d/nexus-vpn.conf"
+
+MB = 1 << 20
+# 连接跟踪表最多占用内存的比例（每条约 300 字节，1/16384 约为 2%）
+CONNTRACK_MEM_DIVISOR = 16384
+CONNTRACK_MAX = (65536, 2097152)
+# 内核把哈希桶数向上取整到一页能容纳的桶头数（4096 / 8），按同样规则取整，status 才不会报告漂移
+CONNTRACK_BUCKET_ALIGN = 512
+SOCKET_BUFFER_MAX = (4 * MB, 64 * MB)
+PORT_RANGE = "10240 65535"
+
+
+def _clamp(value, low, high):
+    return int(max(low, min(high, value)))
+
+
+def build_profile(mem_bytes=None, cpus=None, reserved_ports=None):
+    """生成档位
+
+    Args:
+        reserved_ports: 不参与本地端口分配的端口（ip_local_reserved_ports 格式）
+
+    Returns:
+        dict: sysctl 键 -> 值（字符串），按写入顺序
+    """
+    if mem_bytes is None:
+        mem_bytes = total_memory_bytes()
+    if cpus is None:
+        cpus = cpu_count()
+    cpus = max(1, cpus)
+
+    buffer_max = _clamp(mem_bytes / 256, *SOCKET_BUFFER_MAX)
+    backlog = _clamp(2048 * cpus, 4096, 65536)
+    listen = _clamp(1024 * cpus, 4096, 65535)
+    conntrack = _clamp(mem_bytes / CONNTRACK_MEM_DIVISOR, *CONNTRACK_MAX)
+    buckets = -(-conntrack // 4 // CONNTRACK_BUCKET_ALIGN) * CONNTRACK_BUCKET_ALIGN
+
+    profile = {
+        "net.ipv4.ip_forward": "1",
+        "net.ipv6.conf.all.forwarding": "1",
+        "net.core.default_qdisc": "fq",
+        "net.ipv4.tcp_congestion_control": "bbr",
+        "net.core.rmem_max": str(buffer_max),
+        "net.core.wmem_max": str(buffer_max),
+        "net.ipv4.tcp_rmem": f"4096 131072 {buffer_max}",
+        "net.ipv4.tcp_wmem": f"4096 65536 {buffer_max}",
+        "net.core.netdev_max_backlog": str(backlog),
+        "net.core.somaxconn": str(listen),
+        "net.ipv4.tcp_max_syn_backlog": str(listen),
+        # 客户端与服务端都启用 TFO
+        "net.ipv4.tcp_fastopen": "3",
+        "net.netfilter.nf_conntrack_max": str(conntrack),
+        "net.netfilter.nf_conntrack_buckets": str(buckets),
+        "net.ipv4.ip_local_port_range": PORT_RANGE,
+        "net.ipv4.tcp_tw_reuse": "1",
+    }
+    if reserved_ports:
+        profile["net.ipv4.ip_local_reserved_ports"] = reserved_ports
+    return profile
+
+
+def render_profile(profile, mem_bytes=None, cpus=None):
+    if mem_bytes is None:
+        mem_bytes = total_memory_bytes()
+    if cpus is None:
+        cpus = cpu_count()
+    lines = ["# 由 nexus-vpn 生成，请勿手工修改（重新运行 install 会覆盖）",
+             f"# 按 {mem_bytes // MB} MB 内存、{cpus} 核计算"]
+    lines += [f"{key} = {value}" for key, value in profile.items()]
+    return "\n".join(lines) + "\n"
+
+
+def parse_profile(text):
+    profile = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith(("#", ";")) or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        profile[key.strip()] = value.strip()
+    return profile
+
+
+def load_profile(path=None):
+    """读取已部署的档位，不存在时返回 None"""
+    try:
+        with open(path or SYSCTL_PROFILE_PATH) as f:
+            return parse_profile(f.read())
+    except OSError:
+        return None
+
+
+def read_live(keys, root=PROC_SYS):
+    """读取当前内核值，无法读取（如模块未加载）的键为 None"""
+    live = {}
+    for key in keys:
+        try:
+            with open(os.path.join(root, *key.split("."))) as f:
+                live[key] = f.read().strip()
+        except OSError:
+            live[key] = None
+    return live
+
+
+def _normalize(value):
+    return " ".join(value.split()) if value is not None else None
+
+
+def drift(profile, live):
+    """档位与实际值不一致的项
+
+    Returns:
+        list: [(键, 期望值, 实际值或 None)]
+    """
+    return [(key, value, live.get(key)) for key, value in profile.items()
+            if _normalize(live.get(key)) != _normalize(value)]
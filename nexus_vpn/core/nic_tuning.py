@@ -0,0 +1,265 @@
+"""网卡多队列与软中断分布调优
+
+虚拟机网卡常只有一个队列或所有中断都落在 CPU0，收包软中断（含 ESP 解密后的转发）
+集中在单核上。NicTuner 从 sysfs 读取默认路由网卡的队列与中断，按在线 CPU：
+
+- 用 ethtool -L 把 combined 队列数提高到 min(硬件上限, CPU 数)
+- 队列中断的亲和性按 CPU 轮询分配
+- 队列数少于 CPU 数时为每个接收队列设置 RPS（并启用 RFS），否则关闭 RPS
+- 发送队列 i 的 XPS 为满足 cpu % 队列数 == i 的 CPU
+
+sysfs / procfs 根目录可替换，测试使用假的目录树。
+"""
+import os
+import re
+import sys
+import shutil
+import subprocess
+from rich.table import Table
+from rich.console import Console
+from nexus_vpn.utils.logger import log
+from nexus_vpn.utils.sudo import sudo_run, sudo_write_file
+
+console = Console()
+
+# RFS 全局流表大小，按接收队列平分
+RPS_SOCK_FLOW_ENTRIES = 32768
+COMBINED_RE = re.compile(r"^Combined:\s*(\d+)", re.MULTILINE)
+
+
+def parse_cpu_list(text):
+    """"0-3,6" -> [0, 1, 2, 3, 6]"""
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        low, _, high = part.partition("-")
+        cpus.extend(range(int(low), int(high or low) + 1))
+    return cpus
+
+
+def cpu_mask(cpus):
+    """CPU 列表 -> sysfs 掩码（十六进制，每 32 个 CPU 用逗号分组）"""
+    value = 0
+    for cpu in cpus:
+        value |= 1 << cpu
+    digits = f"{value:x}"
+    digits = digits.zfill((len(digits) + 7) // 8 * 8)
+    return ",".join(digits[i:i + 8] for i in range(0, len(digits), 8))
+
+
+def mask_cpus(mask):
+    """sysfs 掩码 -> CPU 列表"""
+    value = int(mask.replace(",", "").strip() or "0", 16)
+    return [cpu for cpu in range(value.bit_length()) if value >> cpu & 1]
+
+
+class NicTuner:
+    SERVICE_PATH = "/etc/systemd/system/nexus-vpn-nic.service"
+    SERVICE_NAME = "nexus-vpn-nic"
+
+    def __init__(self, iface, sysfs_root="/sys", proc_root="/proc"):
+        self.iface = iface
+        self.sysfs_root = sysfs_root
+        self.proc_root = proc_root
+
+    def _net(self, *parts):
+        return os.path.join(self.sysfs_root, "class", "net", self.iface, *parts)
+
+    def _proc(self, *parts):
+        return os.path.join(self.proc_root, *parts)
+
+    @staticmethod
+    def _read(path, default=None):
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except OSError:
+            return default
+
+    def exists(self):
+        return os.path.isdir(self._net())
+
+    def online_cpus(self):
+        text = self._read(os.path.join(self.sysfs_root, "devices", "system", "cpu", "online"))
+        return parse_cpu_list(text) if text else list(range(os.cpu_count() or 1))
+
+    def queues(self, kind):
+        """rx 或 tx 队列编号"""
+        try:
+            names = os.listdir(self._net("queues"))
+        except OSError:
+            return []
+        prefix = f"{kind}-"
+        return sorted(int(n[len(prefix):]) for n in names if n.startswith(prefix) and n[len(prefix):].isdigit())
+
+    def irqs(self):
+        """网卡（或 virtio 设备所在 PCI 设备）的 MSI 中断号"""
+        device = self._net("device")
+        for path in (os.path.join(device, "msi_irqs"), os.path.join(os.path.realpath(device), "..", "msi_irqs")):
+            try:
+                return sorted(int(n) for n in os.listdir(path) if n.isdigit())
+            except OSError:
+                continue
+        return []
+
+    def channels(self):
+        """(硬件上限, 当前值)，网卡不支持或没有 ethtool 时返回 None"""
+        if not shutil.which("ethtool"):
+            return None
+        res = subprocess.run(["ethtool", "-l", self.iface], capture_output=True, text=True)
+        values = [int(v) for v in COMBINED_RE.findall(res.stdout)] if res.returncode == 0 else []
+        if len(values) < 2 or not values[0]:
+            return None
+        return values[0], values[1]
+
+    def softirq_net_rx(self):
+        """每个 CPU 累计的 NET_RX 软中断次数"""
+        text = self._read(self._proc("softirqs"), "")
+        for line in text.splitlines():
+            name, _, counts = line.strip().partition(":")
+            if name == "NET_RX":
+                return [int(c) for c in counts.split()]
+        return []
+
+    def snapshot(self):
+        """当前的队列、掩码与中断亲和性"""
+        return {
+            "cpus": self.online_cpus(),
+            "channels": self.channels(),
+            "rps": {q: self._read(self._net("queues", f"rx-{q}", "rps_cpus"), "0") for q in self.queues("rx")},
+            "xps": {q: self._read(self._net("queues", f"tx-{q}", "xps_cpus"), "0") for q in self.queues("tx")},
+            "irqs": {irq: self._read(self._proc("irq", str(irq), "smp_affinity_list"), "")
+                     for irq in self.irqs()},
+            "net_rx": self.softirq_net_rx(),
+        }
+
+    @staticmethod
+    def distribution(snap):
+        """每个 CPU 上的中断数、RPS/XPS 队列数与 NET_RX 软中断次数"""
+        rows = {cpu: {"cpu": cpu, "irqs": 0, "rps": 0, "xps": 0, "net_rx": None} for cpu in snap["cpus"]}
+        for affinity in snap["irqs"].values():
+            for cpu in parse_cpu_list(affinity) if affinity else []:
+                if cpu in rows:
+                    rows[cpu]["irqs"] += 1
+        for key in ("rps", "xps"):
+            for mask in snap[key].values():
+                for cpu in mask_cpus(mask):
+                    if cpu in rows:
+                        rows[cpu][key] += 1
+        for cpu, count in enumerate(snap["net_rx"]):
+            if cpu in rows:
+                rows[cpu]["net_rx"] = count
+        return [rows[cpu] for cpu in snap["cpus"]]
+
+    @staticmethod
+    def plan(snap):
+        """根据快照计算要写入的值"""
+        cpus = snap["cpus"]
+        rx, tx = sorted(snap["rps"]), sorted(snap["xps"])
+        plan = {"channels": None, "rps": {}, "rps_flow_cnt": {}, "sock_flow_entries": None,
+                "xps": {}, "irqs": {}}
+        if snap["channels"]:
+            maximum, current = snap["channels"]
+            target = min(maximum, len(cpus))
+            if target > current:
+                plan["channels"] = target
+        if rx and len(rx) < len(cpus):
+            plan["sock_flow_entries"] = RPS_SOCK_FLOW_ENTRIES
+            for q in rx:
+                plan["rps"][q] = cpu_mask(cpus)
+                plan["rps_flow_cnt"][q] = RPS_SOCK_FLOW_ENTRIES // len(rx)
+        else:
+            plan["rps"] = {q: "0" for q in rx}
+        for i, q in enumerate(tx):
+            plan["xps"][q] = cpu_mask([cpu for j, cpu in enumerate(cpus) if j % len(tx) == i])
+        for i, irq in enumerate(sorted(snap["irqs"])):
+            plan["irqs"][irq] = cpus[i % len(cpus)]
+        return plan
+
+    def _write(self, path, value, failed):
+        try:
+            sudo_write_file(path, f"{value}\n")
+        except (OSError, subprocess.CalledProcessError):
+            failed.append(path)
+
+    def apply(self, plan):
+        """写入 sysfs/procfs（不含队列数），返回写入失败的路径"""
+        failed = []
+        for q, mask in plan["rps"].items():
+            self._write(self._net("queues", f"rx-{q}", "rps_cpus"), mask, failed)
+        for q, count in plan["rps_flow_cnt"].items():
+            self._write(self._net("queues", f"rx-{q}", "rps_flow_cnt"), count, failed)
+        if plan["sock_flow_entries"]:
+            self._write(self._proc("sys", "net", "core", "rps_sock_flow_entries"), plan["sock_flow_entries"], failed)
+        for q, mask in plan["xps"].items():
+            self._write(self._net("queues", f"tx-{q}", "xps_cpus"), mask, failed)
+        for irq, cpu in plan["irqs"].items():
+            # 由内核管理亲和性的中断（managed irq）不允许修改
+            self._write(self._proc("irq", str(irq), "smp_affinity_list"), cpu, failed)
+        return failed
+
+    def tune(self):
+        """调整队列数后按新的队列布局写入掩码与中断亲和性
+
+        Returns:
+            dict: {"before", "after": 快照, "plan": 实际执行的计划, "failed": 写入失败的路径}
+        """
+        before = self.snapshot()
+        plan = self.plan(before)
+        if plan["channels"]:
+            res = sudo_run(["ethtool", "-L", self.iface, "combined", str(plan["channels"])],
+                           capture_output=True, text=True)
+            if res.returncode == 0:
+                log.info(f"{self.iface} 队列数: {before['channels'][1]} -> {plan['channels']}")
+            else:
+                log.warning(f"调整队列数失败: {(res.stderr or '').strip()}")
+            # 队列数变化后重新读取队列与中断
+            channels = plan["channels"]
+            plan = self.plan(self.snapshot())
+            plan["channels"] = channels if res.returncode == 0 else None
+        failed = self.apply(plan)
+        if failed:
+            log.warning(f"{len(failed)} 项未能写入（如由内核管理的中断）: {', '.join(failed[:3])}")
+        return {"before": before, "after": self.snapshot(), "plan": plan, "failed": failed}
+
+    def persist(self):
+        """开机时重新执行调优（队列与中断号在重启后可能变化，因此不保存具体掩码）"""
+        svc = f"""[Unit]
+Description=Nexus-VPN NIC queue tuning ({self.iface})
+After=network-online.target irqbalance.service
+Wants=network-online.target
+[Service]
+Type=oneshot
+RemainAfterExit=yes
+ExecStart={sys.executable} -m nexus_vpn.cli tune nic --iface {self.iface} --no-persist
+[Install]
+WantedBy=multi-user.target
+"""
+        sudo_write_file(NicTuner.SERVICE_PATH, svc)
+        sudo_run(["systemctl", "daemon-reload"], check=True)
+        sudo_run(["systemctl", "enable", NicTuner.SERVICE_NAME], stderr=subprocess.DEVNULL, check=True)
+
+    def print_report(self, before, after=None):
+        """按 CPU 输出调优前（后）的中断、RPS/XPS 队列与 NET_RX 软中断分布"""
+        def cell(row, key):
+            value = row[key]
+            return "-" if value is None else str(value)
+
+        table = Table(title=f"{self.iface} 软中断分布", show_header=True, header_style="bold blue")
+        table.add_column("CPU", style="cyan", justify="right")
+        for title in ("中断", "RPS 队列", "XPS 队列"):
+            table.add_column(title, justify="right")
+        table.add_column("NET_RX 累计", justify="right", style="dim")
+        rows_after = {r["cpu"]: r for r in NicTuner.distribution(after)} if after else {}
+        for row in NicTuner.distribution(before):
+            new = rows_after.get(row["cpu"])
+            values = [cell(row, k) if not new or new[k] == row[k] else f"{cell(row, k)} → {cell(new, k)}"
+                      for k in ("irqs", "rps", "xps")]
+            table.add_row(str(row["cpu"]), *values, cell(new or row, "net_rx"))
+        channels = (after or before)["channels"]
+        queues = f"接收队列 {len((after or before)['rps'])}，发送队列 {len((after or before)['xps'])}"
+        if channels:
+            queues += f"，combined {channels[1]}/{channels[0]}"
+        table.caption = queues
+        console.print(table)
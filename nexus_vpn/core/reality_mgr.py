@@ -0,0 +1,69 @@
+import time
+from rich.table import Table
+from rich.console import Console
+from nexus_vpn.utils.logger import log
+from nexus_vpn.protocols.v2ray import V2RayManager
+from nexus_vpn.protocols import reality_probe
+
+console = Console()
+
+
+class RealityManager:
+    @staticmethod
+    def order_dests(reality_dests):
+        """按实测握手延迟排序候选目标；全部探测失败时保持原顺序"""
+        reality_dests = list(reality_dests)
+        if len(reality_dests) < 2:
+            return reality_dests
+        log.info(f"探测 {len(reality_dests)} 个 Reality 目标的握手延迟...")
+        results = reality_probe.rank(reality_dests)
+        RealityManager.print_results(results)
+        if not results[0]["ok"]:
+            log.warning("所有 Reality 目标均探测失败，保持原顺序")
+            return reality_dests
+        return [r["dest"] for r in results]
+
+    @staticmethod
+    def print_results(results):
+        table = Table(title="🎯 Reality 目标延迟", show_header=True, header_style="bold magenta")
+        table.add_column("目标", style="cyan")
+        table.add_column("TCP", justify="right")
+        table.add_column("TLS 1.3", justify="right")
+        table.add_column("合计", justify="right", style="bold")
+        for r in results:
+            if r["ok"]:
+                table.add_row(r["dest"], f"{r['tcp_ms']:.1f} ms", f"{r['tls_ms']:.1f} ms",
+                              f"{reality_probe.total_ms(r):.1f} ms")
+            else:
+                table.add_row(r["dest"], "-", "-", f"[red]{r['error']}[/red]")
+        console.print(table)
+
+    @staticmethod
+    def check():
+        """探测当前部署的全部候选，当前 dest 明显劣化时切换到最快的可用目标
+
+        Returns:
+            bool: 是否发生了切换
+        """
+        dests = V2RayManager.get_reality_dests()
+        results = reality_probe.rank(dests)
+        current = next(r for r in results if r["dest"] == dests[0])
+        best = results[0]
+        if not reality_probe.should_switch(current, best):
+            return False
+        reason = current["error"] if not current["ok"] else f"{reality_probe.total_ms(current):.1f} ms"
+        log.warning(f"Reality 目标 {current['dest']} 劣化（{reason}），"
+                    f"切换到 {best['dest']}（{reality_probe.total_ms(best):.1f} ms）")
+        V2RayManager.set_reality_dests([r["dest"] for r in results])
+        return True
+
+    @staticmethod
+    def monitor(interval=300):
+        """周期性检查 Reality 目标，直到被中断"""
+        log.info(f"开始监控 Reality 目标，间隔 {interval} 秒")
+        while True:
+            try:
+                RealityManager.check()
+            except Exception as e:
+                log.error(f"Reality 目标检查失败: {e}")
+            time.sleep(interval)
@@ -0,0 +1,237 @@
+"""用户注册表
+
+以 SQLite 保存三种用户（v2ray / ikev2-cert / ikev2-eap，主键 类型+用户名，UUID 唯一索引），
+查询、查重、计数和删除都走索引，不再解析 Xray 配置、PKI 目录和 ipsec.secrets。
+Xray 的 clients 数组与 ipsec.secrets 中的 EAP 条目由注册表渲染生成。
+"""
+import os
+import stat
+import sqlite3
+import time
+from contextlib import contextmanager
+from nexus_vpn.utils.sudo import need_sudo, sudo_makedirs, sudo_grant_group, sudo_move, sudo_chmod
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    type TEXT NOT NULL,
+    username TEXT NOT NULL,
+    uuid TEXT,
+    flow TEXT,
+    created_at INTEGER NOT NULL,
+    secret TEXT,
+    expires_at INTEGER,
+    flags INTEGER NOT NULL DEFAULT 0,
+    last_seen INTEGER,
+    PRIMARY KEY (type, username)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS users_uuid ON users (uuid);
+"""
+
+# 旧版数据库缺少的列，打开时补齐
+MIGRATIONS = {
+    "secret": "TEXT",
+    "expires_at": "INTEGER",
+    "flags": "INTEGER NOT NULL DEFAULT 0",
+    "last_seen": "INTEGER",
+}
+
+COLUMNS = ("username", "uuid", "flow", "created_at", "secret", "expires_at", "flags", "last_seen")
+SELECT = f"SELECT {', '.join(COLUMNS)} FROM users"
+
+# flags 位
+FLAG_DISABLED = 1
+
+
+class DuplicateUserError(Exception):
+    """用户名或 UUID 已存在"""
+
+
+class UserRegistry:
+    # 独立目录：非 root 共享时只开放这个目录，不影响 /etc/nexus-vpn 下的 PKI 与 nft 规则
+    DB_PATH = "/var/lib/nexus-vpn/users.db"
+    LEGACY_DB_PATH = "/etc/nexus-vpn/users.db"
+    # 等待其他进程释放写锁的秒数
+    BUSY_TIMEOUT = 30
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @staticmethod
+    @contextmanager
+    def open(write=False):
+        """原地打开注册表，正常退出时提交，异常时回滚
+
+        并发写入由 SQLite 自身的文件锁串行化：write=True 时立即取得写锁
+        （BEGIN IMMEDIATE），其他写者等待而不是覆盖彼此的修改。
+        """
+        db_path = UserRegistry.DB_PATH
+        UserRegistry._move_legacy(db_path)
+        if need_sudo():
+            UserRegistry._grant_access(db_path)
+            UserRegistry._restrict(db_path, 0o660)
+        else:
+            sudo_makedirs(os.path.dirname(db_path))
+            UserRegistry._restrict(db_path, 0o600)
+        with UserRegistry._connect(db_path, write) as reg:
+            yield reg
+
+    @staticmethod
+    def _move_legacy(db_path):
+        """把旧版本放在 /etc/nexus-vpn 下的数据库迁到新目录，并收回该目录的组写权限"""
+        legacy = UserRegistry.LEGACY_DB_PATH
+        if os.path.exists(db_path) or not os.path.exists(legacy):
+            return
+        sudo_makedirs(os.path.dirname(db_path))
+        for suffix in ("", "-journal"):
+            if os.path.exists(legacy + suffix):
+                sudo_move(legacy + suffix, db_path + suffix)
+        sudo_chmod(os.path.dirname(legacy), 0o755)
+
+    @staticmethod
+    def _restrict(db_path, mode):
+        """secret 列保存 EAP 明文密码：写入任何数据前把数据库限制为 mode（与 ipsec.secrets 一致）
+
+        SQLite 新建的日志文件沿用数据库文件的权限。
+        """
+        if not os.path.exists(db_path):
+            os.close(os.open(db_path, os.O_CREAT | os.O_WRONLY, mode))
+        st = os.stat(db_path)
+        if st.st_uid == os.geteuid() and stat.S_IMODE(st.st_mode) != mode:
+            os.chmod(db_path, mode)
+
+    @staticmethod
+    def _grant_access(db_path):
+        """非 root 运行时，把注册表目录和数据库的读写权限授予当前用户的组（仅首次需要 sudo）
+
+        SQLite 需要在数据库所在目录创建日志文件，因此目录也必须组可写；
+        setgid 位让新建的日志文件继承该组。
+        """
+        directory = os.path.dirname(db_path)
+        if os.access(directory, os.W_OK | os.X_OK) and \
+                (not os.path.exists(db_path) or os.access(db_path, os.R_OK | os.W_OK)):
+            return
+        sudo_makedirs(directory)
+        sudo_grant_group(directory, "g+rwxs")
+        if os.path.exists(db_path):
+            sudo_grant_group(db_path, "660")
+
+    @staticmethod
+    @contextmanager
+    def _connect(path, write=False):
+        conn = sqlite3.connect(path, timeout=UserRegistry.BUSY_TIMEOUT)
+        try:
+            conn.executescript(SCHEMA)
+            UserRegistry._migrate(conn)
+            if write:
+                conn.execute("BEGIN IMMEDIATE")
+            yield UserRegistry(conn)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _migrate(conn):
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        for column, decl in MIGRATIONS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE users ADD COLUMN {column} {decl}")
+        conn.commit()
+
+    @staticmethod
+    def _row(row):
+        return dict(zip(COLUMNS, row))
+
+    @staticmethod
+    def is_active(user, now=None):
+        """用户未被禁用且未过期"""
+        if user['flags'] & FLAG_DISABLED:
+            return False
+        return not user['expires_at'] or user['expires_at'] > (now if now is not None else time.time())
+
+    def count(self, vpn_type):
+        return self.conn.execute("SELECT COUNT(*) FROM users WHERE type = ?", (vpn_type,)).fetchone()[0]
+
+    def counts(self):
+        """{类型: 用户数}"""
+        return dict(self.conn.execute("SELECT type, COUNT(*) FROM users GROUP BY type"))
+
+    def get(self, vpn_type, username):
+        row = self.conn.execute(f"{SELECT} WHERE type = ? AND username = ?", (vpn_type, username)).fetchone()
+        return UserRegistry._row(row) if row else None
+
+    def first(self, vpn_type):
+        row = self.conn.execute(f"{SELECT} WHERE type = ? ORDER BY rowid LIMIT 1", (vpn_type,)).fetchone()
+        return UserRegistry._row(row) if row else None
+
+    def iter_users(self, vpn_type):
+        """按添加顺序逐行返回用户，不一次性载入全部结果"""
+        cursor = self.conn.execute(f"{SELECT} WHERE type = ? ORDER BY rowid", (vpn_type,))
+        for row in cursor:
+            yield UserRegistry._row(row)
+
+    def query(self, vpn_types, pattern=None, limit=None, offset=0):
+        """按添加顺序逐行返回多种类型的用户（含 type 字段）
+
+        Args:
+            vpn_types: 用户类型列表
+            pattern: 用户名通配符（GLOB，区分大小写），None 表示不筛选
+            limit: 最多返回的条数，None 表示不限
+            offset: 跳过的条数
+        """
+        sql = f"SELECT type, {', '.join(COLUMNS)} FROM users WHERE type IN ({', '.join('?' * len(vpn_types))})"
+        params = list(vpn_types)
+        if pattern:
+            sql += " AND username GLOB ?"
+            params.append(pattern)
+        sql += " ORDER BY rowid LIMIT ? OFFSET ?"
+        params += [limit if limit is not None else -1, offset]
+        for row in self.conn.execute(sql, params):
+            yield dict(zip(("type",) + COLUMNS, row))
+
+    def add(self, vpn_type, username, uuid=None, flow=None, secret=None, expires_at=None, flags=0):
+        """添加用户，用户名或 UUID 重复时抛出 DuplicateUserError"""
+        try:
+            self.conn.execute(
+                "INSERT INTO users (type, username, uuid, flow, created_at, secret, expires_at, flags) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (vpn_type, username, uuid, flow, int(time.time()), secret, expires_at, flags))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateUserError(f"{vpn_type} 用户 {username} 已存在") from e
+
+    def import_users(self, vpn_type, users):
+        """批量导入用户（dict，键同 add 的参数），已存在的用户名或 UUID 被忽略
+
+        Returns:
+            int: 实际导入的条数
+        """
+        now = int(time.time())
+        before = self.conn.total_changes
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO users (type, username, uuid, flow, created_at, secret, expires_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((vpn_type, u['username'], u.get('uuid'), u.get('flow'), now, u.get('secret'), u.get('expires_at'))
+             for u in users))
+        return self.conn.total_changes - before
+
+    def touch(self, vpn_type, usernames, now=None):
+        """记录用户最后在线时间"""
+        now = int(now if now is not None else time.time())
+        self.conn.executemany(
+            "UPDATE users SET last_seen = ? WHERE type = ? AND username = ?",
+            ((now, vpn_type, username) for username in usernames))
+
+    def remove(self, vpn_type, usernames):
+        """删除用户，返回实际删除的用户名"""
+        removed = []
+        for username in usernames:
+            cursor = self.conn.execute(
+                "DELETE FROM users WHERE type = ? AND username = ?", (vpn_type, username))
+            if cursor.rowcount:
+                removed.append(username)
+        return removed
+
+    def clear(self, vpn_type):
+        self.conn.execute("DELETE FROM users WHERE type = ?", (vpn_type,))
@@ -0,0 +1,117 @@
+"""服务器元数据缓存
+
+域名、公网 IP、Reality 公钥、shortId 与对外端口在 install 时写入
+/etc/nexus-vpn/state.json，之后的用户命令只需一次本地读取，
+不再解析 Xray/IPsec 配置或请求外部服务查询公网 IP。
+只有显式执行 `nexus-vpn state refresh` 时才重新采集。
+"""
+import os
+import re
+import json
+import time
+import subprocess
+import ipaddress
+from nexus_vpn.utils.logger import log
+from nexus_vpn.utils.sudo import sudo_read_file, sudo_write_file, sudo_makedirs
+from nexus_vpn.protocols.v2ray import V2RayManager
+
+IPSEC_CONF = "/etc/ipsec.conf"
+
+
+class ServerState:
+    PATH = "/etc/nexus-vpn/state.json"
+    IP_LOOKUP_URL = "https://ifconfig.me"
+    IKEV2_PORTS = [500, 4500]
+
+    @staticmethod
+    def load():
+        """读取缓存，文件不存在或损坏时返回空字典"""
+        try:
+            with open(ServerState.PATH) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def save(state):
+        sudo_makedirs(os.path.dirname(ServerState.PATH))
+        sudo_write_file(ServerState.PATH, json.dumps(state, indent=4))
+
+    @staticmethod
+    def local_public_ips():
+        """本机网卡上的全局单播地址（不含私有地址）"""
+        try:
+            res = subprocess.run(["ip", "-j", "addr", "show", "scope", "global"],
+                                 capture_output=True, text=True, timeout=5)
+            interfaces = json.loads(res.stdout or "[]")
+        except (OSError, subprocess.SubprocessError, ValueError):
+            return []
+        ips = []
+        for iface in interfaces:
+            for addr in iface.get("addr_info", []):
+                try:
+                    ip = ipaddress.ip_address(addr.get("local", ""))
+                except ValueError:
+                    continue
+                if ip.is_global:
+                    ips.append(str(ip))
+        return ips
+
+    @staticmethod
+    def lookup_public_ip(timeout=5):
+        """通过外部服务查询出口 IP（NAT 后的主机网卡上没有公网地址），失败返回 None"""
+        try:
+            import urllib.request
+            with urllib.request.urlopen(ServerState.IP_LOOKUP_URL, timeout=timeout) as resp:
+                return str(ipaddress.ip_address(resp.read().decode().strip()))
+        except Exception:
+            return None
+
+    @staticmethod
+    def _ipsec_domain():
+        try:
+            m = re.search(r"leftid=@(.*)", sudo_read_file(IPSEC_CONF))
+            return m.group(1).strip() if m else None
+        except Exception:
+            return None
+
+    @staticmethod
+    def collect(domain=None, lookup=True):
+        """从现有配置采集元数据
+
+        Args:
+            domain: 指定域名，None 表示从 Xray/IPsec 配置中读取
+            lookup: 是否查询外部服务补充出口 IP
+        """
+        state = {"domain": domain, "public_ips": [], "reality": None,
+                 "ports": {"ikev2": ServerState.IKEV2_PORTS}}
+        if V2RayManager.config_exists():
+            try:
+                cfg = V2RayManager._load_base()
+                reality_settings = cfg['inbounds'][0]['streamSettings']['realitySettings']
+                state["domain"] = state["domain"] or cfg.get('nexus', {}).get('domain')
+                state["reality"] = {
+                    "public_key": V2RayManager._public_key(cfg),
+                    "short_ids": reality_settings.get('shortIds', []),
+                    "server_names": reality_settings.get('serverNames', []),
+                }
+                state["ports"]["vless"] = cfg['inbounds'][0]['port']
+            except Exception as e:
+                log.warning(f"读取 Xray 配置失败，Reality 元数据未缓存: {e}")
+        state["domain"] = state["domain"] or ServerState._ipsec_domain()
+
+        ips = ServerState.local_public_ips()
+        if lookup:
+            external = ServerState.lookup_public_ip()
+            if external and external not in ips:
+                ips.append(external)
+        state["public_ips"] = ips
+        state["updated_at"] = int(time.time())
+        return state
+
+    @staticmethod
+    def refresh(domain=None, lookup=True):
+        """重新采集并写入缓存；未指定域名时保留已缓存的域名"""
+        state = ServerState.collect(domain or ServerState.load().get("domain"), lookup)
+        ServerState.save(state)
+        return state
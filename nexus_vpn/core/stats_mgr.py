@@ -0,0 +1,143 @@
+import os
+import json
+import time
+from rich.table import Table
+from rich.console import Console
+from nexus_vpn.utils.logger import log
+from nexus_vpn.utils.sudo import sudo_read_file, sudo_write_file, sudo_makedirs
+from nexus_vpn.core.registry import UserRegistry
+from nexus_vpn.protocols.v2ray import V2RayManager
+from nexus_vpn.protocols.xray_api import XrayApiClient, XrayApiError
+
+console = Console()
+
+
+def format_bytes(num):
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if num < 1024 or unit == "TiB":
+            return f"{num:.0f} {unit}" if unit == "B" else f"{num:.1f} {unit}"
+        num /= 1024
+
+
+class StatsManager:
+    HISTORY_PATH = "/etc/nexus-vpn/traffic.json"
+    # 滚动保留的采样条数，超出后丢弃最旧的
+    MAX_SAMPLES = 288
+
+    @staticmethod
+    def parse_user_stats(raw):
+        """把 Xray 计数器转换为 {用户: [上行, 下行]}
+
+        计数器名称格式: user>>>{email}>>>traffic>>>{uplink|downlink}
+        """
+        result = {}
+        for name, value in raw.items():
+            parts = name.split(">>>")
+            if len(parts) != 4 or parts[0] != "user" or parts[2] != "traffic":
+                continue
+            entry = result.setdefault(parts[1], [0, 0])
+            if parts[3] == "uplink":
+                entry[0] += value
+            elif parts[3] == "downlink":
+                entry[1] += value
+        return result
+
+    @staticmethod
+    def collect():
+        """每个实例一次批量查询所有用户计数器并清零，返回自上次查询以来的增量
+
+        单个分片查询失败不影响其他分片：已查询到的计数器已被清零，
+        必须照常返回以便记录，否则这部分流量会丢失。
+
+        Returns:
+            tuple: ({用户: [上行, 下行]}, [(失败的 API 地址, 错误)])
+        """
+        addresses = V2RayManager.get_api_addresses()
+        if not addresses:
+            raise XrayApiError("当前 Xray 配置未启用 API，请重新运行 install")
+        # 分片模式下每个实例各自计数，按用户汇总
+        result = {}
+        failed = []
+        for address in addresses:
+            try:
+                with XrayApiClient(address) as api:
+                    raw = api.query_stats("user>>>", reset=True)
+            except XrayApiError as e:
+                failed.append((address, e))
+                continue
+            for user, (up, down) in StatsManager.parse_user_stats(raw).items():
+                entry = result.setdefault(user, [0, 0])
+                entry[0] += up
+                entry[1] += down
+        if len(failed) == len(addresses):
+            raise XrayApiError("; ".join(f"{address}: {e}" for address, e in failed))
+        return result, failed
+
+    @staticmethod
+    def _load_history():
+        if os.path.exists(StatsManager.HISTORY_PATH):
+            try:
+                return json.loads(sudo_read_file(StatsManager.HISTORY_PATH))
+            except Exception:
+                log.warning("流量历史文件损坏，已重新开始记录")
+        return {"totals": {}, "samples": []}
+
+    @staticmethod
+    def record(deltas, now=None):
+        """把增量累加到历史文件中，追加一条采样，并更新有流量用户的最后在线时间"""
+        history = StatsManager._load_history()
+        totals = history.setdefault("totals", {})
+        for user, (up, down) in deltas.items():
+            total = totals.setdefault(user, [0, 0])
+            total[0] += up
+            total[1] += down
+
+        # 采样只记录有流量的用户，保持文件紧凑
+        sample = {user: d for user, d in deltas.items() if d[0] or d[1]}
+        samples = history.setdefault("samples", [])
+        samples.append([int(now if now is not None else time.time()), sample])
+        del samples[:-StatsManager.MAX_SAMPLES]
+
+        sudo_makedirs(os.path.dirname(StatsManager.HISTORY_PATH))
+        sudo_write_file(StatsManager.HISTORY_PATH, json.dumps(history, separators=(",", ":")))
+        if sample:
+            with UserRegistry.open(write=True) as reg:
+                reg.touch(V2RayManager.REGISTRY_TYPE, sample, samples[-1][0])
+        return history
+
+    @staticmethod
+    def top_users(history, deltas, limit):
+        """按累计总流量降序排列，返回 [(用户, 本次增量, 累计)]"""
+        rows = [
+            (user, deltas.get(user, [0, 0]), total)
+            for user, total in history.get("totals", {}).items()
+        ]
+        rows.sort(key=lambda r: r[2][0] + r[2][1], reverse=True)
+        return rows[:limit]
+
+    @staticmethod
+    def show(limit=10):
+        try:
+            deltas, failed = StatsManager.collect()
+        except XrayApiError as e:
+            log.error(f"查询流量统计失败: {e}")
+            return
+        history = StatsManager.record(deltas)
+        for address, e in failed:
+            log.warning(f"分片 {address} 流量查询失败，本次统计不含该分片: {e}")
+
+        table = Table(title=f"📊 V2Ray 用户流量 Top {limit}", show_header=True, header_style="bold magenta")
+        table.add_column("用户名", style="cyan")
+        table.add_column("本次上行", justify="right")
+        table.add_column("本次下行", justify="right")
+        table.add_column("累计上行", justify="right", style="dim")
+        table.add_column("累计下行", justify="right", style="dim")
+        table.add_column("累计总量", justify="right", style="bold")
+        for user, delta, total in StatsManager.top_users(history, deltas, limit):
+            table.add_row(
+                user,
+                format_bytes(delta[0]), format_bytes(delta[1]),
+                format_bytes(total[0]), format_bytes(total[1]),
+                format_bytes(total[0] + total[1]),
+            )
+        console.print(table)
@@ -1,39 +1,74 @@
 import os
+import sys
+import csv
 import json
-import glob
+import time
 import click
+from concurrent.futures import ThreadPoolExecutor
 from rich.table import Table
 from rich.console import Console
 from rich.panel import Panel
 from nexus_vpn.utils.logger import log
-from nexus_vpn.utils.sudo import sudo_read_file, sudo_remove
+from nexus_vpn.utils.sudo import sudo_remove
+from nexus_vpn.utils.lock import LockManager
 from nexus_vpn.protocols.v2ray import V2RayManager
 from nexus_vpn.protocols.ikev2 import IKEv2Manager
 from nexus_vpn.core.cert_mgr import CertManager
+from nexus_vpn.core.registry import UserRegistry, FLAG_DISABLED
+from nexus_vpn.core.state import ServerState
 
 console = Console()
 
+USER_TYPES = ('v2ray', 'ikev2-cert', 'ikev2-eap')
+LIST_FORMATS = ('table', 'json', 'jsonl', 'csv')
+# 机器可读输出的字段（不含 EAP 密码）
+LIST_FIELDS = ("type", "username", "uuid", "status", "created_at", "expires_at", "last_seen")
+
+TABLE_STYLES = {
+    'v2ray': ("🌐 V2Ray 用户", "bold magenta"),
+    'ikev2-cert': ("🛡️ IKEv2 (证书认证) 用户", "bold green"),
+    'ikev2-eap': ("🛡️ IKEv2 (账号密码) 用户", "bold yellow"),
+}
+STATUS_LABELS = {"active": "[green]有效[/green]", "expired": "[red]已过期[/red]", "disabled": "[red]已禁用[/red]"}
+# 批量导入文件的列；CSV 首行为这些列名时按表头解析，否则每行为 用户名[,操作]
+IMPORT_FIELDS = ("type", "username", "password", "action")
+IMPORT_ACTIONS = ("add", "del")
+# 导入结果清单（包含密码，权限 0600）
+CREDENTIALS_FILE = "credentials.json"
+
 class UserManager:
     @staticmethod
-    def add(vpn_type, username):
+    def add(vpn_type, username, password=None):
+        """添加用户；ikev2-eap 未指定密码时隐藏输入提示，直接回车自动生成"""
         if vpn_type == 'v2ray':
             info = V2RayManager.add_user(username)
+            if info is None:
+                # 用户已存在，add_user 已输出错误
+                return
             domain = UserManager._get_v2ray_domain()
             V2RayManager.print_connection_info(domain, info)
         
         elif vpn_type == 'ikev2-cert':
-            p12 = CertManager.issue_user_cert(username)
+            # 同名证书的签发与删除在 PKI 锁内串行
+            with LockManager.lock(CertManager.LOCK_RESOURCE):
+                p12 = CertManager.issue_user_cert(username)
+                IKEv2Manager.register_cert_user(username, int(time.time()) + CertManager.USER_CERT_DAYS * 86400)
             dom = UserManager._get_domain()
             xml = IKEv2Manager.create_mobileconfig(username, dom, p12)
             with open(f"{username}.mobileconfig", "w") as f: f.write(xml)
             log.success(f"IKEv2 证书用户已生成: {username}.mobileconfig")
         
         elif vpn_type == 'ikev2-eap':
-            pw = click.prompt(f"设置 VPN 密码", hide_input=False)
+            # 不从命令行参数读取密码（会出现在 ps 与 shell 历史中），也可以从 stdin 管道输入
+            pw = password or click.prompt("设置 VPN 密码（直接回车自动生成）", hide_input=True,
+                                          default="", show_default=False)
+            pw = pw or IKEv2Manager.generate_password()
             IKEv2Manager.add_eap_user(username, pw)
-            dom = UserManager._get_domain()
-            
-            msg = f"""
+            UserManager._print_eap_info(UserManager._get_domain(), username, pw)
+
+    @staticmethod
+    def _print_eap_info(dom, username, pw):
+        msg = f"""
 [bold cyan]用户创建成功！[/bold cyan]
 
 [bold]客户端连接设置 (Android/Windows/iOS):[/bold]
@@ -52,16 +87,16 @@ class UserManager:
 
 [bold]快速下载方式 (在本地终端运行):[/bold]
 scp root@{dom}:{CertManager.PKI_DIR}/ca.crt ./nexus-ca.crt
-            """
-            console.print(Panel(msg.strip(), title="IKEv2 EAP 连接信息", border_style="green"))
+        """
+        console.print(Panel(msg.strip(), title="IKEv2 EAP 连接信息", border_style="green"))
 
     @staticmethod
     def remove(vpn_type, username):
         if vpn_type == 'v2ray': V2RayManager.remove_user(username)
         elif vpn_type == 'ikev2-cert':
-            for ext in ['.crt', '.key', '.p12']:
-                f = f"{CertManager.PKI_DIR}/certs/{username}{ext}"
-                sudo_remove(f)
+            with LockManager.lock(CertManager.LOCK_RESOURCE):
+                UserManager._remove_cert_files(username)
+                IKEv2Manager.unregister_cert_user(username)
             # 本地文件可以直接删除
             if os.path.exists(f"{username}.mobileconfig"): os.remove(f"{username}.mobileconfig")
             log.success(f"IKEv2 证书 {username} 已清理")
@@ -69,103 +104,366 @@ scp root@{dom}:{CertManager.PKI_DIR}/ca.crt ./nexus-ca.crt
             IKEv2Manager.remove_eap_user(username)
 
     @staticmethod
-    def list_users():
-        # V2Ray
-        v_table = Table(title="🌐 V2Ray 用户", show_header=True, header_style="bold magenta")
-        v_table.add_column("用户名", style="cyan")
-        v_table.add_column("UUID", style="dim")
+    def _remove_cert_files(username):
+        for ext in ['.crt', '.key', '.p12']:
+            sudo_remove(f"{CertManager.PKI_DIR}/certs/{username}{ext}")
+
+    @staticmethod
+    def _format_time(ts):
+        return time.strftime("%Y-%m-%d", time.localtime(ts)) if ts else "-"
+
+    @staticmethod
+    def _status(user, now):
+        if user['flags'] & FLAG_DISABLED:
+            return "disabled"
+        if user['expires_at'] and user['expires_at'] <= now:
+            return "expired"
+        return "active"
+
+    @staticmethod
+    def _glob(pattern):
+        """不含通配符的筛选词按子串匹配"""
+        if pattern and not any(c in pattern for c in "*?["):
+            return f"*{pattern}*"
+        return pattern
+
+    @staticmethod
+    def _bootstrap_sections(vpn_types):
+        """并发初始化各类型的注册表数据，返回 {类型: 异常}
+
+        某类用户在注册表中为空时需要分别 sudo 读取 Xray 配置、PKI 目录和 ipsec.secrets，
+        每种类型在线程池中使用各自的注册表会话，互不等待；某一类失败不影响其他类型。
+        """
+        bootstraps = {
+            V2RayManager.REGISTRY_TYPE: V2RayManager._bootstrap,
+            IKEv2Manager.CERT_TYPE: IKEv2Manager._bootstrap_cert,
+            IKEv2Manager.EAP_TYPE: IKEv2Manager._bootstrap_eap,
+        }
+
+        def bootstrap(vpn_type):
+            with UserRegistry.open() as reg:
+                bootstraps[vpn_type](reg)
+
+        with ThreadPoolExecutor(max_workers=max(1, len(vpn_types))) as pool:
+            futures = {t: pool.submit(bootstrap, t) for t in vpn_types}
+        return {t: f.exception() for t, f in futures.items() if f.exception()}
+
+    @staticmethod
+    def _query_users(vpn_types, pattern=None, limit=None, offset=0):
+        """在同一个注册表会话中按条件逐行返回用户（不含密码）"""
+        if not vpn_types:
+            return
+        now = time.time()
+        with UserRegistry.open() as reg:
+            for user in reg.query(vpn_types, UserManager._glob(pattern), limit, offset):
+                user['status'] = UserManager._status(user, now)
+                yield {field: user[field] for field in LIST_FIELDS}
+
+    @staticmethod
+    def iter_users(vpn_types=None, pattern=None, limit=None, offset=0):
+        """按条件逐行返回用户（不含密码），读取失败的类型记录错误后跳过"""
+        vpn_types = [t for t in USER_TYPES if not vpn_types or t in vpn_types]
+        errors = UserManager._bootstrap_sections(vpn_types)
+        for vpn_type, e in errors.items():
+            log.error(f"读取 {vpn_type} 用户失败: {e}")
+        yield from UserManager._query_users([t for t in vpn_types if t not in errors], pattern, limit, offset)
+
+    @staticmethod
+    def _user_table(vpn_type, users):
+        title, header_style = TABLE_STYLES[vpn_type]
+        table = Table(title=title, show_header=True, header_style=header_style)
+        table.add_column("用户名", style="cyan")
+        if vpn_type == V2RayManager.REGISTRY_TYPE:
+            table.add_column("UUID", style="dim")
+        for name in ("状态", "创建时间", "到期", "最后在线"):
+            table.add_column(name, style="dim")
+        for user in users:
+            row = [user['username'] or 'N/A']
+            if vpn_type == V2RayManager.REGISTRY_TYPE:
+                row.append(user['uuid'] or 'N/A')
+            row += [STATUS_LABELS[user['status']], UserManager._format_time(user['created_at']),
+                    UserManager._format_time(user['expires_at']), UserManager._format_time(user['last_seen'])]
+            table.add_row(*row)
+        if not table.row_count:
+            table.add_row("[dim]无用户[/dim]", *[""] * (len(table.columns) - 1))
+        return table
+
+    @staticmethod
+    def _error_table(vpn_type, error):
+        title, header_style = TABLE_STYLES[vpn_type]
+        table = Table(title=title, show_header=True, header_style=header_style)
+        table.add_column("用户名", style="cyan")
+        table.add_column("错误", style="dim")
+        table.add_row("[red]Error[/red]", str(error))
+        return table
+
+    @staticmethod
+    def list_users(output_format="table", vpn_types=None, pattern=None, limit=None, offset=0):
+        """列出用户
+
+        Args:
+            output_format: table（rich 表格）或 json / jsonl / csv（逐行输出，不做表格排版）
+            vpn_types: 只列出这些类型，None 表示全部
+            pattern: 用户名筛选，支持 * ? 通配符，不含通配符时按子串匹配
+            limit / offset: 分页
+        """
+        if output_format != "table":
+            # 首次导入提示与读取错误不能混进 JSON / CSV
+            with log.to_stderr():
+                UserManager._write_users(output_format, UserManager.iter_users(vpn_types, pattern, limit, offset))
+            return
+
+        # 各类型并发读取，全部到齐后按固定顺序输出表格，读取失败的类型单独显示错误
+        sections = [t for t in USER_TYPES if not vpn_types or t in vpn_types]
+        errors = UserManager._bootstrap_sections(sections)
+        grouped = {t: [] for t in sections if t not in errors}
         try:
-            if os.path.exists(V2RayManager.CONFIG_PATH):
-                content = sudo_read_file(V2RayManager.CONFIG_PATH)
-                clients = json.loads(content)['inbounds'][0]['settings']['clients']
-                for c in clients: v_table.add_row(c.get('email', 'N/A'), c.get('id', 'N/A'))
+            for user in UserManager._query_users(list(grouped), pattern, limit, offset):
+                grouped[user['type']].append(user)
         except Exception as e:
-            v_table.add_row("[red]Error[/red]", str(e))
-        console.print(v_table); print("")
-        
-        # IKEv2 Cert Users
-        cert_table = Table(title="🛡️ IKEv2 (证书认证) 用户", show_header=True, header_style="bold green")
-        cert_table.add_column("用户名", style="cyan")
-        cert_table.add_column("状态", style="dim")
-        try:
-            cert_dir = f"{CertManager.PKI_DIR}/certs"
-            if os.path.exists(cert_dir):
-                found_cert_users = False
-                for f_path in glob.glob(os.path.join(cert_dir, "*.crt")):
-                    fname = os.path.basename(f_path)
-                    if fname == "server.crt": continue # 排除服务器证书
-                    username = fname.replace(".crt", "")
-                    cert_table.add_row(username, "已签发")
-                    found_cert_users = True
-                if not found_cert_users:
-                    cert_table.add_row("无证书用户", "[dim]N/A[/dim]")
+            errors.update(dict.fromkeys(grouped, e))
+        for vpn_type in sections:
+            if vpn_type in errors:
+                table = UserManager._error_table(vpn_type, errors[vpn_type])
             else:
-                cert_table.add_row("PKI目录未初始化", "[red]Error[/red]")
-        except Exception as e:
-            cert_table.add_row("[red]Error[/red]", str(e))
-        console.print(cert_table); print("")
+                table = UserManager._user_table(vpn_type, grouped[vpn_type])
+            console.print(table); print("")
 
-        # IKEv2 EAP Users
-        eap_table = Table(title="🛡️ IKEv2 (账号密码) 用户", show_header=True, header_style="bold yellow")
-        eap_table.add_column("用户名", style="cyan")
-        eap_table.add_column("类型", style="dim")
-        try:
-            if os.path.exists(IKEv2Manager.SECRETS_FILE):
-                found_eap_users = False
-                content = sudo_read_file(IKEv2Manager.SECRETS_FILE)
-                for l in content.splitlines():
-                    if " : EAP " in l:
-                        user = l.split(":")[0].strip().replace('"','')
-                        eap_table.add_row(user, "MSCHAPv2")
-                        found_eap_users = True
-                if not found_eap_users:
-                    eap_table.add_row("无账号密码用户", "[dim]N/A[/dim]")
-            else:
-                eap_table.add_row("Secrets文件不存在", "[red]Error[/red]")
-        except Exception as e:
-            eap_table.add_row("[red]Error[/red]", str(e))
-        console.print(eap_table)
-        
         # 底部提示
-        print(f"\n[dim]CA 证书位置: {CertManager.PKI_DIR}/ca.crt[/dim]")
+        print(f"[dim]CA 证书位置: {CertManager.PKI_DIR}/ca.crt[/dim]")
 
     @staticmethod
-    def _get_domain():
-        import re
+    def _write_users(output_format, users, out=None):
+        """逐行写出用户，每行立即输出"""
+        out = out or sys.stdout
+        if output_format == "csv":
+            writer = csv.writer(out)
+            writer.writerow(LIST_FIELDS)
+            for user in users:
+                writer.writerow(["" if user[f] is None else user[f] for f in LIST_FIELDS])
+                out.flush()
+        elif output_format == "jsonl":
+            for user in users:
+                out.write(json.dumps(user, ensure_ascii=False) + "\n")
+                out.flush()
+        else:
+            out.write("[")
+            for i, user in enumerate(users):
+                out.write(("," if i else "") + "\n  " + json.dumps(user, ensure_ascii=False))
+                out.flush()
+            out.write("\n]\n")
+
+    @staticmethod
+    def _import_row(record, default_type=None):
+        """校验一条导入记录并补全默认值，返回 {type, username, password, action}"""
+        username = str(record.get("username") or "").strip()
+        CertManager.validate_name(username)
+        vpn_type = str(record.get("type") or default_type or "").strip()
+        if vpn_type not in USER_TYPES:
+            raise ValueError(f"用户 {username} 的类型无效: '{vpn_type}'（可在文件中加入 type 列或使用 --type）")
+        action = str(record.get("action") or "add").strip().lower()
+        if action not in IMPORT_ACTIONS:
+            raise ValueError(f"未知操作 '{action}'（用户 {username}）")
+        password = record.get("password") or None
+        if password is not None:
+            if vpn_type != IKEv2Manager.EAP_TYPE:
+                raise ValueError(f"只有 ikev2-eap 用户可以指定密码（用户 {username}）")
+            IKEv2Manager.validate_password(str(password))
+        return {"type": vpn_type, "username": username, "password": password, "action": action}
+
+    @staticmethod
+    def _read_import_rows(path, default_type=None):
+        """解析导入文件，返回记录列表
+
+        .json 文件为对象数组，键同 IMPORT_FIELDS。CSV 首行为列名（type,username,password,action
+        的任意组合）时按表头解析，否则每行为 用户名[,操作]。type 留空时使用 default_type，
+        password 留空的 ikev2-eap 用户自动生成密码，操作为 add（默认）或 del；
+        空行与 # 开头的注释行会被跳过。任何一行无效时整个文件被拒绝。
+        """
+        if path.lower().endswith(".json"):
+            with open(path) as f:
+                records = json.load(f)
+            if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+                raise ValueError("JSON 导入文件应为对象数组")
+        else:
+            records, header = [], None
+            with open(path, newline="") as f:
+                for row in csv.reader(f):
+                    cells = [c.strip() for c in row]
+                    if not any(cells) or cells[0].startswith("#"):
+                        continue
+                    if header is None and not records and "username" in (c.lower() for c in cells) \
+                            and all(c.lower() in IMPORT_FIELDS for c in cells):
+                        header = [c.lower() for c in cells]
+                        continue
+                    columns = header or ("username", "action")
+                    records.append(dict(zip(columns, cells)))
+
+        rows, seen = [], set()
+        for record in records:
+            row = UserManager._import_row(record, default_type)
+            key = (row["type"], row["username"])
+            if key in seen:
+                raise ValueError(f"导入文件中 {row['type']} 用户 {row['username']} 重复")
+            seen.add(key)
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    def import_users(vpn_type, path, output_dir, image_format="svg", workers=None):
+        """从 CSV/JSON 批量导入用户
+
+        记录按类型分组，每组整批只写一次配置、只重载一次服务。新增用户的凭据
+        （V2Ray 链接、EAP 密码、证书描述文件路径）汇总写入 output_dir/credentials.json。
+
+        Args:
+            vpn_type: 文件中未写 type 的记录使用的类型，None 表示必须在文件中指定
+        """
         try:
-            content = sudo_read_file("/etc/ipsec.conf")
-            m = re.search(r"leftid=@(.*)", content)
-            if m:
-                return m.group(1).strip()
-        except Exception:
-            pass
-        # 尝试获取本机 IP 作为备选
+            rows = UserManager._read_import_rows(path, vpn_type)
+        except (OSError, ValueError) as e:
+            log.error(str(e))
+            return
+        importers = {
+            'v2ray': lambda add, remove: UserManager._import_v2ray(add, remove, output_dir, image_format, workers),
+            'ikev2-cert': lambda add, remove: UserManager._import_cert(add, remove, output_dir),
+            'ikev2-eap': UserManager._import_eap,
+        }
+        credentials, removed = [], []
+        for t in USER_TYPES:
+            add = [r for r in rows if r["type"] == t and r["action"] == "add"]
+            remove = [r["username"] for r in rows if r["type"] == t and r["action"] == "del"]
+            if not add and not remove:
+                continue
+            try:
+                credentials += importers[t](add, remove)
+                removed += [(t, username) for username in remove]
+            except Exception as e:
+                log.error(f"{t} 用户导入失败: {e}")
+        if credentials or removed:
+            path = UserManager._write_credentials(output_dir, credentials, removed)
+            log.success(f"已导入 {len(credentials)} 个新用户，凭据清单: {path}（包含密码，请妥善保管）")
+
+    @staticmethod
+    def _import_v2ray(add, remove, output_dir, image_format, workers):
+        infos, _ = V2RayManager.update_users(add=[r["username"] for r in add], remove=remove)
+        if not infos:
+            if remove and os.path.isdir(output_dir):
+                # 已撤销的链接不再留在输出目录与 links.txt 中
+                V2RayManager.write_share_files(None, {}, output_dir, image_format, workers, removed=remove)
+            return []
+        domain = UserManager._get_v2ray_domain()
+        count = V2RayManager.write_share_files(domain, infos, output_dir, image_format, workers, removed=remove)
+        log.success(f"已为 {count} 个新用户生成分享链接与二维码: {output_dir}")
+        return [{"type": "v2ray", "username": username, "uuid": info["uuid"],
+                 "link": V2RayManager.build_link(domain, info, remark=username),
+                 "qrcode": os.path.join(output_dir, f"{username}.{image_format}")}
+                for username, info in infos.items()]
+
+    @staticmethod
+    def _import_eap(add, remove):
+        passwords = {r["username"]: r["password"] or IKEv2Manager.generate_password() for r in add}
+        added, _ = IKEv2Manager.update_eap_users(add=passwords, remove=remove)
+        if not added:
+            return []
+        server = UserManager._get_domain()
+        return [{"type": IKEv2Manager.EAP_TYPE, "username": username, "password": passwords[username],
+                 "server": server} for username in added]
+
+    @staticmethod
+    def _import_cert(add, remove, output_dir):
+        """签发证书（逐个调用 ipsec pki）后在一个注册表事务中登记，描述文件写入 output_dir"""
+        issued = {}
+        with LockManager.lock(CertManager.LOCK_RESOURCE):
+            with IKEv2Manager._registry() as reg:
+                existing = {r["username"] for r in add if reg.get(IKEv2Manager.CERT_TYPE, r["username"])}
+            for username in existing:
+                log.warning(f"IKEv2 证书用户 {username} 已存在，跳过")
+            for username in remove:
+                UserManager._remove_cert_files(username)
+            expires_at = int(time.time()) + CertManager.USER_CERT_DAYS * 86400
+            try:
+                for r in add:
+                    if r["username"] not in existing:
+                        issued[r["username"]] = CertManager.issue_user_cert(r["username"])
+            finally:
+                # 中途失败时已签发的证书仍然登记
+                IKEv2Manager.update_cert_users(add={u: expires_at for u in issued}, remove=remove)
+        for username in remove:
+            profile = os.path.join(output_dir, f"{username}.mobileconfig")
+            if os.path.exists(profile):
+                os.remove(profile)
+        if not issued:
+            return []
+        domain = UserManager._get_domain()
+        os.makedirs(output_dir, exist_ok=True)
+        result = []
+        for username, p12 in issued.items():
+            profile = os.path.join(output_dir, f"{username}.mobileconfig")
+            with open(profile, "w") as f:
+                f.write(IKEv2Manager.create_mobileconfig(username, domain, p12))
+            result.append({"type": IKEv2Manager.CERT_TYPE, "username": username, "server": domain,
+                           "profile": profile, "p12": p12})
+        log.success(f"已为 {len(result)} 个 IKEv2 证书用户生成描述文件: {output_dir}")
+        return result
+
+    @staticmethod
+    def _write_credentials(output_dir, credentials, removed=()):
+        """合并写入凭据清单：之前导入的用户保留，本次删除或重新导入的用户被替换"""
+        path = os.path.join(output_dir, CREDENTIALS_FILE)
         try:
-            import urllib.request
-            with urllib.request.urlopen("https://ifconfig.me", timeout=5) as resp:
-                return resp.read().decode().strip()
-        except Exception:
-            return "your-server-ip"
+            with open(path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        replaced = set(removed) | {(c["type"], c["username"]) for c in credentials}
+        entries = [e for e in entries if (e.get("type"), e.get("username")) not in replaced] + credentials
+        os.makedirs(output_dir, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(entries, f, ensure_ascii=False, indent=2)
+        return path
+
+    @staticmethod
+    def export_users(vpn_type, output_dir, image_format="svg", workers=None):
+        """导出所有用户的分享链接与二维码文件"""
+        if vpn_type != 'v2ray':
+            log.error(f"暂不支持 {vpn_type} 类型的批量导出")
+            return
+        infos = V2RayManager.get_all_user_info()
+        domain = UserManager._get_v2ray_domain()
+        count = V2RayManager.write_share_files(domain, infos, output_dir, image_format, workers, prune=True)
+        log.success(f"已导出 {count} 个 V2Ray 用户: {output_dir}")
+
+    @staticmethod
+    def _get_domain():
+        """IKEv2 客户端连接的服务器地址"""
+        return UserManager._server_address(ServerState._ipsec_domain)
 
     @staticmethod
     def _get_v2ray_domain():
-        """从 V2Ray 配置获取域名"""
+        """V2Ray 分享链接中的服务器地址"""
+        return UserManager._server_address(UserManager._v2ray_config_domain)
+
+    @staticmethod
+    def _v2ray_config_domain():
         try:
-            if os.path.exists(V2RayManager.CONFIG_PATH):
-                content = sudo_read_file(V2RayManager.CONFIG_PATH)
-                cfg = json.loads(content)
-                domain = cfg.get('nexus', {}).get('domain')
-                if domain:
-                    return domain
+            if V2RayManager.config_exists():
+                return V2RayManager._load_base().get('nexus', {}).get('domain')
         except Exception:
             pass
-        # 回退到公网 IP
-        try:
-            import urllib.request
-            with urllib.request.urlopen("https://ifconfig.me", timeout=5) as resp:
-                return resp.read().decode().strip()
-        except Exception:
-            return "your-server-ip"
+        return None
+
+    @staticmethod
+    def _server_address(from_config):
+        """依次取缓存的域名、配置中的域名、缓存的公网 IP，不访问网络"""
+        state = ServerState.load()
+        address = state.get('domain') or from_config() or next(iter(state.get('public_ips') or []), None)
+        if address:
+            return address
+        log.warning("未找到服务器域名/IP，请执行: nexus-vpn state refresh --domain <域名>")
+        return "your-server-ip"
 
     @staticmethod
     def info(vpn_type, username):
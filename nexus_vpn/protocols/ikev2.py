@@ -1,13 +1,31 @@
 import os
+import re
+import glob
 import base64
+import secrets
 import subprocess
+from contextlib import contextmanager
 from nexus_vpn.core.cert_mgr import CertManager
+from nexus_vpn.core.registry import UserRegistry
+from nexus_vpn.utils.lock import LockManager
 from nexus_vpn.utils.logger import log
 from nexus_vpn.utils.sudo import sudo_run, sudo_write_file, sudo_read_file
 
+# ipsec.secrets 中的 EAP 行: user : EAP "password"（用户名可带引号）
+EAP_LINE_RE = re.compile(r'^\s*"?([^"\s]+)"?\s*:\s*EAP\s+"(.*)"\s*$')
+
+
 class IKEv2Manager:
     SECRETS_FILE = "/etc/ipsec.secrets"
     IPSEC_CONF_FILE = "/etc/ipsec.conf"
+    CERT_TYPE = "ikev2-cert"
+    EAP_TYPE = "ikev2-eap"
+    LOCK_RESOURCE = "ipsec"
+    # 分配给客户端的虚拟地址池
+    CLIENT_SUBNET = "10.10.10.0/24"
+    CLIENT_SUBNET6 = "fd00:10:10:10::/64"
+    # 自动生成的 EAP 密码长度（随机字节数，base64url 编码后约 16 个字符）
+    PASSWORD_BYTES = 12
 
     @staticmethod
     def init_pki(domain):
@@ -36,7 +54,7 @@ conn IKEv2-Cert
     leftsubnet=0.0.0.0/0,::/0
     right=%any
     rightid=%any
-    rightsourceip=10.10.10.0/24,fd00:10:10:10::/64
+    rightsourceip={IKEv2Manager.CLIENT_SUBNET},{IKEv2Manager.CLIENT_SUBNET6}
     rightdns=8.8.8.8,1.1.1.1,2001:4860:4860::8888
     auto=add
 
@@ -49,17 +67,18 @@ conn IKEv2-EAP
     right=%any
     rightid=%any
     rightauth=eap-mschapv2
-    rightsourceip=10.10.10.0/24,fd00:10:10:10::/64
+    rightsourceip={IKEv2Manager.CLIENT_SUBNET},{IKEv2Manager.CLIENT_SUBNET6}
     rightdns=8.8.8.8,1.1.1.1,2001:4860:4860::8888
     eap_identity=%identity
     auto=add
 """
-        sudo_write_file(IKEv2Manager.IPSEC_CONF_FILE, config)
-        
-        # 初始化 ipsec.secrets，确保包含服务器私钥
-        IKEv2Manager._init_secrets()
-        
-        sudo_run(["ipsec", "reload"])
+        with IKEv2Manager._locked("generate_config", domain=domain):
+            sudo_write_file(IKEv2Manager.IPSEC_CONF_FILE, config)
+            
+            # 初始化 ipsec.secrets，确保包含服务器私钥
+            IKEv2Manager._init_secrets()
+            
+            sudo_run(["ipsec", "reload"])
         log.success(f"IPsec 配置已生成: {IKEv2Manager.IPSEC_CONF_FILE}")
 
     @staticmethod
@@ -81,43 +100,148 @@ conn IKEv2-EAP
             log.info("已添加服务器私钥到 ipsec.secrets")
 
     @staticmethod
-    def _remove_user_from_secrets(username):
-        """从 secrets 文件中移除指定用户的行"""
+    def _read_secrets():
         if not os.path.exists(IKEv2Manager.SECRETS_FILE):
-            return
+            return ""
         try:
-            content = sudo_read_file(IKEv2Manager.SECRETS_FILE)
-            lines = content.splitlines(keepends=True)
-            new_lines = []
-            for line in lines:
-                # 跳过匹配用户名的行
-                if line.startswith(f'{username} :') or line.startswith(f'"{username}" :'):
-                    continue
-                new_lines.append(line)
-            sudo_write_file(IKEv2Manager.SECRETS_FILE, "".join(new_lines))
+            return sudo_read_file(IKEv2Manager.SECRETS_FILE)
         except Exception:
-            pass
+            return ""
 
     @staticmethod
-    def add_eap_user(username, password):
-        IKEv2Manager._remove_user_from_secrets(username)
-        
-        # 追加用户
-        try:
-            content = sudo_read_file(IKEv2Manager.SECRETS_FILE)
-        except Exception:
-            content = ""
-        content += f'{username} : EAP "{password}"\n'
-        sudo_write_file(IKEv2Manager.SECRETS_FILE, content)
+    def _cert_users():
+        """PKI 目录中已签发的用户证书（仅用于初始化注册表）"""
+        for path in glob.glob(os.path.join(CertManager.PKI_DIR, "certs", "*.crt")):
+            name = os.path.basename(path)[:-len(".crt")]
+            if name != "server":
+                yield {"username": name}
+
+    @staticmethod
+    @contextmanager
+    def _registry(write=False):
+        """打开用户注册表；还没有 IKEv2 用户时从 PKI 目录与 ipsec.secrets 导入一次"""
+        with UserRegistry.open(write=write) as reg:
+            IKEv2Manager._bootstrap(reg)
+            yield reg
+
+    @staticmethod
+    def _bootstrap(reg):
+        IKEv2Manager._bootstrap_cert(reg)
+        IKEv2Manager._bootstrap_eap(reg)
+
+    @staticmethod
+    def _bootstrap_cert(reg):
+        if not reg.count(IKEv2Manager.CERT_TYPE):
+            reg.import_users(IKEv2Manager.CERT_TYPE, IKEv2Manager._cert_users())
+
+    @staticmethod
+    def _bootstrap_eap(reg):
+        if not reg.count(IKEv2Manager.EAP_TYPE):
+            reg.import_users(IKEv2Manager.EAP_TYPE, (
+                {"username": m.group(1), "secret": m.group(2)}
+                for m in map(EAP_LINE_RE.match, IKEv2Manager._read_secrets().splitlines()) if m))
+
+    @staticmethod
+    def _render_secrets(reg):
+        """保留 ipsec.secrets 中的非 EAP 行（服务器私钥等），EAP 行由注册表中有效的用户生成"""
+        lines = [l for l in IKEv2Manager._read_secrets().splitlines() if not EAP_LINE_RE.match(l)]
+        for user in reg.iter_users(IKEv2Manager.EAP_TYPE):
+            if UserRegistry.is_active(user):
+                lines.append(f'{user["username"]} : EAP "{user["secret"]}"')
+        sudo_write_file(IKEv2Manager.SECRETS_FILE, "\n".join(lines) + "\n")
         sudo_run(["ipsec", "rereadsecrets"])
+
+    @staticmethod
+    def _locked(op, **details):
+        """持有 ipsec 锁执行一次会改写 ipsec.secrets 的操作"""
+        return LockManager.transaction(IKEv2Manager.LOCK_RESOURCE, IKEv2Manager._recover, op, **details)
+
+    @staticmethod
+    def _recover(entry, interrupted):
+        """由注册表重新生成 ipsec.secrets 的 EAP 条目"""
+        if not os.path.exists(IKEv2Manager.SECRETS_FILE):
+            return
+        with IKEv2Manager._registry() as reg:
+            IKEv2Manager._render_secrets(reg)
+
+    @staticmethod
+    def validate_password(password):
+        """EAP 密码写在 ipsec.secrets 的双引号内，不能包含引号与换行"""
+        if not password or any(c in password for c in '"\r\n'):
+            raise ValueError("EAP 密码不能为空，且不能包含双引号或换行")
+        return password
+
+    @staticmethod
+    def add_eap_user(username, password, expires_at=None):
+        """添加 EAP 用户，同名用户的密码被替换"""
+        IKEv2Manager.validate_password(password)
+        with IKEv2Manager._locked("add_eap_user", users=[username]), IKEv2Manager._registry(write=True) as reg:
+            reg.remove(IKEv2Manager.EAP_TYPE, [username])
+            reg.add(IKEv2Manager.EAP_TYPE, username, secret=password, expires_at=expires_at)
+            IKEv2Manager._render_secrets(reg)
         log.success(f"EAP 用户 {username} 已激活。")
 
+    @staticmethod
+    def generate_password():
+        """生成 EAP 密码（base64url 字符，可直接写入 ipsec.secrets 的引号内）"""
+        return secrets.token_urlsafe(IKEv2Manager.PASSWORD_BYTES)
+
+    @staticmethod
+    def update_eap_users(add=None, remove=()):
+        """批量增删 EAP 用户：整批只改写一次 ipsec.secrets、只重读一次密钥
+
+        已存在的用户不会被覆盖密码，不存在的用户删除时被忽略。
+
+        Args:
+            add: {用户名: 密码}
+            remove: 要删除的用户名
+
+        Returns:
+            tuple: ([新增用户名], [实际删除的用户名])
+        """
+        add = add or {}
+        with IKEv2Manager._locked("update_eap_users", add=len(add), remove=len(remove)), \
+                IKEv2Manager._registry(write=True) as reg:
+            removed = reg.remove(IKEv2Manager.EAP_TYPE, remove)
+            added = []
+            for username, password in add.items():
+                if reg.get(IKEv2Manager.EAP_TYPE, username):
+                    log.warning(f"EAP 用户 {username} 已存在，跳过")
+                    continue
+                reg.add(IKEv2Manager.EAP_TYPE, username, secret=password)
+                added.append(username)
+            if added or removed:
+                IKEv2Manager._render_secrets(reg)
+        log.success(f"EAP 用户批量更新完成: 新增 {len(added)} 个，删除 {len(removed)} 个。")
+        return added, removed
+
     @staticmethod
     def remove_eap_user(username):
-        IKEv2Manager._remove_user_from_secrets(username)
-        sudo_run(["ipsec", "rereadsecrets"])
+        with IKEv2Manager._locked("remove_eap_user", users=[username]), IKEv2Manager._registry(write=True) as reg:
+            reg.remove(IKEv2Manager.EAP_TYPE, [username])
+            IKEv2Manager._render_secrets(reg)
         log.success(f"EAP 用户 {username} 已删除。")
 
+    @staticmethod
+    def register_cert_user(username, expires_at=None):
+        """记录已签发证书的用户（重新签发时更新创建与到期时间）"""
+        with IKEv2Manager._registry(write=True) as reg:
+            reg.remove(IKEv2Manager.CERT_TYPE, [username])
+            reg.add(IKEv2Manager.CERT_TYPE, username, expires_at=expires_at)
+
+    @staticmethod
+    def update_cert_users(add=None, remove=()):
+        """在一个注册表事务中登记新签发的证书用户 {用户名: 到期时间} 并注销 remove"""
+        with IKEv2Manager._registry(write=True) as reg:
+            reg.remove(IKEv2Manager.CERT_TYPE, list(remove) + list(add or {}))
+            for username, expires_at in (add or {}).items():
+                reg.add(IKEv2Manager.CERT_TYPE, username, expires_at=expires_at)
+
+    @staticmethod
+    def unregister_cert_user(username):
+        with IKEv2Manager._registry(write=True) as reg:
+            reg.remove(IKEv2Manager.CERT_TYPE, [username])
+
     @staticmethod
     def create_mobileconfig(username, domain, p12_path):
         ca_content = CertManager.get_ca_content()
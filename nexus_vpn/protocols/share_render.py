@@ -0,0 +1,133 @@
+"""分享链接与二维码批量渲染
+
+每个用户输出 <用户名>.txt（链接）和 <用户名>.svg/.png（二维码）。
+输出目录中的 .manifest.json 记录每个用户链接的 sha256，
+内容未变且图片仍在的用户直接跳过；需要重新渲染的用户分发到多个进程并行生成。
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import qrcode
+from nexus_vpn.utils.logger import log
+
+MANIFEST = ".manifest.json"
+IMAGE_FORMATS = ("svg", "png")
+
+
+def png_available():
+    """PNG 输出依赖 pypng（pip install 'nexus-vpn[png]'）"""
+    try:
+        import png  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _digest(link, image_format):
+    return hashlib.sha256(f"{image_format}\n{link}".encode()).hexdigest()
+
+
+def _render_one(task):
+    """在工作进程中写入单个用户的链接与二维码"""
+    link, base_path, image_format = task
+    with open(f"{base_path}.txt", "w") as f:
+        f.write(link + "\n")
+    if image_format == "png":
+        from qrcode.image.pure import PyPNGImage
+        factory = PyPNGImage
+    else:
+        import qrcode.image.svg
+        factory = qrcode.image.svg.SvgPathImage
+    img = qrcode.make(link, image_factory=factory)
+    with open(f"{base_path}.{image_format}", "wb") as f:
+        img.save(f)
+
+
+def _entry_link(output_dir, name, entry):
+    """清单中的链接；旧版清单未记录链接时读取 <用户名>.txt"""
+    if entry.get("link"):
+        return entry["link"]
+    try:
+        with open(os.path.join(output_dir, f"{name}.txt")) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _remove_outputs(output_dir, name, image_format):
+    for ext in ("txt", image_format):
+        path = os.path.join(output_dir, f"{name}.{ext}")
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def render_share_files(links, output_dir, image_format="svg", workers=None, prune=False, removed=()):
+    """把 {用户名: 分享链接} 渲染到 output_dir，并汇总写入 links.txt
+
+    Args:
+        links: {用户名: 分享链接}
+        output_dir: 输出目录
+        image_format: 二维码格式，svg 或 png
+        workers: 并行进程数，None 为 CPU 核数，1 表示在当前进程内渲染
+        prune: 是否删除清单中已不存在的用户文件（导出全部用户时使用）
+        removed: 已删除的用户（增量导入中的 del 行），从清单与 links.txt 中去掉并删除其文件
+
+    Returns:
+        tuple: (重新渲染的用户数, 跳过的用户数)
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"不支持的二维码格式: {image_format}")
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except ValueError:
+            log.warning("渲染清单损坏，将重新生成全部文件")
+
+    tasks = []
+    entries = {}
+    for name, link in links.items():
+        digest = _digest(link, image_format)
+        entries[name] = {"sha256": digest, "format": image_format, "link": link}
+        old = manifest.get(name)
+        if old and old.get("sha256") == digest and \
+                os.path.exists(os.path.join(output_dir, f"{name}.{image_format}")):
+            continue
+        if old and old.get("format") != image_format:
+            _remove_outputs(output_dir, name, old.get("format"))
+        tasks.append((link, os.path.join(output_dir, name), image_format))
+
+    if len(tasks) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 4))
+            list(pool.map(_render_one, tasks, chunksize=chunksize))
+    else:
+        for task in tasks:
+            _render_one(task)
+
+    if prune:
+        for name, old in manifest.items():
+            if name not in entries:
+                _remove_outputs(output_dir, name, old.get("format"))
+    else:
+        entries = dict(manifest, **entries)
+    for name in removed:
+        if name in links:
+            continue
+        entries.pop(name, None)
+        for fmt in IMAGE_FORMATS:
+            _remove_outputs(output_dir, name, fmt)
+
+    # links.txt 汇总目录中所有用户（增量导入时包含之前导出的用户）
+    with open(os.path.join(output_dir, "links.txt"), "w") as f:
+        for name, entry in entries.items():
+            link = _entry_link(output_dir, name, entry)
+            if link:
+                f.write(f"{name}\t{link}\n")
+    with open(manifest_path, "w") as f:
+        json.dump(entries, f, separators=(",", ":"))
+    return len(tasks), len(links) - len(tasks)
@@ -1,22 +1,55 @@
 import json
-import subprocess
+import secrets
 import uuid
 import os
+import socket
+import subprocess
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
 import qrcode
 from nexus_vpn.utils.logger import log
-from nexus_vpn.utils.sudo import sudo_run, sudo_write_file, sudo_read_file, sudo_makedirs
+from nexus_vpn.utils.x25519 import generate_keypair, public_key_from_private
+from nexus_vpn.utils.sudo import sudo_run, sudo_write_file, sudo_read_file, sudo_makedirs, sudo_move, sudo_remove
+from nexus_vpn.protocols.xray_api import XrayApiClient, XrayApiError
+from nexus_vpn.protocols.xray_tuning import build_tuning
+from nexus_vpn.protocols.share_render import render_share_files
+from nexus_vpn.core.registry import UserRegistry
+from nexus_vpn.utils.lock import LockManager
+
+class XrayConfigError(Exception):
+    """候选配置未通过校验，或应用后健康检查失败"""
+
 
 class V2RayManager:
+    # 旧版单文件配置；新部署改用同目录下的 conf.d（xray run -confdir）
     CONFIG_PATH = "/usr/local/etc/xray/config.json"
+    # confdir 中的文件按文件名顺序合并：基础配置几乎不变，用户变更只重写 VLESS 入站
+    BASE_FILE = "00-base.json"
+    INBOUND_FILE = "20-vless.json"
+    INBOUND_TAG = "vless-in"
+    REGISTRY_TYPE = "v2ray"
+    FLOW = "xtls-rprx-vision"
+    API_TAG = "api"
+    API_LISTEN = "127.0.0.1"
+    API_PORT = 10085
+    # 分片模式下第 i 个 Xray 实例监听 SHARD_BASE_PORT + i，由 nftables 把 443 分流过去
+    SHARD_BASE_PORT = 20443
+    XRAY_BIN = "/usr/local/bin/xray"
+    LOCK_RESOURCE = "xray"
+    # 重启后等待监听端口恢复的最长时间（秒）
+    HEALTH_TIMEOUT = 10
     
     @staticmethod
-    def create_config(domain, reality_dests, preserve_users=True):
+    def create_config(domain, reality_dests, preserve_users=True, shards=None, profile=None):
         """生成 VLESS-Reality 配置
         
         Args:
             domain: 服务器域名/IP
             reality_dests: Reality 目标，可以是单个字符串或字符串列表
             preserve_users: 是否保留现有用户（默认 True）
+            shards: Xray 实例数，None 表示沿用现有配置（默认 1）
+            profile: 性能调优档位（见 xray_tuning.PROFILES），None 表示沿用现有配置
         """
         log.info("生成 VLESS-Reality 配置...")
         
@@ -28,54 +61,60 @@ class V2RayManager:
         primary_dest = reality_dests[0]
         server_names = [dest.split(':')[0] for dest in reality_dests]
         
-        # 尝试保留现有配置中的用户和密钥
-        existing_clients = None
+        # 尝试保留现有配置中的密钥与部署参数（用户保存在注册表中）
         existing_keys = None
-        if preserve_users and os.path.exists(V2RayManager.CONFIG_PATH):
+        existing_shards = 1
+        existing_profile = None
+        if preserve_users and V2RayManager.config_exists():
             try:
-                old_cfg_content = sudo_read_file(V2RayManager.CONFIG_PATH)
-                old_cfg = json.loads(old_cfg_content)
-                existing_clients = old_cfg.get('inbounds', [{}])[0].get('settings', {}).get('clients', [])
+                old_cfg = V2RayManager._load_base()
                 reality_settings = old_cfg.get('inbounds', [{}])[0].get('streamSettings', {}).get('realitySettings', {})
                 if reality_settings.get('privateKey'):
                     existing_keys = {
                         'privateKey': reality_settings['privateKey'],
                         'shortIds': reality_settings.get('shortIds', [])
                     }
-                if existing_clients:
-                    log.info(f"保留 {len(existing_clients)} 个现有用户")
+                existing_shards = old_cfg.get('nexus', {}).get('shards', 1)
+                existing_profile = old_cfg.get('nexus', {}).get('profile')
             except Exception:
                 pass
+        if shards is None:
+            shards = existing_shards
+        if profile is None:
+            profile = existing_profile
         
-        # 生成新密钥或使用现有密钥
+        # 生成新密钥或使用现有密钥（均在进程内完成，不再调用 xray/openssl）
         if existing_keys:
             priv_key = existing_keys['privateKey']
-            short_id = existing_keys['shortIds'][0] if existing_keys['shortIds'] else subprocess.check_output(["openssl", "rand", "-hex", "4"]).decode().strip()
-            # 从私钥推导公钥
-            out = subprocess.check_output(["/usr/local/bin/xray", "x25519", "-i", priv_key]).decode()
-            pub_key = out.split('Public key:')[1].split('\n')[0].strip()
-        else:
-            out = subprocess.check_output(["/usr/local/bin/xray", "x25519"]).decode()
-            priv_key = out.split('Private key:')[1].split('\n')[0].strip()
-            pub_key = out.split('Public key:')[1].split('\n')[0].strip()
-            short_id = subprocess.check_output(["openssl", "rand", "-hex", "4"]).decode().strip()
-        
-        # 使用现有用户或创建默认 admin 用户
-        if existing_clients:
-            clients = existing_clients
-            uid = clients[0]['id']  # 返回第一个用户的 UUID
+            short_id = existing_keys['shortIds'][0] if existing_keys['shortIds'] else secrets.token_hex(4)
+            pub_key = public_key_from_private(priv_key)
         else:
-            uid = str(uuid.uuid4())
-            clients = [{"id": uid, "flow": "xtls-rprx-vision", "email": "admin"}]
+            priv_key, pub_key = generate_keypair()
+            short_id = secrets.token_hex(4)
+        
+        # 开启按用户统计的上下行流量计数器（客户端默认 level 0），并叠加调优档位
+        level_policy = {"statsUserUplink": True, "statsUserDownlink": True}
+        tuning = build_tuning(profile) if profile else None
+        if tuning:
+            level_policy.update(tuning['policy'])
         
         config = {
             "log": {"loglevel": "warning"},
-            "nexus": {"domain": domain},  # 保存域名供后续使用
+            # 保存域名、公钥与部署参数供后续使用，避免每次从私钥重新推导
+            "nexus": {"domain": domain, "public_key": pub_key, "shards": shards, "profile": profile,
+                      "reality_dests": reality_dests},
+            "api": {
+                "tag": V2RayManager.API_TAG,
+                "services": ["HandlerService", "StatsService"]
+            },
+            "stats": {},
+            "policy": {"levels": {"0": level_policy}},
             "inbounds": [{
+                "tag": V2RayManager.INBOUND_TAG,
                 "port": 443,
                 "protocol": "vless",
                 "settings": {
-                    "clients": clients,
+                    "clients": [],
                     "decryption": "none"
                 },
                 "streamSettings": {
@@ -89,26 +128,98 @@ class V2RayManager:
                     }
                 },
                 "sniffing": {"enabled": True, "destOverride": ["http", "tls"]}
+            }, {
+                # 仅监听回环地址的 API 入口，供用户热更新使用
+                "tag": V2RayManager.API_TAG,
+                "listen": V2RayManager.API_LISTEN,
+                "port": V2RayManager.API_PORT,
+                "protocol": "dokodemo-door",
+                "settings": {"address": V2RayManager.API_LISTEN}
             }],
-            "outbounds": [{"protocol": "freedom"}]
+            "outbounds": [{"protocol": "freedom"}],
+            "routing": {
+                "rules": [{
+                    "type": "field",
+                    "inboundTag": [V2RayManager.API_TAG],
+                    "outboundTag": V2RayManager.API_TAG
+                }]
+            }
         }
         
-        sudo_makedirs(os.path.dirname(V2RayManager.CONFIG_PATH))
-        sudo_write_file(V2RayManager.CONFIG_PATH, json.dumps(config, indent=4))
-        sudo_run(["systemctl", "restart", "nexus-xray"], check=True)
+        if tuning:
+            config['inbounds'][0]['streamSettings']['sockopt'] = tuning['inbound_sockopt']
+            config['outbounds'][0]['streamSettings'] = {"sockopt": tuning['outbound_sockopt']}
+            log.info(f"已应用性能调优档位: {profile}")
+        
+        with V2RayManager._locked("create_config", domain=domain):
+            # 使用现有用户或创建默认 admin 用户
+            with V2RayManager._registry(write=True) as reg:
+                if not preserve_users:
+                    reg.clear(V2RayManager.REGISTRY_TYPE)
+                count = reg.count(V2RayManager.REGISTRY_TYPE)
+                if count:
+                    log.info(f"保留 {count} 个现有用户")
+                else:
+                    reg.add(V2RayManager.REGISTRY_TYPE, "admin", str(uuid.uuid4()), V2RayManager.FLOW)
+                uid = reg.first(V2RayManager.REGISTRY_TYPE)['uuid']  # 返回第一个用户的 UUID
+            
+                config['inbounds'][0]['settings']['clients'] = V2RayManager._render_clients(reg)
+                V2RayManager._validate(config)
+                sudo_makedirs(V2RayManager.confdir())
+                V2RayManager._write_config(config)
+            # 旧版单文件配置已迁移到 confdir，保留一份备份
+            if os.path.exists(V2RayManager.CONFIG_PATH):
+                sudo_move(V2RayManager.CONFIG_PATH, f"{V2RayManager.CONFIG_PATH}.bak")
+            V2RayManager._restart(config)
         return {"uuid": uid, "public_key": pub_key, "short_id": short_id, "sni": server_names[0], "port": 443}
 
     @staticmethod
-    def print_connection_info(domain, info, message="V2Ray 部署成功!"):
+    def get_reality_dests():
+        """返回 Reality 候选目标列表，第一个为当前 dest"""
+        cfg = V2RayManager._load_base()
+        dests = cfg.get('nexus', {}).get('reality_dests')
+        if dests:
+            return dests
+        # 旧配置没有保存候选列表：由 dest 与 serverNames 还原，其余目标默认 443 端口
+        reality_settings = cfg['inbounds'][0]['streamSettings']['realitySettings']
+        dest = reality_settings['dest']
+        return [dest] + [f"{name}:443" for name in reality_settings['serverNames']
+                         if name != dest.split(':')[0]]
+
+    @staticmethod
+    def set_reality_dests(reality_dests):
+        """按给定顺序重写 dest 与 serverNames（第一个作为 dest）并重启服务
+        
+        serverNames 始终包含全部候选，已分发的链接不受影响；
+        新生成的链接使用排在第一位的 SNI。
+        """
+        with V2RayManager._locked("set_reality_dests", dests=list(reality_dests)):
+            cfg = V2RayManager.load_config()
+            reality_settings = cfg['inbounds'][0]['streamSettings']['realitySettings']
+            reality_settings['dest'] = reality_dests[0]
+            reality_settings['serverNames'] = [dest.split(':')[0] for dest in reality_dests]
+            cfg.setdefault('nexus', {})['reality_dests'] = list(reality_dests)
+            V2RayManager._validate(cfg)
+            V2RayManager._write_config(cfg)
+            V2RayManager._restart(cfg)
+        log.success(f"Reality 目标已切换为 {reality_dests[0]}")
+
+    @staticmethod
+    def build_link(domain, info, remark="NexusVPN"):
+        """生成 vless:// 分享链接"""
         # IPv6 地址需要用方括号包裹
         if ':' in domain:
             host = f"[{domain}]"
         else:
             host = domain
-        link = (f"vless://{info['uuid']}@{host}:{info['port']}"
+        return (f"vless://{info['uuid']}@{host}:{info['port']}"
                 f"?security=reality&sni={info['sni']}&fp=chrome"
                 f"&pbk={info['public_key']}&sid={info['short_id']}"
-                f"&type=tcp&flow=xtls-rprx-vision#NexusVPN")
+                f"&type=tcp&flow=xtls-rprx-vision#{quote(remark)}")
+
+    @staticmethod
+    def print_connection_info(domain, info, message="V2Ray 部署成功!"):
+        link = V2RayManager.build_link(domain, info)
         log.success(message)
         print(f"\nURL: {link}\n")
         try:
@@ -119,72 +230,439 @@ class V2RayManager:
             pass
 
     @staticmethod
-    def add_user(username):
-        cfg_content = sudo_read_file(V2RayManager.CONFIG_PATH)
-        cfg = json.loads(cfg_content)
-        new_uid = str(uuid.uuid4())
-        cfg['inbounds'][0]['settings']['clients'].append(
-            {"id": new_uid, "flow": "xtls-rprx-vision", "email": username}
-        )
-        sudo_write_file(V2RayManager.CONFIG_PATH, json.dumps(cfg, indent=4))
-        sudo_run(["systemctl", "restart", "nexus-xray"], check=True)
-        log.success(f"V2Ray 用户 {username} 已添加。")
-        
-        # 返回用户信息用于显示二维码
+    def _public_key(cfg):
+        """读取缓存在 nexus 元数据中的公钥，旧配置没有缓存时从私钥推导"""
+        pub_key = cfg.get('nexus', {}).get('public_key')
+        if pub_key:
+            return pub_key
+        priv_key = cfg['inbounds'][0]['streamSettings']['realitySettings']['privateKey']
+        return public_key_from_private(priv_key)
+
+    @staticmethod
+    def _connection_info(cfg, user_uuid):
+        """组装客户端连接参数"""
         reality_settings = cfg['inbounds'][0]['streamSettings']['realitySettings']
-        # 从私钥推导公钥
-        priv_key = reality_settings['privateKey']
-        out = subprocess.check_output(["/usr/local/bin/xray", "x25519", "-i", priv_key]).decode()
-        pub_key = out.split('Public key:')[1].split('\n')[0].strip()
-        
         return {
-            "uuid": new_uid,
-            "public_key": pub_key,
+            "uuid": user_uuid,
+            "public_key": V2RayManager._public_key(cfg),
             "short_id": reality_settings['shortIds'][0],
             "sni": reality_settings['serverNames'][0],
             "port": cfg['inbounds'][0]['port']
         }
 
+    @staticmethod
+    def _shard_count(cfg):
+        return max(1, int(cfg.get('nexus', {}).get('shards', 1)))
+
+    @staticmethod
+    def shards_dir():
+        return os.path.join(os.path.dirname(V2RayManager.CONFIG_PATH), "shards")
+
+    @staticmethod
+    def service_units(cfg):
+        """返回承载该配置的 systemd 单元名"""
+        shards = V2RayManager._shard_count(cfg)
+        if shards > 1:
+            return [f"nexus-xray@{i}" for i in range(shards)]
+        return ["nexus-xray"]
+
+    @staticmethod
+    def _render_shard(cfg, index):
+        """由主配置派生第 index 个分片：只改 VLESS 与 API 端口，用户和密钥完全一致"""
+        shard = json.loads(json.dumps(cfg))
+        shard['inbounds'][0]['port'] = V2RayManager.SHARD_BASE_PORT + index
+        for inbound in shard['inbounds']:
+            if inbound.get('tag') == V2RayManager.API_TAG:
+                inbound['port'] = V2RayManager.API_PORT + index
+        return shard
+
+    @staticmethod
+    def confdir():
+        return os.path.join(os.path.dirname(V2RayManager.CONFIG_PATH), "conf.d")
+
+    @staticmethod
+    def config_exists():
+        return (os.path.exists(os.path.join(V2RayManager.confdir(), V2RayManager.BASE_FILE))
+                or os.path.exists(V2RayManager.CONFIG_PATH))
+
+    @staticmethod
+    def _read_clients():
+        """从 Xray 配置文件读取 clients 数组（仅用于初始化注册表）"""
+        inbound_path = os.path.join(V2RayManager.confdir(), V2RayManager.INBOUND_FILE)
+        if os.path.exists(inbound_path):
+            inbounds = json.loads(sudo_read_file(inbound_path))['inbounds']
+        else:
+            inbounds = json.loads(sudo_read_file(V2RayManager.CONFIG_PATH))['inbounds']
+        return inbounds[0].get('settings', {}).get('clients', [])
+
+    @staticmethod
+    @contextmanager
+    def _registry(write=False):
+        """打开用户注册表；注册表中还没有 V2Ray 用户时从现有配置导入一次"""
+        with UserRegistry.open(write=write) as reg:
+            V2RayManager._bootstrap(reg)
+            yield reg
+
+    @staticmethod
+    def _bootstrap(reg):
+        if not reg.count(V2RayManager.REGISTRY_TYPE) and V2RayManager.config_exists():
+            clients = V2RayManager._read_clients()
+            # 旧版 add_user 不查重，重复的用户名/UUID 只保留第一个
+            imported = reg.import_users(V2RayManager.REGISTRY_TYPE, (
+                {"username": c.get('email'), "uuid": c.get('id'), "flow": c.get('flow')} for c in clients))
+            if imported:
+                log.info(f"已从 Xray 配置导入 {imported} 个用户到注册表")
+
+    @staticmethod
+    def _render_clients(reg):
+        """由注册表渲染 Xray 的 clients 数组"""
+        clients = []
+        for user in reg.iter_users(V2RayManager.REGISTRY_TYPE):
+            client = {"id": user['uuid'], "email": user['username']}
+            if user['flow']:
+                client['flow'] = user['flow']
+            clients.append(client)
+        return clients
+
+    @staticmethod
+    def _load_base():
+        """读取除用户列表以外的配置，inbounds[0] 为 clients 为空的 VLESS 入站
+        
+        confdir 布局下 VLESS 入站模板保存在基础配置的 nexus.inbound 中，
+        无需解析包含全部用户的入站文件；旧版单文件配置则整体读取。
+        """
+        confdir = V2RayManager.confdir()
+        base_path = os.path.join(confdir, V2RayManager.BASE_FILE)
+        if not os.path.exists(base_path):
+            cfg = json.loads(sudo_read_file(V2RayManager.CONFIG_PATH))
+            cfg['inbounds'][0].setdefault('settings', {})['clients'] = []
+            return cfg
+        base = json.loads(sudo_read_file(base_path))
+        template = base.get('nexus', {}).pop('inbound', None)
+        if template is None:
+            inbound = json.loads(sudo_read_file(os.path.join(confdir, V2RayManager.INBOUND_FILE)))
+            template = inbound['inbounds'][0]
+            template['settings']['clients'] = []
+        base['inbounds'] = [template] + base.get('inbounds', [])
+        return base
+
+    @staticmethod
+    def load_config():
+        """读取完整配置（VLESS 入站固定为 inbounds[0]，clients 由注册表渲染）"""
+        cfg = V2RayManager._load_base()
+        with V2RayManager._registry() as reg:
+            cfg['inbounds'][0]['settings']['clients'] = V2RayManager._render_clients(reg)
+        return cfg
+
+    @staticmethod
+    def _write_confdir(confdir, cfg, users_only=False):
+        """把完整配置拆成基础配置和 VLESS 入站两个文件写入 confdir
+        
+        Xray 合并 confdir 时同 tag 的入站整体替换，无法只合并 clients，
+        因此用户列表随 VLESS 入站一起写入，紧凑格式以减小重写量；
+        基础配置另存一份不含用户的入站模板，供读取时跳过用户列表。
+        """
+        inbounds = cfg.get('inbounds', [])
+        V2RayManager._replace_file(os.path.join(confdir, V2RayManager.INBOUND_FILE),
+                                   json.dumps({"inbounds": inbounds[:1]}, separators=(",", ":")))
+        if not users_only:
+            template = dict(inbounds[0], settings=dict(inbounds[0]['settings'], clients=[]))
+            base = dict(cfg, inbounds=inbounds[1:], nexus=dict(cfg.get('nexus', {}), inbound=template))
+            V2RayManager._replace_file(os.path.join(confdir, V2RayManager.BASE_FILE), json.dumps(base, indent=4))
+
+    @staticmethod
+    def _replace_file(path, content):
+        """先写临时文件再 rename，Xray 启动时不会读到写了一半的配置"""
+        # 临时文件不以 .json 结尾，不会被 -confdir 加载
+        tmp = f"{path}.tmp"
+        sudo_write_file(tmp, content)
+        sudo_move(tmp, path)
+
+    @staticmethod
+    def _config_dir(suffix):
+        return os.path.join(os.path.dirname(V2RayManager.CONFIG_PATH), f"conf.d.{suffix}")
+
+    @staticmethod
+    def _validate(cfg):
+        """在暂存目录中渲染候选配置，用 xray run -test 校验，未通过时抛出 XrayConfigError"""
+        if not os.path.exists(V2RayManager.XRAY_BIN):
+            log.warning(f"未找到 {V2RayManager.XRAY_BIN}，跳过配置校验")
+            return
+        staging = V2RayManager._config_dir("staging")
+        sudo_remove(staging)
+        sudo_makedirs(staging)
+        try:
+            V2RayManager._write_confdir(staging, cfg)
+            result = sudo_run([V2RayManager.XRAY_BIN, "run", "-test", "-confdir", staging],
+                              capture_output=True, text=True)
+        finally:
+            sudo_remove(staging)
+        if result.returncode != 0:
+            output = (result.stdout or "") + (result.stderr or "")
+            raise XrayConfigError(f"Xray 配置校验失败，未做任何改动:\n{output.strip()}")
+
+    @staticmethod
+    def _write_config(cfg, users_only=False):
+        """写入配置；分片模式下同时渲染每个分片的 confdir
+        
+        users_only=True 表示只有用户列表变化，基础配置文件保持不动。
+        尚未迁移到 confdir 的旧部署（由 install 迁移）仍整体写回 config.json。
+        """
+        confdir = V2RayManager.confdir()
+        if not os.path.isdir(confdir):
+            V2RayManager._replace_file(V2RayManager.CONFIG_PATH, json.dumps(cfg, indent=4))
+            return
+        V2RayManager._write_confdir(confdir, cfg, users_only)
+        shards = V2RayManager._shard_count(cfg)
+        if shards > 1:
+            for i in range(shards):
+                shard_dir = os.path.join(V2RayManager.shards_dir(), str(i))
+                sudo_makedirs(shard_dir)
+                V2RayManager._write_confdir(shard_dir, V2RayManager._render_shard(cfg, i), users_only)
+
+    @staticmethod
+    def get_shard_count():
+        """读取当前部署的 Xray 实例数，未部署时返回 1"""
+        try:
+            cfg = V2RayManager._load_base()
+            return V2RayManager._shard_count(cfg)
+        except Exception:
+            return 1
+
+    @staticmethod
+    def _listen_ports(cfg):
+        """每个单元对应的 VLESS 监听端口，与 service_units 顺序一致"""
+        shards = V2RayManager._shard_count(cfg)
+        if shards > 1:
+            return [V2RayManager.SHARD_BASE_PORT + i for i in range(shards)]
+        return [cfg['inbounds'][0]['port']]
+
+    @staticmethod
+    def _healthy(unit, port):
+        """单元处于 active 且监听端口可连接"""
+        deadline = time.monotonic() + V2RayManager.HEALTH_TIMEOUT
+        while True:
+            active = subprocess.run(["systemctl", "is-active", "--quiet", unit]).returncode == 0
+            if active:
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                    return True
+                except OSError:
+                    pass
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.2)
+
+    @staticmethod
+    def _restart(cfg):
+        """逐个重启实例并做健康检查，全部通过后记为最近一次可用配置
+        
+        Xray 不支持热重载配置，分片模式下逐个重启，任一时刻只有一个实例不可用。
+        任一实例检查失败时回滚到上一次可用配置并抛出 XrayConfigError。
+        """
+        for unit, port in zip(V2RayManager.service_units(cfg), V2RayManager._listen_ports(cfg)):
+            sudo_run(["systemctl", "restart", unit], check=True)
+            if not V2RayManager._healthy(unit, port):
+                V2RayManager._rollback(cfg)
+                raise XrayConfigError(f"{unit} 重启后端口 {port} 未恢复，已回滚到上一次可用配置")
+        last_good = V2RayManager._config_dir("last-good")
+        sudo_makedirs(last_good)
+        V2RayManager._write_confdir(last_good, cfg)
+
+    @staticmethod
+    def _rollback(cfg):
+        """恢复最近一次通过健康检查的配置并重启"""
+        last_good = V2RayManager._config_dir("last-good")
+        base_path = os.path.join(last_good, V2RayManager.BASE_FILE)
+        if not os.path.exists(base_path):
+            log.error("没有可回滚的配置，请检查 journalctl -u nexus-xray")
+            return
+        good = json.loads(sudo_read_file(base_path))
+        good.get('nexus', {}).pop('inbound', None)
+        inbound = json.loads(sudo_read_file(os.path.join(last_good, V2RayManager.INBOUND_FILE)))
+        good['inbounds'] = inbound['inbounds'] + good.get('inbounds', [])
+        V2RayManager._write_config(good)
+        units = V2RayManager.service_units(good)
+        # 已下线的分片不再重启
+        stale = [u for u in V2RayManager.service_units(cfg) if u not in units]
+        if stale:
+            sudo_run(["systemctl", "stop"] + stale)
+        sudo_run(["systemctl", "restart"] + units)
+        log.warning("已回滚到上一次可用配置（用户注册表不受影响，下次写入时重新生成用户列表）")
+
+    @staticmethod
+    def _api_addresses(cfg):
+        """返回每个 Xray 实例的 API 地址，未启用 API 时返回空列表"""
+        for inbound in cfg.get('inbounds', []):
+            if inbound.get('tag') == V2RayManager.API_TAG:
+                host = inbound.get('listen', V2RayManager.API_LISTEN)
+                shards = V2RayManager._shard_count(cfg)
+                if shards > 1:
+                    return [f"{host}:{V2RayManager.API_PORT + i}" for i in range(shards)]
+                return [f"{host}:{inbound['port']}"]
+        return []
+
+    @staticmethod
+    def get_api_addresses():
+        """读取当前配置中所有实例的 API 地址"""
+        cfg = V2RayManager._load_base()
+        return V2RayManager._api_addresses(cfg)
+
+    @staticmethod
+    def _apply_user_changes(cfg, added=(), removed=()):
+        """把已写入配置文件的用户变更同步到运行中的每个 Xray 实例
+        
+        优先通过 gRPC API 热更新（不断开现有连接），
+        旧配置未启用 API 或任一实例调用失败时回退到重启服务。
+        """
+        addresses = V2RayManager._api_addresses(cfg)
+        tag = cfg['inbounds'][0].get('tag')
+        if addresses and tag:
+            try:
+                for address in addresses:
+                    with XrayApiClient(address) as api:
+                        for email in removed:
+                            api.remove_user(tag, email)
+                        for client in added:
+                            api.add_user(tag, client)
+                return
+            except XrayApiError as e:
+                log.warning(f"API 热更新失败，回退到重启服务: {e}")
+        try:
+            V2RayManager._restart(cfg)
+        except XrayConfigError as e:
+            log.error(str(e))
+
+    @staticmethod
+    def _write_users(cfg, reg):
+        """把注册表中的用户渲染进配置并写入（只重写用户所在的文件）"""
+        cfg['inbounds'][0]['settings']['clients'] = V2RayManager._render_clients(reg)
+        V2RayManager._write_config(cfg, users_only=True)
+
+    @staticmethod
+    def _locked(op, **details):
+        """持有 Xray 配置锁执行一次会改写配置的操作，并发的进程在此排队"""
+        return LockManager.transaction(V2RayManager.LOCK_RESOURCE, V2RayManager._recover, op, **details)
+
+    @staticmethod
+    def _recover(entry, interrupted):
+        """由注册表重新生成用户配置文件；重放崩溃进程的日志时还要重启，使运行中的实例与配置一致
+
+        旧版单文件配置只会被整体原子替换，本进程内的异常不会留下写了一半的文件。
+        """
+        if not V2RayManager.config_exists():
+            return
+        if not interrupted and not os.path.isdir(V2RayManager.confdir()):
+            return
+        cfg = V2RayManager._load_base()
+        with V2RayManager._registry() as reg:
+            V2RayManager._write_users(cfg, reg)
+        if interrupted:
+            try:
+                V2RayManager._restart(cfg)
+            except XrayConfigError as e:
+                log.error(str(e))
+
+    @staticmethod
+    def add_user(username):
+        with V2RayManager._locked("add_user", users=[username]):
+            cfg = V2RayManager._load_base()
+            with V2RayManager._registry(write=True) as reg:
+                if reg.get(V2RayManager.REGISTRY_TYPE, username):
+                    log.error(f"V2Ray 用户 {username} 已存在")
+                    return None
+                new_uid = str(uuid.uuid4())
+                reg.add(V2RayManager.REGISTRY_TYPE, username, new_uid, V2RayManager.FLOW)
+                # 顺便为旧配置补上公钥缓存
+                cfg.setdefault('nexus', {})['public_key'] = V2RayManager._public_key(cfg)
+                V2RayManager._write_users(cfg, reg)
+            client = {"id": new_uid, "flow": V2RayManager.FLOW, "email": username}
+            V2RayManager._apply_user_changes(cfg, added=[client])
+        log.success(f"V2Ray 用户 {username} 已添加。")
+        
+        # 返回用户信息用于显示二维码
+        return V2RayManager._connection_info(cfg, new_uid)
+
     @staticmethod
     def get_user_info(username):
         """获取指定用户的连接信息"""
-        cfg_content = sudo_read_file(V2RayManager.CONFIG_PATH)
-        cfg = json.loads(cfg_content)
-        clients = cfg['inbounds'][0]['settings']['clients']
-        
-        # 查找用户
-        user_uuid = None
-        for c in clients:
-            if c.get('email') == username:
-                user_uuid = c.get('id')
-                break
-        
-        if not user_uuid:
+        with V2RayManager._registry() as reg:
+            user = reg.get(V2RayManager.REGISTRY_TYPE, username)
+        if not user:
             return None
+        return V2RayManager._connection_info(V2RayManager._load_base(), user['uuid'])
+
+    @staticmethod
+    def remove_user(username):
+        with V2RayManager._locked("remove_user", users=[username]):
+            cfg = V2RayManager._load_base()
+            with V2RayManager._registry(write=True) as reg:
+                if not reg.remove(V2RayManager.REGISTRY_TYPE, [username]):
+                    return
+                V2RayManager._write_users(cfg, reg)
+            V2RayManager._apply_user_changes(cfg, removed=[username])
+        log.success(f"V2Ray 用户 {username} 已删除。")
+
+    @staticmethod
+    def update_users(add=(), remove=()):
+        """批量增删用户：整批只读写一次配置、只热更新/重启一次
         
-        # 获取连接参数
-        reality_settings = cfg['inbounds'][0]['streamSettings']['realitySettings']
-        priv_key = reality_settings['privateKey']
-        out = subprocess.check_output(["/usr/local/bin/xray", "x25519", "-i", priv_key]).decode()
-        pub_key = out.split('Public key:')[1].split('\n')[0].strip()
+        已存在的用户不会重复添加，不存在的用户删除时被忽略。
         
+        Returns:
+            tuple: ({新增用户名: 连接信息}, [实际删除的用户名])
+        """
+        with V2RayManager._locked("update_users", add=len(add), remove=len(remove)):
+            cfg = V2RayManager._load_base()
+            with V2RayManager._registry(write=True) as reg:
+                removed = reg.remove(V2RayManager.REGISTRY_TYPE, remove)
+                added = []
+                for username in add:
+                    if reg.get(V2RayManager.REGISTRY_TYPE, username):
+                        log.warning(f"V2Ray 用户 {username} 已存在，跳过")
+                        continue
+                    client = {"id": str(uuid.uuid4()), "flow": V2RayManager.FLOW, "email": username}
+                    reg.add(V2RayManager.REGISTRY_TYPE, username, client['id'], client['flow'])
+                    added.append(client)
+                if not added and not removed:
+                    return {}, []
+                cfg.setdefault('nexus', {})['public_key'] = V2RayManager._public_key(cfg)
+                V2RayManager._write_users(cfg, reg)
+            V2RayManager._apply_user_changes(cfg, added=added, removed=removed)
+        log.success(f"V2Ray 用户批量更新完成: 新增 {len(added)} 个，删除 {len(removed)} 个。")
+        return {c['email']: V2RayManager._connection_info(cfg, c['id']) for c in added}, removed
+
+    @staticmethod
+    def get_clients():
+        """按添加顺序返回所有用户 [(用户名, UUID)]"""
+        with V2RayManager._registry() as reg:
+            return [(u['username'], u['uuid']) for u in reg.iter_users(V2RayManager.REGISTRY_TYPE)]
+
+    @staticmethod
+    def get_all_user_info():
+        """获取所有用户的连接信息 {用户名: 连接信息}"""
+        cfg = V2RayManager._load_base()
         return {
-            "uuid": user_uuid,
-            "public_key": pub_key,
-            "short_id": reality_settings['shortIds'][0],
-            "sni": reality_settings['serverNames'][0],
-            "port": cfg['inbounds'][0]['port']
+            username: V2RayManager._connection_info(cfg, user_uuid)
+            for username, user_uuid in V2RayManager.get_clients()
         }
 
     @staticmethod
-    def remove_user(username):
-        cfg_content = sudo_read_file(V2RayManager.CONFIG_PATH)
-        cfg = json.loads(cfg_content)
-        clients = cfg['inbounds'][0]['settings']['clients']
-        new_clients = [c for c in clients if c.get('email') != username]
-        if len(clients) == len(new_clients):
-            return
-        cfg['inbounds'][0]['settings']['clients'] = new_clients
-        sudo_write_file(V2RayManager.CONFIG_PATH, json.dumps(cfg, indent=4))
-        sudo_run(["systemctl", "restart", "nexus-xray"], check=True)
-        log.success(f"V2Ray 用户 {username} 已删除。")
+    def write_share_files(domain, infos, output_dir, image_format="svg", workers=None, prune=False, removed=()):
+        """把每个用户的分享链接与二维码写入 output_dir
+        
+        每个用户生成 <用户名>.txt（链接）和 <用户名>.svg/.png（二维码），
+        另外汇总一份 links.txt。链接未变化的用户跳过，其余并行渲染。
+        removed 中的用户从 links.txt 中去掉并删除其文件。
+        
+        Returns:
+            int: 写入的用户数
+        """
+        links = {
+            username: V2RayManager.build_link(domain, info, remark=username)
+            for username, info in infos.items()
+        }
+        rendered, skipped = render_share_files(links, output_dir, image_format, workers, prune, removed)
+        if skipped:
+            log.info(f"重新生成 {rendered} 个用户的二维码，{skipped} 个未变化已跳过")
+        return len(links)
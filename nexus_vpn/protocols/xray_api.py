@@ -0,0 +1,153 @@
+"""Xray gRPC API 客户端
+
+只用到 HandlerService 与 StatsService 中的少数几个方法，因此直接按 protobuf
+线格式手工编码消息，避免引入 protoc 生成的桩代码。
+"""
+import grpc
+
+HANDLER_SERVICE = "xray.app.proxyman.command.HandlerService"
+STATS_SERVICE = "xray.app.stats.command.StatsService"
+
+ADD_USER_OPERATION = "xray.app.proxyman.command.AddUserOperation"
+REMOVE_USER_OPERATION = "xray.app.proxyman.command.RemoveUserOperation"
+VLESS_ACCOUNT = "xray.proxy.vless.Account"
+
+
+class XrayApiError(Exception):
+    """调用 Xray API 失败"""
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _field_bytes(number, data):
+    """编码 length-delimited 字段（string / bytes / 嵌套消息）"""
+    if isinstance(data, str):
+        data = data.encode()
+    return _varint(number << 3 | 2) + _varint(len(data)) + data
+
+
+def _field_varint(number, value):
+    return _varint(number << 3) + _varint(value)
+
+
+def _typed_message(type_name, value):
+    """xray.common.serial.TypedMessage"""
+    return _field_bytes(1, type_name) + _field_bytes(2, value)
+
+
+def _read_varint(buf, pos):
+    result = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(buf):
+    """遍历消息中的 (字段号, 值)，只支持 varint 与 length-delimited"""
+    pos = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            value = bytes(buf[pos:pos + length])
+            pos += length
+        else:
+            raise XrayApiError(f"不支持的 protobuf 类型: {wire_type}")
+        yield number, value
+
+
+def encode_add_user(tag, client):
+    """AlterInboundRequest{tag, AddUserOperation{User{email, level, vless.Account}}}"""
+    account = _field_bytes(1, client['id'])
+    if client.get('flow'):
+        account += _field_bytes(2, client['flow'])
+    account += _field_bytes(3, "none")
+    user = _field_varint(1, client.get('level', 0))
+    user += _field_bytes(2, client['email'])
+    user += _field_bytes(3, _typed_message(VLESS_ACCOUNT, account))
+    operation = _field_bytes(1, user)
+    return _field_bytes(1, tag) + _field_bytes(2, _typed_message(ADD_USER_OPERATION, operation))
+
+
+def encode_remove_user(tag, email):
+    """AlterInboundRequest{tag, RemoveUserOperation{email}}"""
+    operation = _field_bytes(1, email)
+    return _field_bytes(1, tag) + _field_bytes(2, _typed_message(REMOVE_USER_OPERATION, operation))
+
+
+def encode_query_stats(pattern, reset=False):
+    """QueryStatsRequest{pattern, reset}"""
+    msg = _field_bytes(1, pattern)
+    if reset:
+        msg += _field_varint(2, 1)
+    return msg
+
+
+def decode_query_stats(data):
+    """QueryStatsResponse{repeated Stat{name, value}} -> {name: value}"""
+    stats = {}
+    for number, value in _iter_fields(data):
+        if number != 1:
+            continue
+        name, count = "", 0
+        for sub_number, sub_value in _iter_fields(value):
+            if sub_number == 1:
+                name = sub_value.decode()
+            elif sub_number == 2:
+                count = sub_value
+        stats[name] = count
+    return stats
+
+
+class XrayApiClient:
+    """Xray API 的最小客户端，配合 `with` 使用以确保关闭连接"""
+
+    def __init__(self, address, timeout=5):
+        self.address = address
+        self.timeout = timeout
+        self._channel = grpc.insecure_channel(address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self._channel.close()
+
+    def _call(self, service, method, payload):
+        rpc = self._channel.unary_unary(f"/{service}/{method}")
+        try:
+            return rpc(payload, timeout=self.timeout)
+        except grpc.RpcError as e:
+            raise XrayApiError(f"{method}: {e.code().name} {e.details()}") from e
+
+    def add_user(self, tag, client):
+        self._call(HANDLER_SERVICE, "AlterInbound", encode_add_user(tag, client))
+
+    def remove_user(self, tag, email):
+        self._call(HANDLER_SERVICE, "AlterInbound", encode_remove_user(tag, email))
+
+    def query_stats(self, pattern, reset=False):
+        """一次批量查询所有名称匹配 pattern 的计数器，reset=True 时读后清零"""
+        data = self._call(STATS_SERVICE, "QueryStats", encode_query_stats(pattern, reset))
+        return decode_query_stats(data)
@@ -0,0 +1,82 @@
+"""Xray 性能调优档位
+
+每个档位给出 policy（握手/空闲超时、单连接缓冲）与 sockopt（TFO、keepalive、
+拥塞控制、mark）的取值。单连接缓冲按 “可分给 Xray 的内存 / 预估并发连接数”
+计算，预估并发连接数随 CPU 核数增长，因此同一档位在不同规格主机上取值不同。
+"""
+from nexus_vpn.utils.host import total_memory_bytes, cpu_count, available_congestion_controls
+
+# 出站连接的 SO_MARK，便于防火墙/策略路由识别代理流量
+SOCKET_MARK = 0x4E58
+
+PROFILES = {
+    # 大带宽服务器：较大缓冲，快速回收空闲连接
+    "high-throughput": {
+        "handshake": 4, "connIdle": 300, "uplinkOnly": 2, "downlinkOnly": 5,
+        "mem_fraction": 0.5, "conns_per_core": 1024, "buffer_kb": (64, 1024),
+        "keepalive": (300, 60),
+    },
+    # 小内存 VPS：限制单连接缓冲，尽快释放半关闭连接
+    "low-memory": {
+        "handshake": 4, "connIdle": 120, "uplinkOnly": 1, "downlinkOnly": 1,
+        "mem_fraction": 0.15, "conns_per_core": 1024, "buffer_kb": (4, 64),
+        "keepalive": (120, 30),
+    },
+    # 移动网络：握手更宽容，长空闲保活，较短的 keepalive 防止 NAT 超时
+    "mobile": {
+        "handshake": 8, "connIdle": 600, "uplinkOnly": 5, "downlinkOnly": 10,
+        "mem_fraction": 0.35, "conns_per_core": 1024, "buffer_kb": (32, 512),
+        "keepalive": (30, 15),
+    },
+}
+
+
+def buffer_size_kb(profile, mem_bytes, cpus):
+    """按内存与核数计算单连接缓冲（KB），上下行各占一份"""
+    spec = PROFILES[profile]
+    low, high = spec["buffer_kb"]
+    if not mem_bytes:
+        return low
+    budget_kb = mem_bytes * spec["mem_fraction"] / 1024
+    conns = max(1, cpus) * spec["conns_per_core"]
+    return int(max(low, min(high, budget_kb / (conns * 2))))
+
+
+def build_tuning(profile, mem_bytes=None, cpus=None, congestion_controls=None):
+    """生成档位对应的配置片段
+
+    只有内核可用 bbr 时才设置 tcpcongestion，否则沿用系统默认算法
+    （未加载 tcp_bbr 模块时 Xray 设置该选项会失败）。
+
+    Returns:
+        dict: {"policy": level 0 策略, "inbound_sockopt": ..., "outbound_sockopt": ...}
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"未知的调优档位: {profile}")
+    spec = PROFILES[profile]
+    if mem_bytes is None:
+        mem_bytes = total_memory_bytes()
+    if cpus is None:
+        cpus = cpu_count()
+    if congestion_controls is None:
+        congestion_controls = available_congestion_controls()
+
+    idle, interval = spec["keepalive"]
+    sockopt = {
+        "tcpFastOpen": True,
+        "tcpKeepAliveIdle": idle,
+        "tcpKeepAliveInterval": interval,
+    }
+    if "bbr" in congestion_controls:
+        sockopt["tcpcongestion"] = "bbr"
+    return {
+        "policy": {
+            "handshake": spec["handshake"],
+            "connIdle": spec["connIdle"],
+            "uplinkOnly": spec["uplinkOnly"],
+            "downlinkOnly": spec["downlinkOnly"],
+            "bufferSize": buffer_size_kb(profile, mem_bytes, cpus),
+        },
+        "inbound_sockopt": dict(sockopt),
+        "outbound_sockopt": dict(sockopt, mark=SOCKET_MARK),
+    }
@@ -0,0 +1,159 @@
+"""带缓存、校验与断点续传的下载
+
+下载结果按 sha256 存放在缓存目录（<cache_dir>/sha256/<摘要>），同一文件只下载一次，
+多台服务器可以共享同一个缓存目录（例如 NFS）。期望的摘要取自发布页的 .dgst 文件，
+未完成的下载保存为 <cache_dir>/partial/<摘要>.part，重试或下次执行时用 HTTP Range 续传。
+"""
+import os
+import re
+import time
+import fcntl
+import hashlib
+import http.client
+import urllib.error
+import urllib.request
+from nexus_vpn.utils.logger import log
+from nexus_vpn.utils.sudo import need_sudo, sudo_makedirs, sudo_grant_group
+
+DEFAULT_CACHE_DIR = "/var/cache/nexus-vpn"
+USER_AGENT = "NexusVPN"
+CHUNK_SIZE = 1 << 16
+RETRIES = 4
+# 第 n 次重试前等待 BACKOFF * 2**(n-1) 秒
+BACKOFF = 1.0
+TIMEOUT = 30
+
+# Xray 的 .dgst 文件: "SHA2-256= <hex>"；也兼容 sha256sum 的 "<hex>  文件名"
+DIGEST_RE = re.compile(r"^\s*(?:SHA2?-?256\s*=\s*)?([0-9a-fA-F]{64})\b", re.MULTILINE)
+
+
+class DownloadError(Exception):
+    """下载失败或校验不通过"""
+
+
+def parse_digest(text):
+    """从摘要文件中取出 sha256（小写十六进制），找不到时抛出 DownloadError"""
+    m = DIGEST_RE.search(text)
+    if not m:
+        raise DownloadError("摘要文件中没有 SHA-256")
+    return m.group(1).lower()
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _ensure_dir(directory):
+    if os.access(directory, os.W_OK | os.X_OK):
+        return
+    sudo_makedirs(directory)
+    if need_sudo():
+        sudo_grant_group(directory, "g+rwxs")
+
+
+def _retry(action, description, retries=None, backoff=None):
+    """失败时按指数退避重试；客户端错误（4xx，超时与限流除外）不重试"""
+    retries = RETRIES if retries is None else retries
+    backoff = BACKOFF if backoff is None else backoff
+    for attempt in range(1, retries + 1):
+        try:
+            return action()
+        except urllib.error.HTTPError as e:
+            if 400 <= e.code < 500 and e.code not in (408, 429):
+                raise DownloadError(f"{description}失败: HTTP {e.code}") from e
+            error = e
+        except (OSError, http.client.HTTPException, DownloadError) as e:
+            error = e
+        if attempt < retries:
+            delay = backoff * 2 ** (attempt - 1)
+            log.warning(f"{description}失败（{error}），{delay:g} 秒后重试 ({attempt}/{retries - 1})")
+            time.sleep(delay)
+    raise DownloadError(f"{description}失败: {error}")
+
+
+def fetch_text(url, retries=None, backoff=None):
+    """下载小文件（摘要文件）并返回文本"""
+    def action():
+        req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(req, timeout=TIMEOUT) as resp:
+            return resp.read().decode()
+    return _retry(action, f"下载 {url} ", retries, backoff)
+
+
+def _fetch_range(url, part_path):
+    """把 url 下载到 part_path，已有部分用 Range 续传；连接中断时抛出异常，已收到的数据保留"""
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"User-Agent": USER_AGENT}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+    try:
+        resp = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=TIMEOUT)
+    except urllib.error.HTTPError as e:
+        # 已下载部分就是完整文件
+        if e.code == 416 and offset:
+            return
+        raise
+    with resp:
+        if offset and resp.status != 206:
+            log.info("服务器不支持断点续传，重新下载")
+            offset = 0
+        elif offset:
+            log.info(f"从 {offset} 字节处续传")
+        expected = resp.headers.get("Content-Length")
+        received = 0
+        with open(part_path, "ab" if offset else "wb") as f:
+            for chunk in iter(lambda: resp.read(CHUNK_SIZE), b""):
+                f.write(chunk)
+                received += len(chunk)
+    if expected is not None and received < int(expected):
+        raise DownloadError(f"连接中断（收到 {received}/{expected} 字节）")
+
+
+def fetch_verified(url, digest_url=None, sha256=None, cache_dir=None, retries=None, backoff=None):
+    """下载 url 并校验 sha256，返回缓存中的文件路径
+
+    Args:
+        url: 下载地址
+        digest_url: 摘要文件地址，默认为 url + ".dgst"（sha256 已知时不下载）
+        sha256: 期望的摘要
+        cache_dir: 缓存目录，默认 DEFAULT_CACHE_DIR
+    """
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    if not sha256:
+        sha256 = parse_digest(fetch_text(digest_url or f"{url}.dgst", retries, backoff))
+    sha256 = sha256.lower()
+
+    blob_dir = os.path.join(cache_dir, "sha256")
+    partial_dir = os.path.join(cache_dir, "partial")
+    for directory in (cache_dir, blob_dir, partial_dir):
+        _ensure_dir(directory)
+    blob = os.path.join(blob_dir, sha256)
+    part = os.path.join(partial_dir, f"{sha256}.part")
+
+    # 共享缓存时同一文件只由一个进程下载，其他进程等待后直接使用缓存
+    fd = os.open(f"{part}.lock", os.O_RDONLY | os.O_CREAT, 0o664)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if os.path.exists(blob):
+            if sha256_file(blob) == sha256:
+                log.info(f"使用缓存: {blob}")
+                return blob
+            log.warning(f"缓存文件 {blob} 已损坏，重新下载")
+            os.remove(blob)
+
+        def action():
+            _fetch_range(url, part)
+            actual = sha256_file(part)
+            if actual != sha256:
+                os.remove(part)
+                raise DownloadError(f"SHA-256 校验失败: 期望 {sha256}，实际 {actual}")
+
+        _retry(action, f"下载 {url} ", retries, backoff)
+        os.replace(part, blob)
+        return blob
+    finally:
+        os.close(fd)
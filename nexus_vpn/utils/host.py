@@ -0,0 +1,27 @@
+"""主机资源探测"""
+import os
+
+
+def total_memory_bytes():
+    """物理内存总量（字节），无法获取时返回 0"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def cpu_count():
+    """当前进程可用的 CPU 核数"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def available_congestion_controls(path="/proc/sys/net/ipv4/tcp_available_congestion_control"):
+    """内核当前可用的 TCP 拥塞控制算法，无法读取时返回空列表"""
+    try:
+        with open(path) as f:
+            return f.read().split()
+    except OSError:
+        return []
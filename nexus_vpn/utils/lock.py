@@ -0,0 +1,122 @@
+"""按资源加锁与操作日志
+
+每种资源（xray 配置、ipsec.secrets、PKI）一个 flock 咨询锁，并发的 nexus-vpn 进程
+只在操作同一资源时排队。持锁期间先写入一条操作日志，正常结束后删除；
+进程中途崩溃会留下日志，下一个取得该资源锁的进程先调用恢复函数
+（由注册表重新渲染配置文件并重载服务）再继续，已提交的变更被重放，
+未提交的变更被回滚。
+"""
+import os
+import json
+import time
+import fcntl
+from contextlib import contextmanager
+from nexus_vpn.utils.logger import log
+from nexus_vpn.utils.sudo import need_sudo, sudo_makedirs, sudo_grant_group
+
+
+class LockTimeout(Exception):
+    """等待资源锁超时"""
+
+
+class LockManager:
+    LOCK_DIR = "/etc/nexus-vpn/locks"
+    # 等待其他进程释放锁的秒数
+    TIMEOUT = 300
+    POLL_INTERVAL = 0.1
+
+    @staticmethod
+    def _ensure_dir():
+        directory = LockManager.LOCK_DIR
+        if os.access(directory, os.W_OK | os.X_OK):
+            return
+        sudo_makedirs(directory)
+        if need_sudo():
+            sudo_grant_group(directory, "g+rwxs")
+
+    @staticmethod
+    def _path(resource, suffix):
+        return os.path.join(LockManager.LOCK_DIR, f"{resource}.{suffix}")
+
+    @staticmethod
+    @contextmanager
+    def lock(resource, timeout=None):
+        """独占 resource 的咨询锁，timeout 秒内未取得时抛出 LockTimeout"""
+        LockManager._ensure_dir()
+        timeout = LockManager.TIMEOUT if timeout is None else timeout
+        # flock 只需要读权限，root 创建的锁文件其他用户也能加锁
+        fd = os.open(LockManager._path(resource, "lock"), os.O_RDONLY | os.O_CREAT, 0o664)
+        try:
+            deadline = time.monotonic() + timeout
+            waiting = False
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise LockTimeout(f"等待 {resource} 锁超时（{timeout} 秒），其他 nexus-vpn 进程仍在运行")
+                    if not waiting:
+                        log.info(f"等待其他 nexus-vpn 进程释放 {resource} 锁...")
+                        waiting = True
+                    time.sleep(LockManager.POLL_INTERVAL)
+            yield
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def read_journal(resource):
+        try:
+            with open(LockManager._path(resource, "journal")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_journal(resource, entry):
+        path = LockManager._path(resource, "journal")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _clear_journal(resource):
+        try:
+            os.remove(LockManager._path(resource, "journal"))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    @contextmanager
+    def transaction(resource, recover, op, **details):
+        """在 resource 锁内执行一次操作
+
+        Args:
+            resource: 资源名
+            recover: 恢复函数 recover(entry, interrupted)，使资源文件与注册表一致；
+                interrupted=True 表示重放其他进程崩溃时留下的日志，
+                False 表示本进程的操作抛出了异常
+            op: 操作名，与 details 一起记入日志
+        """
+        with LockManager.lock(resource):
+            pending = LockManager.read_journal(resource)
+            if pending:
+                log.warning(f"发现未完成的 {resource} 操作（{pending.get('op')}，pid {pending.get('pid')}），正在恢复...")
+                recover(pending, True)
+                LockManager._clear_journal(resource)
+            entry = dict(details, op=op, pid=os.getpid(), started_at=int(time.time()))
+            LockManager._write_journal(resource, entry)
+            try:
+                yield entry
+            except BaseException:
+                # 注册表事务已回滚，把可能写了一半的文件恢复到注册表的状态
+                try:
+                    recover(entry, False)
+                    LockManager._clear_journal(resource)
+                except Exception as e:
+                    log.error(f"恢复 {resource} 失败，将在下次操作时重试: {e}")
+                raise
+            LockManager._clear_journal(resource)
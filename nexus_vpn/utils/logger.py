@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 from rich.console import Console
 from rich.theme import Theme
 
@@ -22,4 +23,14 @@ class Logger:
     @staticmethod
     def run_cmd(cmd): console.print(f"[cmd]> {cmd}[/cmd]")
 
+    @staticmethod
+    @contextmanager
+    def to_stderr():
+        """期间的日志写到 stderr，stdout 只保留机器可读输出"""
+        previous, console.stderr = console.stderr, True
+        try:
+            yield
+        finally:
+            console.stderr = previous
+
 log = Logger()
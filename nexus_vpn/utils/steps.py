@@ -0,0 +1,101 @@
+"""按依赖关系并发执行的步骤
+
+每个步骤声明它依赖的步骤，依赖全部完成后才提交到线程池，互不依赖的步骤
+（例如下载 Xray、apt-get install、写入 sysctl）同时进行。
+任一步骤失败后不再启动新步骤，等待已在运行的步骤结束后抛出 StepFailed。
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class Step:
+    def __init__(self, name, func, after=(), title=None):
+        """
+        Args:
+            name: 步骤名，供其他步骤在 after 中引用
+            func: 无参数的可调用对象
+            after: 依赖的步骤名
+            title: 耗时汇总中显示的名称，默认为 name
+        """
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.title = title or name
+
+
+class StepFailed(Exception):
+    """某个步骤抛出异常；results 为截至失败时各步骤的状态与耗时"""
+
+    def __init__(self, step, error, results):
+        super().__init__(f"{step.title} 失败: {error}")
+        self.step = step
+        self.error = error
+        self.results = results
+
+
+def _check_graph(steps):
+    """依赖的步骤必须存在且不能成环"""
+    by_name = {s.name: s for s in steps}
+    if len(by_name) != len(steps):
+        raise ValueError("步骤名重复")
+    for s in steps:
+        for dep in s.after:
+            if dep not in by_name:
+                raise ValueError(f"步骤 {s.name} 依赖不存在的步骤 {dep}")
+    resolved = set()
+    remaining = list(steps)
+    while remaining:
+        ready = [s for s in remaining if set(s.after) <= resolved]
+        if not ready:
+            raise ValueError(f"步骤依赖成环: {', '.join(s.name for s in remaining)}")
+        resolved.update(s.name for s in ready)
+        remaining = [s for s in remaining if s.name not in resolved]
+
+
+def _timed(func):
+    start = time.perf_counter()
+    try:
+        func()
+    except Exception as e:
+        return time.perf_counter() - start, e
+    return time.perf_counter() - start, None
+
+
+def run_steps(steps, max_workers=4):
+    """执行全部步骤
+
+    Returns:
+        list: 按声明顺序的 {"name", "title", "status", "seconds"}，
+            status 为 ok / failed / skipped（因前面的步骤失败而未执行）
+
+    Raises:
+        StepFailed: 第一个失败的步骤
+    """
+    steps = list(steps)
+    _check_graph(steps)
+    results = {s.name: {"name": s.name, "title": s.title, "status": "skipped", "seconds": None} for s in steps}
+    pending = list(steps)
+    running = {}
+    done = set()
+    failure = None
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            if failure is None:
+                for s in [s for s in pending if set(s.after) <= done]:
+                    pending.remove(s)
+                    running[pool.submit(_timed, s.func)] = s
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                s = running.pop(future)
+                seconds, error = future.result()
+                results[s.name].update(status="failed" if error else "ok", seconds=seconds)
+                if error is None:
+                    done.add(s.name)
+                elif failure is None:
+                    failure = (s, error)
+    ordered = [results[s.name] for s in steps]
+    if failure:
+        raise StepFailed(failure[0], failure[1], ordered)
+    return ordered
@@ -104,6 +104,12 @@ def sudo_chmod(path, mode):
         os.chmod(path, mode)
 
 
+def sudo_grant_group(path, mode):
+    """把 path 的属组改为当前用户的组并设置权限，非 root 运行时用来共享 root 创建的文件"""
+    sudo_run(["chgrp", str(os.getgid()), path], check=True)
+    sudo_run(["chmod", mode, path], check=True)
+
+
 def sudo_move(src, dst):
     """移动文件"""
     if need_sudo() and shutil.which("sudo"):
@@ -0,0 +1,82 @@
+"""X25519 密钥工具 (RFC 7748)
+
+Reality 只需要生成密钥对和从私钥推导公钥，纯 Python 实现足够快，
+不必再调用 `xray x25519` 子进程。密钥编码与 Xray 一致：无填充的 URL-safe base64。
+"""
+import base64
+import os
+
+_P = 2 ** 255 - 19
+_A24 = 121665
+_BASE_POINT = 9
+
+
+def _clamp(scalar):
+    k = bytearray(scalar)
+    k[0] &= 248
+    k[31] &= 127
+    k[31] |= 64
+    return bytes(k)
+
+
+def _ladder(k, u):
+    """Montgomery ladder，计算 k * u（均为整数）"""
+    x1 = u
+    x2, z2 = 1, 0
+    x3, z3 = u, 1
+    swap = 0
+    for t in reversed(range(255)):
+        bit = (k >> t) & 1
+        swap ^= bit
+        if swap:
+            x2, x3 = x3, x2
+            z2, z3 = z3, z2
+        swap = bit
+
+        a = (x2 + z2) % _P
+        aa = a * a % _P
+        b = (x2 - z2) % _P
+        bb = b * b % _P
+        e = (aa - bb) % _P
+        c = (x3 + z3) % _P
+        d = (x3 - z3) % _P
+        da = d * a % _P
+        cb = c * b % _P
+        x3 = (da + cb) ** 2 % _P
+        z3 = x1 * (da - cb) ** 2 % _P
+        x2 = aa * bb % _P
+        z2 = e * (aa + _A24 * e) % _P
+    if swap:
+        x2, x3 = x3, x2
+        z2, z3 = z3, z2
+    return x2 * pow(z2, _P - 2, _P) % _P
+
+
+def scalar_mult(scalar, u_bytes):
+    """X25519(scalar, u)，输入输出均为 32 字节"""
+    k = int.from_bytes(_clamp(scalar), "little")
+    u = bytearray(u_bytes)
+    u[31] &= 127
+    return _ladder(k, int.from_bytes(u, "little") % _P).to_bytes(32, "little")
+
+
+def encode_key(raw):
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_key(text):
+    raw = base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+    if len(raw) != 32:
+        raise ValueError(f"无效的 X25519 密钥: {text}")
+    return raw
+
+
+def public_key_from_private(private_key):
+    """从 base64 私钥推导 base64 公钥（等价于 `xray x25519 -i`）"""
+    return encode_key(scalar_mult(decode_key(private_key), _BASE_POINT.to_bytes(32, "little")))
+
+
+def generate_keypair():
+    """生成 (私钥, 公钥)，均为 base64 编码"""
+    private = _clamp(os.urandom(32))
+    return encode_key(private), public_key_from_private(encode_key(private))
@@ -36,7 +36,11 @@ setup(
         "rich>=13.0.0",
         "qrcode>=7.4.0",
         "jinja2>=3.1.0",
+        "grpcio>=1.50.0",
     ],
+    extras_require={
+        "png": ["pypng>=0.20220715.0"],
+    },
     entry_points={
         "console_scripts": [
             "nexus-vpn=nexus_vpn.cli:cli",
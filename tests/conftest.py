@@ -50,7 +50,7 @@ def mock_xray_config(temp_dir):
                 "realitySettings": {
                     "dest": "www.microsoft.com:443",
                     "serverNames": ["www.microsoft.com"],
-                    "privateKey": "test-private-key",
+                    "privateKey": "dwdtCnMYpX08FsFyUbJmRd9ML4frwJkqsXf7pR25LCo",
                     "shortIds": ["abcd1234"]
                 }
             }
@@ -109,6 +109,41 @@ def mock_subprocess_check_output(mocker):
     return mocker.patch('subprocess.check_output')
 
 
+@pytest.fixture(autouse=True)
+def mock_user_registry(monkeypatch, temp_dir):
+    """用户注册表数据库指向临时目录"""
+    monkeypatch.setattr("nexus_vpn.core.registry.UserRegistry.DB_PATH",
+                        os.path.join(temp_dir, "lib", "nexus-vpn", "users.db"))
+    monkeypatch.setattr("nexus_vpn.core.registry.UserRegistry.LEGACY_DB_PATH",
+                        os.path.join(temp_dir, "nexus-vpn", "users.db"))
+
+
+@pytest.fixture(autouse=True)
+def mock_server_state(monkeypatch, temp_dir):
+    """服务器元数据缓存指向临时目录"""
+    monkeypatch.setattr("nexus_vpn.core.state.ServerState.PATH",
+                        os.path.join(temp_dir, "nexus-vpn", "state.json"))
+
+
+@pytest.fixture(autouse=True)
+def mock_lock_dir(monkeypatch, temp_dir):
+    """资源锁与操作日志指向临时目录"""
+    monkeypatch.setattr("nexus_vpn.utils.lock.LockManager.LOCK_DIR", os.path.join(temp_dir, "nexus-vpn", "locks"))
+
+
+@pytest.fixture(autouse=True)
+def mock_download_cache(monkeypatch, temp_dir):
+    """下载缓存指向临时目录，重试不等待"""
+    monkeypatch.setattr("nexus_vpn.utils.download.DEFAULT_CACHE_DIR", os.path.join(temp_dir, "cache"))
+    monkeypatch.setattr("nexus_vpn.utils.download.BACKOFF", 0)
+
+
+@pytest.fixture(autouse=True)
+def mock_xray_health(mocker):
+    """重启后的健康检查默认通过（不轮询 systemctl、不连接真实端口）"""
+    return mocker.patch("nexus_vpn.protocols.v2ray.V2RayManager._healthy", return_value=True)
+
+
 @pytest.fixture(autouse=True)
 def mock_sudo_helpers(mocker, temp_dir):
     """自动 mock sudo helpers，使其直接操作本地文件（不执行系统命令）"""
@@ -0,0 +1,228 @@
+"""测试 nexus_vpn.core.bundle 模块"""
+import os
+import io
+import json
+import tarfile
+import hashlib
+import subprocess
+from unittest.mock import MagicMock
+import pytest
+
+
+XRAY_ZIP = b"PK-fake-xray-release"
+DEBS = {"curl_8.5.0-2_amd64.deb": ("curl", "8.5.0-2"),
+        "libcurl4_8.5.0-2_amd64.deb": ("libcurl4", "8.5.0-2"),
+        "strongswan_5.9.13-2_all.deb": ("strongswan", "5.9.13-2")}
+
+
+def fake_apt(args, **kwargs):
+    """模拟 apt-cache depends / apt-get download / dpkg-deb"""
+    result = MagicMock(returncode=0, stdout="", stderr="")
+    if args[0] == "apt-cache":
+        result.stdout = "curl\n  Depends: libcurl4\nlibcurl4\n  Depends: <libc6>\n<libc6>\nstrongswan\n"
+    elif args[:2] == ["apt-get", "download"]:
+        for name in DEBS:
+            with open(os.path.join(kwargs["cwd"], name), "wb") as f:
+                f.write(name.encode())
+    elif args[0] == "dpkg-deb":
+        pkg, version = DEBS[os.path.basename(args[2])]
+        result.stdout = f"Package: {pkg}\nVersion: {version}\n"
+    return result
+
+
+@pytest.fixture
+def bundle_file(mocker, temp_dir):
+    """在模拟的 apt 主机上生成安装包，返回 (路径, 各命令调用)"""
+    from nexus_vpn.core.bundle import Bundle
+
+    zip_path = os.path.join(temp_dir, "xray.zip")
+    with open(zip_path, "wb") as f:
+        f.write(XRAY_ZIP)
+    mocker.patch('nexus_vpn.core.bundle.fetch_verified', return_value=zip_path)
+    mocker.patch('nexus_vpn.core.bundle.shutil.which', side_effect=lambda cmd: cmd == "apt-get")
+    run = mocker.patch('nexus_vpn.core.bundle.subprocess.run', side_effect=fake_apt)
+
+    output = os.path.join(temp_dir, "bundle.tar.gz")
+    Bundle.create(output, "1.8.6")
+    return output, run
+
+
+def rewrite_member(path, name, data):
+    """替换 tar.gz 中的某个文件（模拟传输中损坏或被篡改）"""
+    with tarfile.open(path) as tar:
+        members = [(m, tar.extractfile(m).read()) for m in tar.getmembers()]
+    with tarfile.open(path, "w:gz") as tar:
+        for member, content in members:
+            if member.name == name:
+                content = data
+                member.size = len(data)
+            tar.addfile(member, io.BytesIO(content))
+
+
+class TestCreate:
+    """Bundle.create 测试"""
+
+    def test_manifest(self, bundle_file):
+        """测试清单记录 Xray 与各 .deb 的版本和 sha256"""
+        path, run = bundle_file
+        with tarfile.open(path) as tar:
+            names = tar.getnames()
+            manifest = json.load(tar.extractfile("manifest.json"))
+
+        assert "xray/Xray-linux-64.zip" in names
+        assert manifest["format"] == 1
+        assert manifest["package_manager"] == "apt"
+        assert manifest["xray"] == {"version": "1.8.6", "file": "xray/Xray-linux-64.zip",
+                                    "sha256": hashlib.sha256(XRAY_ZIP).hexdigest()}
+        assert [(p["name"], p["version"]) for p in manifest["packages"]] == \
+            [("curl", "8.5.0-2"), ("libcurl4", "8.5.0-2"), ("strongswan", "5.9.13-2")]
+        assert all(p["file"] in names for p in manifest["packages"])
+
+    def test_downloads_dependency_closure(self, bundle_file):
+        """测试按 apt-cache depends 的递归结果下载，忽略缩进行与虚包"""
+        _, run = bundle_file
+        download = next(c.args[0] for c in run.call_args_list if c.args[0][:2] == ["apt-get", "download"])
+        assert download[2:] == ["curl", "libcurl4", "strongswan"]
+        depends = next(c.args[0] for c in run.call_args_list if c.args[0][0] == "apt-cache")
+        assert "nftables" in depends
+
+    def test_download_failure(self, mocker, temp_dir):
+        """测试下载依赖失败时抛出 BundleError"""
+        from nexus_vpn.core.bundle import Bundle, BundleError
+
+        zip_path = os.path.join(temp_dir, "xray.zip")
+        open(zip_path, "wb").close()
+        mocker.patch('nexus_vpn.core.bundle.fetch_verified', return_value=zip_path)
+        mocker.patch('nexus_vpn.core.bundle.shutil.which', side_effect=lambda cmd: cmd == "apt-get")
+        mocker.patch('nexus_vpn.core.bundle.subprocess.run',
+                     side_effect=subprocess.CalledProcessError(100, ["apt-cache"]))
+
+        with pytest.raises(BundleError, match="下载系统依赖失败"):
+            Bundle.create(os.path.join(temp_dir, "b.tar.gz"))
+
+
+    def test_yum_uses_rpm_names(self, mocker, temp_dir):
+        """测试 RPM 主机按 RPM 包名下载，并先启用 EPEL"""
+        from nexus_vpn.core.bundle import Bundle
+        from nexus_vpn.core.installer import Installer
+
+        zip_path = os.path.join(temp_dir, "xray.zip")
+        open(zip_path, "wb").close()
+        mocker.patch('nexus_vpn.core.bundle.fetch_verified', return_value=zip_path)
+        mocker.patch('nexus_vpn.core.bundle.shutil.which', side_effect=lambda cmd: cmd in ("yum", "dnf"))
+        mocker.patch.object(Installer, '_missing_packages', return_value=["epel-release"])
+        sudo_run = mocker.patch('nexus_vpn.core.bundle.sudo_run')
+
+        def run(args, **kwargs):
+            if args[:2] == ["dnf", "download"]:
+                open(os.path.join(args[args.index("--destdir") + 1], "strongswan-5.9.14-1.el9.x86_64.rpm"), "w").close()
+            return MagicMock(returncode=0, stdout="strongswan\t0:5.9.14-1.el9")
+        run = mocker.patch('nexus_vpn.core.bundle.subprocess.run', side_effect=run)
+
+        manifest = Bundle.create(os.path.join(temp_dir, "b.tar.gz"), "1.8.6")
+
+        sudo_run.assert_called_once_with(["yum", "install", "-y", "epel-release"], stdout=subprocess.DEVNULL, check=True)
+        download = next(c.args[0] for c in run.call_args_list if c.args[0][:2] == ["dnf", "download"])
+        names = download[download.index("--destdir") + 2:]
+        assert names[0] == "epel-release"
+        assert "iptables-services" in names and "strongswan" in names
+        assert not {"strongswan-pki", "libcharon-extra-plugins", "iptables-persistent"} & set(names)
+        assert manifest["package_manager"] == "yum"
+
+
+class TestOpen:
+    """Bundle.open 测试"""
+
+    def test_round_trip(self, bundle_file):
+        """测试解包校验通过后可读取 Xray 发布包，退出后删除临时目录"""
+        from nexus_vpn.core.bundle import Bundle
+
+        path, _ = bundle_file
+        with Bundle.open(path) as bundle:
+            assert bundle.xray_version == "1.8.6"
+            with open(bundle.xray_zip, "rb") as f:
+                assert f.read() == XRAY_ZIP
+            root = bundle.root
+        assert not os.path.exists(root)
+
+    def test_tampered_file_rejected(self, bundle_file):
+        """测试文件内容与清单不符时拒绝安装"""
+        from nexus_vpn.core.bundle import Bundle, BundleError
+
+        path, _ = bundle_file
+        rewrite_member(path, "packages/curl_8.5.0-2_amd64.deb", b"evil")
+        with pytest.raises(BundleError, match="curl_8.5.0-2_amd64.deb"):
+            with Bundle.open(path):
+                pass
+
+    def test_unsafe_member_rejected(self, temp_dir):
+        """测试包含 .. 路径的条目被拒绝"""
+        from nexus_vpn.core.bundle import Bundle, BundleError
+
+        path = os.path.join(temp_dir, "evil.tar.gz")
+        with tarfile.open(path, "w:gz") as tar:
+            info = tarfile.TarInfo("../evil")
+            info.size = 1
+            tar.addfile(info, io.BytesIO(b"x"))
+        with pytest.raises(BundleError, match="非法条目"):
+            with Bundle.open(path):
+                pass
+        assert not os.path.exists(os.path.join(os.path.dirname(temp_dir), "evil"))
+
+    def test_not_a_bundle(self, temp_dir):
+        """测试非 tar 文件报错"""
+        from nexus_vpn.core.bundle import Bundle, BundleError
+
+        path = os.path.join(temp_dir, "junk.tar.gz")
+        with open(path, "w") as f:
+            f.write("junk")
+        with pytest.raises(BundleError, match="无法读取"):
+            with Bundle.open(path):
+                pass
+
+
+class TestInstallPackages:
+    """Bundle.install_packages 测试"""
+
+    def make_bundle(self, temp_dir, manager="apt"):
+        from nexus_vpn.core.bundle import Bundle
+        packages = [{"file": f"packages/{name}", "name": pkg, "version": version, "sha256": ""}
+                    for name, (pkg, version) in DEBS.items()]
+        return Bundle(temp_dir, {"package_manager": manager, "packages": packages})
+
+    def test_installs_missing_and_newer_only(self, mocker, temp_dir):
+        """测试跳过已安装的相同或更新版本，只安装缺失或更新的包"""
+        def run(args, **kwargs):
+            if args[0] == "dpkg-query":
+                return MagicMock(stdout="curl\t8.5.0-2\tii \n"
+                                        "libcurl4\t8.5.0-1\tii \n"
+                                        "strongswan\t5.9.14-1\tii \n"
+                                        "rc-only\t1.0\trc \n")
+            # dpkg --compare-versions <bundle> le <installed>
+            return MagicMock(returncode=0 if args[2] == "5.9.13-2" else 1)
+        mocker.patch('nexus_vpn.core.bundle.subprocess.run', side_effect=run)
+        sudo_run = mocker.patch('nexus_vpn.core.bundle.sudo_run')
+
+        self.make_bundle(temp_dir).install_packages()
+
+        args = sudo_run.call_args[0][0]
+        assert args[:4] == ["apt-get", "install", "-y", "--no-download"]
+        assert args[4:] == [os.path.join(temp_dir, "packages/libcurl4_8.5.0-2_amd64.deb")]
+
+    def test_nothing_to_install(self, mocker, temp_dir):
+        """测试全部已安装时不调用 apt-get"""
+        stdout = "".join(f"{pkg}\t{version}\tii \n" for pkg, version in DEBS.values())
+        mocker.patch('nexus_vpn.core.bundle.subprocess.run', return_value=MagicMock(stdout=stdout))
+        sudo_run = mocker.patch('nexus_vpn.core.bundle.sudo_run')
+
+        self.make_bundle(temp_dir).install_packages()
+        sudo_run.assert_not_called()
+
+    def test_yum_disables_repos(self, mocker, temp_dir):
+        """测试 rpm 安装包禁用全部软件源"""
+        sudo_run = mocker.patch('nexus_vpn.core.bundle.sudo_run')
+
+        self.make_bundle(temp_dir, "yum").install_packages()
+        args = sudo_run.call_args[0][0]
+        assert args[:4] == ["yum", "install", "-y", "--disablerepo=*"]
+        assert len(args) == 4 + len(DEBS)
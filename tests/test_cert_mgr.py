@@ -4,6 +4,16 @@ import pytest
 from unittest.mock import patch, MagicMock, mock_open
 
 
+@pytest.fixture
+def restore_cert_mgr():
+    """测试中 reload 模块后恢复原有定义（其他模块仍引用原来的 CertManager）"""
+    import nexus_vpn.core.cert_mgr as module
+    saved = dict(module.__dict__)
+    yield
+    module.__dict__.clear()
+    module.__dict__.update(saved)
+
+
 class TestCertManager:
     """CertManager 类测试"""
     
@@ -17,7 +27,7 @@ class TestCertManager:
         from nexus_vpn.core.cert_mgr import CertManager
         assert CertManager.PKI_DIR == "/etc/nexus-vpn/pki"
     
-    def test_p12_password_default(self, mocker):
+    def test_p12_password_default(self, mocker, restore_cert_mgr):
         """测试 P12_PASSWORD 默认值"""
         mocker.patch.dict(os.environ, {}, clear=True)
         # 重新导入以获取新的环境变量值
@@ -28,7 +38,7 @@ class TestCertManager:
         # 默认密码或环境变量中的密码
         assert CertManager.P12_PASSWORD is not None
     
-    def test_p12_password_from_env(self, mocker):
+    def test_p12_password_from_env(self, mocker, restore_cert_mgr):
         """测试从环境变量获取 P12_PASSWORD"""
         mocker.patch.dict(os.environ, {"NEXUS_P12_PASSWORD": "custom_password"})
         import importlib
@@ -38,25 +48,25 @@ class TestCertManager:
         assert CertManager.P12_PASSWORD == "custom_password"
     
     def test_validate_name_valid(self):
-        """测试 _validate_name 对有效名称"""
+        """测试 validate_name 对有效名称"""
         from nexus_vpn.core.cert_mgr import CertManager
-        assert CertManager._validate_name("example.com") == "example.com"
-        assert CertManager._validate_name("test-user") == "test-user"
-        assert CertManager._validate_name("user_123") == "user_123"
-        assert CertManager._validate_name("User.Name") == "User.Name"
-        assert CertManager._validate_name("a") == "a"
-        assert CertManager._validate_name("192.168.1.1") == "192.168.1.1"
+        assert CertManager.validate_name("example.com") == "example.com"
+        assert CertManager.validate_name("test-user") == "test-user"
+        assert CertManager.validate_name("user_123") == "user_123"
+        assert CertManager.validate_name("User.Name") == "User.Name"
+        assert CertManager.validate_name("a") == "a"
+        assert CertManager.validate_name("192.168.1.1") == "192.168.1.1"
     
     def test_validate_name_invalid_empty(self):
-        """测试 _validate_name 对空名称"""
+        """测试 validate_name 对空名称"""
         from nexus_vpn.core.cert_mgr import CertManager
         with pytest.raises(ValueError, match="无效的名称"):
-            CertManager._validate_name("")
+            CertManager.validate_name("")
         with pytest.raises(ValueError, match="无效的名称"):
-            CertManager._validate_name(None)
+            CertManager.validate_name(None)
     
     def test_validate_name_invalid_special_chars(self):
-        """测试 _validate_name 对特殊字符（防止命令注入）"""
+        """测试 validate_name 对特殊字符（防止命令注入）"""
         from nexus_vpn.core.cert_mgr import CertManager
         invalid_names = [
             "test; rm -rf /",
@@ -75,7 +85,7 @@ class TestCertManager:
         ]
         for name in invalid_names:
             with pytest.raises(ValueError, match="无效的名称"):
-                CertManager._validate_name(name)
+                CertManager.validate_name(name)
     
     def test_setup_ca_already_exists(self, mocker, temp_dir):
         """测试 setup_ca 当 CA 已存在时跳过"""
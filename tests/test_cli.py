@@ -183,6 +183,7 @@ class TestCLICommands:
         mock_v2ray.return_value = {"uuid": "test", "public_key": "pk", "short_id": "id", "sni": "sni", "port": 443}
         mocker.patch('nexus_vpn.cli.V2RayManager.print_connection_info')
         mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.generate_config')
+        mock_refresh = mocker.patch('nexus_vpn.cli.ServerState.refresh')
         
         runner = CliRunner()
         result = runner.invoke(cli, ['install', '--domain', 'example.com'])
@@ -190,6 +191,96 @@ class TestCLICommands:
         assert result.exit_code == 0
         mock_installer_class.assert_called_once()
         mock_installer_instance.run.assert_called_once()
+        mock_refresh.assert_called_once_with('example.com', lookup=True)
+    
+    def test_cli_install_bundle(self, mocker, temp_dir):
+        """测试 --bundle 解包后传给 Installer，且不查询出口 IP"""
+        from nexus_vpn.cli import cli
+        
+        mocker.patch('nexus_vpn.cli.SystemChecker.check_os')
+        mock_installer_class = mocker.patch('nexus_vpn.cli.Installer')
+        bundle = MagicMock()
+        mock_open = mocker.patch('nexus_vpn.cli.Bundle.open')
+        mock_open.return_value.__enter__.return_value = bundle
+        mocker.patch('nexus_vpn.cli.V2RayManager.create_config', return_value={})
+        mocker.patch('nexus_vpn.cli.V2RayManager.print_connection_info')
+        mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.generate_config')
+        mock_refresh = mocker.patch('nexus_vpn.cli.ServerState.refresh')
+        path = os.path.join(temp_dir, "bundle.tar.gz")
+        open(path, "w").close()
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['install', '--domain', 'example.com', '--no-probe', '--bundle', path])
+        
+        assert result.exit_code == 0
+        mock_open.assert_called_once_with(path)
+        assert mock_installer_class.call_args[1]["bundle"] is bundle
+        assert mock_installer_class.call_args[1]["flow_offload"] is None
+        mock_installer_class.return_value.run.assert_called_once()
+        mock_refresh.assert_called_once_with('example.com', lookup=False)
+    
+    def test_cli_install_bad_bundle(self, mocker, temp_dir):
+        """测试安装包校验失败时报错退出"""
+        from nexus_vpn.cli import cli
+        from nexus_vpn.core.bundle import BundleError
+        
+        mocker.patch('nexus_vpn.cli.SystemChecker.check_os')
+        mock_installer_class = mocker.patch('nexus_vpn.cli.Installer')
+        mocker.patch('nexus_vpn.cli.Bundle.open', side_effect=BundleError("安装包文件校验失败: xray/Xray-linux-64.zip"))
+        path = os.path.join(temp_dir, "bundle.tar.gz")
+        open(path, "w").close()
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['install', '--domain', 'example.com', '--bundle', path])
+        
+        assert result.exit_code != 0
+        assert "校验失败" in result.output
+        mock_installer_class.assert_not_called()
+    
+    def test_cli_bundle_create(self, mocker):
+        """测试 bundle create 传递版本、缓存目录与镜像"""
+        from nexus_vpn.cli import cli
+        
+        mock_create = mocker.patch('nexus_vpn.cli.Bundle.create')
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['bundle', 'create', '-o', 'out.tar.gz', '--xray-version', '1.8.6',
+                                     '--cache-dir', '/tmp/c', '--mirror', 'http://m'])
+        
+        assert result.exit_code == 0
+        mock_create.assert_called_once_with('out.tar.gz', '1.8.6', '/tmp/c', 'http://m')
+    
+    def test_cli_tune_nic(self, mocker):
+        """测试 tune nic 默认调优默认路由网卡并注册开机单元"""
+        from nexus_vpn.cli import cli
+        
+        mocker.patch('nexus_vpn.cli.Installer._default_iface', return_value='eth0')
+        mocker.patch('nexus_vpn.cli.subprocess.run', return_value=MagicMock(returncode=3))
+        mock_tuner_class = mocker.patch('nexus_vpn.cli.NicTuner')
+        mock_tuner = mock_tuner_class.return_value
+        mock_tuner.tune.return_value = {"before": "b", "after": "a", "plan": {}, "failed": []}
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['tune', 'nic'])
+        
+        assert result.exit_code == 0
+        mock_tuner_class.assert_called_once_with('eth0')
+        mock_tuner.print_report.assert_called_once_with("b", "a")
+        mock_tuner.persist.assert_called_once()
+    
+    def test_cli_tune_nic_missing_iface(self, mocker):
+        """测试网卡不存在时报错且不做修改"""
+        from nexus_vpn.cli import cli
+        
+        mock_tuner = mocker.patch('nexus_vpn.cli.NicTuner').return_value
+        mock_tuner.exists.return_value = False
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['tune', 'nic', '--iface', 'nope0'])
+        
+        assert result.exit_code != 0
+        assert "网卡不存在" in result.output
+        mock_tuner.tune.assert_not_called()
     
     def test_cli_uninstall_confirmed(self, mocker):
         """测试 uninstall 命令确认后执行"""
@@ -239,6 +330,25 @@ class TestCLICommands:
         assert result.exit_code == 0
         mock_add.assert_called_once_with('v2ray', 'testuser')
     
+    def test_cli_user_add_eap_password_stdin(self, mocker):
+        """测试 EAP 密码从隐藏提示（stdin）读取，不回显，也不接受命令行参数"""
+        from nexus_vpn.cli import cli
+        from nexus_vpn.core.user_mgr import UserManager
+        
+        mock_add_eap = mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.add_eap_user')
+        mocker.patch.object(UserManager, '_get_domain', return_value='example.com')
+        mocker.patch.object(UserManager, '_print_eap_info')
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['user', 'add', '--type', 'ikev2-eap', '--username', 'bob'], input='s3cret\n')
+        assert result.exit_code == 0
+        mock_add_eap.assert_called_once_with('bob', 's3cret')
+        assert 's3cret' not in result.output
+        
+        result = runner.invoke(cli, ['user', 'add', '--type', 'ikev2-eap', '--username', 'bob', '--password', 'pw'])
+        assert result.exit_code != 0
+        assert mock_add_eap.call_count == 1
+    
     def test_cli_user_del(self, mocker):
         """测试删除用户"""
         from nexus_vpn.cli import cli
@@ -275,3 +385,232 @@ class TestCLICommands:
         
         assert result.exit_code == 0
         assert "Nexus-VPN" in result.output or "状态" in result.output
+    
+    def test_cli_status_sysctl_drift(self, mocker):
+        """测试 status 报告内核参数与档位的偏离"""
+        from nexus_vpn.cli import cli
+        
+        mocker.patch('subprocess.run', return_value=MagicMock(stdout="active\n"))
+        mocker.patch('nexus_vpn.cli.load_profile',
+                     return_value={"net.core.somaxconn": "4096", "net.ipv4.tcp_fastopen": "3",
+                                   "net.netfilter.nf_conntrack_max": "65536"})
+        mocker.patch('nexus_vpn.cli.read_live',
+                     return_value={"net.core.somaxconn": "4096", "net.ipv4.tcp_fastopen": "1",
+                                   "net.netfilter.nf_conntrack_max": None})
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['status'])
+        
+        assert result.exit_code == 0
+        assert "2 项偏离" in result.output
+        assert "net.ipv4.tcp_fastopen: 1 ≠ 3" in result.output
+        assert "不可读" in result.output
+    
+    def test_cli_status_flow_offload(self, mocker):
+        """测试 status 显示 flowtable 状态与快速路径连接数"""
+        from nexus_vpn.cli import cli
+        
+        mocker.patch('subprocess.run', return_value=MagicMock(stdout="active\n"))
+        mocker.patch('nexus_vpn.cli.Installer.flow_offload_status',
+                     return_value={"configured": True, "active": True, "flows": 7})
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['status'])
+        
+        assert result.exit_code == 0
+        assert "Flowtable" in result.output
+        assert "已生效" in result.output
+        assert "快速路径连接数: 7" in result.output
+    
+    def test_cli_user_import(self, mocker, temp_dir):
+        """测试批量导入用户"""
+        from nexus_vpn.cli import cli
+        
+        csv_path = os.path.join(temp_dir, "users.csv")
+        with open(csv_path, 'w') as f:
+            f.write("alice\n")
+        mock_import = mocker.patch('nexus_vpn.core.user_mgr.UserManager.import_users')
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['user', 'import', '--type', 'v2ray', '--output-dir', 'out', csv_path])
+        
+        assert result.exit_code == 0
+        mock_import.assert_called_once_with('v2ray', csv_path, 'out', 'svg', None)
+        
+        result = runner.invoke(cli, ['user', 'import', csv_path])
+        assert result.exit_code == 0
+        mock_import.assert_called_with(None, csv_path, 'nexus-export', 'svg', None)
+    
+    def test_cli_update_xray_download_options(self, mocker):
+        """测试 update xray 传递缓存目录与镜像"""
+        from nexus_vpn.cli import cli
+        
+        mock_update = mocker.patch('nexus_vpn.cli.Installer.update_xray')
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['update', 'xray', '--version', '1.8.6', '--cache-dir', '/srv/cache',
+                                     '--mirror', 'https://mirror.example.com'])
+        
+        assert result.exit_code == 0
+        mock_update.assert_called_once_with('1.8.6', '/srv/cache', 'https://mirror.example.com')
+    
+    def test_cli_user_export(self, mocker):
+        """测试导出用户"""
+        from nexus_vpn.cli import cli
+        
+        mock_export = mocker.patch('nexus_vpn.core.user_mgr.UserManager.export_users')
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['user', 'export', '--type', 'v2ray', '--workers', '4'])
+        
+        assert result.exit_code == 0
+        mock_export.assert_called_once_with('v2ray', 'nexus-export', 'svg', 4)
+    
+    def test_cli_user_export_png_requires_pypng(self, mocker):
+        """测试缺少 pypng 时拒绝 PNG 输出"""
+        from nexus_vpn.cli import cli
+        
+        mocker.patch('nexus_vpn.cli.png_available', return_value=False)
+        mock_export = mocker.patch('nexus_vpn.core.user_mgr.UserManager.export_users')
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['user', 'export', '--type', 'v2ray', '--format', 'png'])
+        
+        assert result.exit_code != 0
+        assert "pypng" in result.output
+        mock_export.assert_not_called()
+    
+    def test_cli_stats_v2ray(self, mocker):
+        """测试流量统计命令"""
+        from nexus_vpn.cli import cli
+        
+        mock_show = mocker.patch('nexus_vpn.core.stats_mgr.StatsManager.show')
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['stats', 'v2ray', '--top', '5'])
+        
+        assert result.exit_code == 0
+        mock_show.assert_called_once_with(5)
+    
+    def test_check_service_shard_instance(self, mocker):
+        """测试 check_service 允许分片实例名"""
+        from nexus_vpn.cli import check_service
+        
+        mocker.patch('subprocess.run', return_value=MagicMock(stdout="active\n"))
+        
+        assert check_service("nexus-xray@3") == "[green]active[/green]"
+        assert check_service("nexus-xray@x") == "[red]invalid[/red]"
+    
+    def test_cli_install_with_shards(self, mocker):
+        """测试 install 传递 Xray 分片数"""
+        from nexus_vpn.cli import cli
+        
+        mocker.patch('nexus_vpn.cli.SystemChecker.check_os')
+        mock_installer_class = mocker.patch('nexus_vpn.cli.Installer')
+        mock_create = mocker.patch('nexus_vpn.cli.V2RayManager.create_config')
+        mock_create.return_value = {"uuid": "test", "public_key": "pk", "short_id": "id", "sni": "sni", "port": 443}
+        mocker.patch('nexus_vpn.cli.V2RayManager.print_connection_info')
+        mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.generate_config')
+        mocker.patch('nexus_vpn.cli.ServerState.refresh')
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['install', '--domain', 'example.com', '--xray-shards', '4'])
+        
+        assert result.exit_code == 0
+        assert mock_installer_class.call_args.args[3] == 4
+        assert mock_create.call_args.kwargs['shards'] == 4
+    
+    def test_cli_install_with_profile(self, mocker):
+        """测试 install 传递调优档位，并拒绝未知档位"""
+        from nexus_vpn.cli import cli
+        
+        mocker.patch('nexus_vpn.cli.SystemChecker.check_os')
+        mocker.patch('nexus_vpn.cli.Installer')
+        mock_create = mocker.patch('nexus_vpn.cli.V2RayManager.create_config')
+        mock_create.return_value = {"uuid": "test", "public_key": "pk", "short_id": "id", "sni": "sni", "port": 443}
+        mocker.patch('nexus_vpn.cli.V2RayManager.print_connection_info')
+        mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.generate_config')
+        mocker.patch('nexus_vpn.cli.ServerState.refresh')
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['install', '--domain', 'example.com', '--profile', 'low-memory'])
+        assert result.exit_code == 0
+        assert mock_create.call_args.kwargs['profile'] == "low-memory"
+        
+        result = runner.invoke(cli, ['install', '--domain', 'example.com', '--profile', 'turbo'])
+        assert result.exit_code != 0
+    
+    def test_cli_install_orders_reality_dests(self, mocker):
+        """测试 install 指定多个目标时按延迟排序，--no-probe 时保持原顺序"""
+        from nexus_vpn.cli import cli
+        
+        mocker.patch('nexus_vpn.cli.SystemChecker.check_os')
+        mocker.patch('nexus_vpn.cli.Installer')
+        mock_create = mocker.patch('nexus_vpn.cli.V2RayManager.create_config')
+        mock_create.return_value = {"uuid": "test", "public_key": "pk", "short_id": "id", "sni": "sni", "port": 443}
+        mocker.patch('nexus_vpn.cli.V2RayManager.print_connection_info')
+        mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.generate_config')
+        mocker.patch('nexus_vpn.cli.ServerState.refresh')
+        mock_order = mocker.patch('nexus_vpn.cli.RealityManager.order_dests', return_value=["b:443", "a:443"])
+        
+        runner = CliRunner()
+        args = ['install', '--domain', 'example.com', '--reality-dest', 'a:443', '--reality-dest', 'b:443']
+        result = runner.invoke(cli, args)
+        assert result.exit_code == 0
+        assert mock_create.call_args.args[1] == ["b:443", "a:443"]
+        
+        mock_order.reset_mock()
+        result = runner.invoke(cli, args + ['--no-probe'])
+        assert result.exit_code == 0
+        mock_order.assert_not_called()
+        assert list(mock_create.call_args.args[1]) == ["a:443", "b:443"]
+    
+    def test_cli_install_reports_config_error(self, mocker):
+        """测试配置校验或健康检查失败时以错误退出"""
+        from nexus_vpn.cli import cli
+        from nexus_vpn.protocols.v2ray import XrayConfigError
+        
+        mocker.patch('nexus_vpn.cli.SystemChecker.check_os')
+        mocker.patch('nexus_vpn.cli.Installer')
+        mocker.patch('nexus_vpn.cli.V2RayManager.create_config', side_effect=XrayConfigError("Xray 配置校验失败"))
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['install', '--domain', 'example.com'])
+        
+        assert result.exit_code == 1
+        assert "Xray 配置校验失败" in result.output
+    
+    def test_cli_state_refresh_and_show(self, mocker):
+        """测试刷新并显示服务器元数据"""
+        from nexus_vpn.cli import cli
+        
+        state = {"domain": "vpn.example.com", "public_ips": ["1.2.3.4"],
+                 "reality": {"public_key": "pk", "short_ids": ["ab"]}, "ports": {"vless": 443}}
+        mock_refresh = mocker.patch('nexus_vpn.cli.ServerState.refresh', return_value=state)
+        mocker.patch('nexus_vpn.cli.ServerState.load', return_value=state)
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['state', 'refresh', '--domain', 'vpn.example.com', '--no-lookup'])
+        assert result.exit_code == 0
+        mock_refresh.assert_called_once_with('vpn.example.com', False)
+        
+        result = runner.invoke(cli, ['state', 'show'])
+        assert result.exit_code == 0
+        assert "vpn.example.com" in result.output
+        assert "1.2.3.4" in result.output
+    
+    def test_cli_user_list_options(self, mocker):
+        """测试 user list 传递格式、类型、筛选与分页参数"""
+        from nexus_vpn.cli import cli
+        
+        mock_list = mocker.patch('nexus_vpn.cli.UserManager.list_users')
+        
+        runner = CliRunner()
+        result = runner.invoke(cli, ['user', 'list', '--format', 'jsonl', '--type', 'v2ray', '--type', 'ikev2-eap',
+                                     '--filter', 'ali*', '--limit', '10', '--offset', '20'])
+        
+        assert result.exit_code == 0
+        mock_list.assert_called_once_with('jsonl', ('v2ray', 'ikev2-eap'), 'ali*', 10, 20)
+        
+        result = runner.invoke(cli, ['user', 'list', '--format', 'xml'])
+        assert result.exit_code != 0
@@ -0,0 +1,208 @@
+"""测试 nexus_vpn.utils.download 模块（使用本地 HTTP 服务）"""
+import os
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+
+PAYLOAD = os.urandom(300_000)
+DIGEST = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+class FakeRelease:
+    """模拟发布服务器：支持 Range，可让前几次响应在中途断开"""
+
+    def __init__(self):
+        self.files = {
+            "/v1.8.6/Xray-linux-64.zip": PAYLOAD,
+            "/v1.8.6/Xray-linux-64.zip.dgst": (f"MD5= {hashlib.md5(PAYLOAD).hexdigest()}\n"
+                                               f"SHA1= {hashlib.sha1(PAYLOAD).hexdigest()}\n"
+                                               f"SHA2-256= {DIGEST}\n"
+                                               f"SHA2-512= {hashlib.sha512(PAYLOAD).hexdigest()}\n").encode(),
+        }
+        self.supports_range = True
+        # 前 truncate 次下载只发送 truncate_at 字节后断开
+        self.truncate = 0
+        self.truncate_at = 100_000
+        self.requests = []
+
+    def handler(self):
+        release = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                release.requests.append((self.path, self.headers.get("Range")))
+                body = release.files.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                start = 0
+                rng = self.headers.get("Range")
+                if rng and release.supports_range:
+                    start = int(rng[len("bytes="):].rstrip("-"))
+                    if start >= len(body):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(body)}")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+                else:
+                    self.send_response(200)
+                chunk = body[start:]
+                self.send_header("Content-Length", str(len(chunk)))
+                self.end_headers()
+                if release.truncate and not self.path.endswith(".dgst"):
+                    release.truncate -= 1
+                    self.wfile.write(chunk[:release.truncate_at])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                self.wfile.write(chunk)
+
+        return Handler
+
+
+@pytest.fixture
+def release_server():
+    release = FakeRelease()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), release.handler())
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    release.base = f"http://127.0.0.1:{server.server_address[1]}"
+    release.url = f"{release.base}/v1.8.6/Xray-linux-64.zip"
+    yield release
+    server.shutdown()
+    server.server_close()
+
+
+class TestParseDigest:
+    """parse_digest 测试"""
+
+    def test_xray_dgst(self):
+        from nexus_vpn.utils.download import parse_digest
+        text = f"MD5= {'a' * 32}\nSHA1= {'b' * 40}\nSHA2-256= {DIGEST.upper()}\nSHA2-512= {'c' * 128}\n"
+        assert parse_digest(text) == DIGEST
+
+    def test_sha256sum_format(self):
+        from nexus_vpn.utils.download import parse_digest
+        assert parse_digest(f"{DIGEST}  Xray-linux-64.zip\n") == DIGEST
+
+    def test_missing(self):
+        from nexus_vpn.utils.download import parse_digest, DownloadError
+        with pytest.raises(DownloadError):
+            parse_digest(f"SHA2-512= {'c' * 128}\n")
+
+
+class TestFetchVerified:
+    """fetch_verified 测试"""
+
+    def test_download_and_cache(self, release_server, temp_dir):
+        """测试下载后按摘要缓存，再次调用不再下载发布包"""
+        from nexus_vpn.utils.download import fetch_verified
+
+        path = fetch_verified(release_server.url)
+        assert path == os.path.join(temp_dir, "cache", "sha256", DIGEST)
+        with open(path, "rb") as f:
+            assert f.read() == PAYLOAD
+
+        release_server.requests.clear()
+        assert fetch_verified(release_server.url) == path
+        assert [p for p, _ in release_server.requests] == ["/v1.8.6/Xray-linux-64.zip.dgst"]
+
+    def test_resume_after_interruption(self, release_server):
+        """测试连接中断后用 Range 从已接收的位置续传"""
+        from nexus_vpn.utils.download import fetch_verified
+
+        release_server.truncate = 2
+        path = fetch_verified(release_server.url)
+
+        with open(path, "rb") as f:
+            assert f.read() == PAYLOAD
+        ranges = [r for p, r in release_server.requests if p.endswith(".zip")]
+        assert ranges == [None, "bytes=100000-", "bytes=200000-"]
+
+    def test_resume_partial_from_previous_run(self, release_server, temp_dir):
+        """测试上次留下的 .part 文件在下次执行时续传"""
+        from nexus_vpn.utils.download import fetch_verified
+
+        partial = os.path.join(temp_dir, "cache", "partial")
+        os.makedirs(partial)
+        with open(os.path.join(partial, f"{DIGEST}.part"), "wb") as f:
+            f.write(PAYLOAD[:50_000])
+
+        fetch_verified(release_server.url)
+        assert ("/v1.8.6/Xray-linux-64.zip", "bytes=50000-") in release_server.requests
+
+    def test_server_without_range_support(self, release_server, temp_dir):
+        """测试服务器忽略 Range 返回 200 时从头下载"""
+        from nexus_vpn.utils.download import fetch_verified
+
+        release_server.supports_range = False
+        partial = os.path.join(temp_dir, "cache", "partial")
+        os.makedirs(partial)
+        with open(os.path.join(partial, f"{DIGEST}.part"), "wb") as f:
+            f.write(b"x" * 1000)
+
+        with open(fetch_verified(release_server.url), "rb") as f:
+            assert f.read() == PAYLOAD
+
+    def test_checksum_mismatch(self, release_server, temp_dir):
+        """测试内容与摘要不符时重试后失败，不留下缓存"""
+        from nexus_vpn.utils.download import fetch_verified, DownloadError
+
+        release_server.files["/v1.8.6/Xray-linux-64.zip"] = b"tampered"
+        with pytest.raises(DownloadError, match="SHA-256"):
+            fetch_verified(release_server.url, retries=2)
+        assert not os.path.exists(os.path.join(temp_dir, "cache", "sha256", DIGEST))
+        assert len([p for p, _ in release_server.requests if p.endswith(".zip")]) == 2
+
+    def test_corrupt_cache_is_replaced(self, release_server, temp_dir):
+        """测试缓存文件损坏时重新下载"""
+        from nexus_vpn.utils.download import fetch_verified
+
+        blob_dir = os.path.join(temp_dir, "cache", "sha256")
+        os.makedirs(blob_dir)
+        with open(os.path.join(blob_dir, DIGEST), "wb") as f:
+            f.write(b"corrupt")
+
+        with open(fetch_verified(release_server.url), "rb") as f:
+            assert f.read() == PAYLOAD
+
+    def test_not_found_is_not_retried(self, release_server):
+        """测试 404 直接失败，不做重试"""
+        from nexus_vpn.utils.download import fetch_verified, DownloadError
+
+        with pytest.raises(DownloadError, match="404"):
+            fetch_verified(f"{release_server.base}/v9.9.9/Xray-linux-64.zip")
+        assert len(release_server.requests) == 1
+
+    def test_mirror_install(self, release_server, mocker, temp_dir):
+        """测试 Installer 通过镜像与共享缓存目录下载并解压"""
+        import io
+        import zipfile
+        from nexus_vpn.core.installer import Installer
+
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as z:
+            z.writestr("xray", b"BINARY")
+        data = buf.getvalue()
+        release_server.files["/v1.8.6/Xray-linux-64.zip"] = data
+        release_server.files["/v1.8.6/Xray-linux-64.zip.dgst"] = \
+            f"SHA2-256= {hashlib.sha256(data).hexdigest()}\n".encode()
+        exists = os.path.exists
+        mocker.patch('os.path.exists', side_effect=lambda p: p != "/usr/local/bin/xray" and exists(p))
+        moved = {}
+        mocker.patch('nexus_vpn.core.installer.sudo_move',
+                     side_effect=lambda src, dst: moved.setdefault(dst, open(src, "rb").read()))
+        mocker.patch('nexus_vpn.core.installer.sudo_chmod')
+
+        cache = os.path.join(temp_dir, "shared-cache")
+        Installer._download_and_install_xray("1.8.6", cache, release_server.base)
+
+        assert moved["/usr/local/bin/xray"] == b"BINARY"
+        assert os.listdir(os.path.join(cache, "sha256")) == [hashlib.sha256(data).hexdigest()]
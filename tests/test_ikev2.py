@@ -80,22 +80,24 @@ class TestIKEv2Manager:
         
         mock_sudo_run.assert_called_with(["ipsec", "reload"])
     
-    def test_remove_user_from_secrets_file_not_exists(self, mocker, temp_dir):
-        """测试 _remove_user_from_secrets 当文件不存在时"""
+    def test_remove_eap_user_secrets_file_not_exists(self, mocker, temp_dir):
+        """测试 secrets 文件不存在时删除用户"""
         from nexus_vpn.protocols.ikev2 import IKEv2Manager
         
         secrets_path = os.path.join(temp_dir, "ipsec.secrets")
         mocker.patch.object(IKEv2Manager, 'SECRETS_FILE', secrets_path)
+        mocker.patch('nexus_vpn.protocols.ikev2.sudo_run')
         
         # 不应该抛出异常
-        IKEv2Manager._remove_user_from_secrets("testuser")
+        IKEv2Manager.remove_eap_user("testuser")
     
-    def test_remove_user_from_secrets_removes_user(self, mocker, temp_dir):
-        """测试 _remove_user_from_secrets 移除用户"""
+    def test_render_secrets_keeps_other_users(self, mocker, temp_dir):
+        """测试删除用户后由注册表重新生成 EAP 行，并保留服务器私钥行"""
         from nexus_vpn.protocols.ikev2 import IKEv2Manager
         
         secrets_path = os.path.join(temp_dir, "ipsec.secrets")
         mocker.patch.object(IKEv2Manager, 'SECRETS_FILE', secrets_path)
+        mocker.patch('nexus_vpn.protocols.ikev2.sudo_run')
         
         # 创建 secrets 文件
         content = """: RSA server.key
@@ -106,37 +108,39 @@ testuser2 : EAP "password2"
         with open(secrets_path, 'w') as f:
             f.write(content)
         
-        IKEv2Manager._remove_user_from_secrets("testuser1")
+        IKEv2Manager.remove_eap_user("testuser1")
         
         with open(secrets_path, 'r') as f:
             result = f.read()
         
         assert "testuser1" not in result
-        assert "testuser2 : EAP" in result
-        assert '"testuser3" : EAP' in result
-        assert ": RSA server.key" in result
+        assert 'testuser2 : EAP "password2"' in result
+        assert 'testuser3 : EAP "password3"' in result
+        assert result.startswith(": RSA server.key\n")
     
-    def test_remove_user_from_secrets_removes_quoted_user(self, mocker, temp_dir):
-        """测试 _remove_user_from_secrets 移除带引号的用户"""
+    def test_render_secrets_skips_inactive_users(self, mocker, temp_dir):
+        """测试已禁用或已过期的 EAP 用户不写入 secrets"""
         from nexus_vpn.protocols.ikev2 import IKEv2Manager
+        from nexus_vpn.core.registry import FLAG_DISABLED
         
         secrets_path = os.path.join(temp_dir, "ipsec.secrets")
         mocker.patch.object(IKEv2Manager, 'SECRETS_FILE', secrets_path)
-        
-        content = """: RSA server.key
-"quoteduser" : EAP "password"
-normaluser : EAP "password"
-"""
+        mocker.patch('nexus_vpn.protocols.ikev2.sudo_run')
         with open(secrets_path, 'w') as f:
-            f.write(content)
+            f.write(": RSA server.key\n")
         
-        IKEv2Manager._remove_user_from_secrets("quoteduser")
+        with IKEv2Manager._registry(write=True) as reg:
+            reg.add("ikev2-eap", "active", secret="pw1")
+            reg.add("ikev2-eap", "disabled", secret="pw2", flags=FLAG_DISABLED)
+            reg.add("ikev2-eap", "expired", secret="pw3", expires_at=1)
+            IKEv2Manager._render_secrets(reg)
         
         with open(secrets_path, 'r') as f:
             result = f.read()
         
-        assert "quoteduser" not in result
-        assert "normaluser : EAP" in result
+        assert 'active : EAP "pw1"' in result
+        assert "disabled" not in result
+        assert "expired" not in result
     
     def test_add_eap_user(self, mocker, temp_dir):
         """测试 add_eap_user 添加用户"""
@@ -178,6 +182,25 @@ normaluser : EAP "password"
         assert 'existinguser : EAP "newpassword"' in result
         assert "oldpassword" not in result
     
+    def test_concurrent_add_eap_user(self, mocker, temp_dir):
+        """测试并发添加 EAP 用户时 ipsec.secrets 不丢失更新"""
+        from concurrent.futures import ThreadPoolExecutor
+        from nexus_vpn.protocols.ikev2 import IKEv2Manager
+        
+        secrets_path = os.path.join(temp_dir, "ipsec.secrets")
+        mocker.patch.object(IKEv2Manager, 'SECRETS_FILE', secrets_path)
+        mocker.patch('nexus_vpn.protocols.ikev2.sudo_run')
+        with open(secrets_path, 'w') as f:
+            f.write(": RSA server.key\n")
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda i: IKEv2Manager.add_eap_user(f"eap{i}", f"pw{i}"), range(16)))
+        
+        with open(secrets_path, 'r') as f:
+            result = f.read()
+        for i in range(16):
+            assert f'eap{i} : EAP "pw{i}"' in result
+    
     def test_remove_eap_user(self, mocker, temp_dir):
         """测试 remove_eap_user 删除用户"""
         from nexus_vpn.protocols.ikev2 import IKEv2Manager
@@ -197,6 +220,58 @@ normaluser : EAP "password"
         assert "deleteuser" not in result
         mock_sudo_run.assert_called_with(["ipsec", "rereadsecrets"])
     
+    def test_update_eap_users_single_reload(self, mocker, temp_dir):
+        """测试批量增删 EAP 用户只改写一次 ipsec.secrets"""
+        from nexus_vpn.protocols.ikev2 import IKEv2Manager
+        
+        secrets_path = os.path.join(temp_dir, "ipsec.secrets")
+        mocker.patch.object(IKEv2Manager, 'SECRETS_FILE', secrets_path)
+        mock_sudo_run = mocker.patch('nexus_vpn.protocols.ikev2.sudo_run')
+        with open(secrets_path, 'w') as f:
+            f.write(': RSA server.key\nold : EAP "pw0"\nkeep : EAP "pw1"\n')
+        
+        added, removed = IKEv2Manager.update_eap_users(
+            add={"alice": "pw-a", "bob": "pw-b", "keep": "changed"}, remove=["old", "ghost"])
+        
+        assert added == ["alice", "bob"]
+        assert removed == ["old"]
+        mock_sudo_run.assert_called_once_with(["ipsec", "rereadsecrets"])
+        with open(secrets_path) as f:
+            result = f.read()
+        assert 'alice : EAP "pw-a"' in result
+        assert 'keep : EAP "pw1"' in result
+        assert "old" not in result
+    
+    def test_update_eap_users_noop(self, mocker, temp_dir):
+        """测试没有实际变更时不重读密钥"""
+        from nexus_vpn.protocols.ikev2 import IKEv2Manager
+        
+        mocker.patch.object(IKEv2Manager, 'SECRETS_FILE', os.path.join(temp_dir, "ipsec.secrets"))
+        mock_sudo_run = mocker.patch('nexus_vpn.protocols.ikev2.sudo_run')
+        
+        assert IKEv2Manager.update_eap_users(remove=["ghost"]) == ([], [])
+        mock_sudo_run.assert_not_called()
+    
+    def test_generate_password(self):
+        """测试自动生成的 EAP 密码可以写入 ipsec.secrets"""
+        from nexus_vpn.protocols.ikev2 import IKEv2Manager
+        
+        passwords = {IKEv2Manager.generate_password() for _ in range(8)}
+        assert len(passwords) == 8
+        for pw in passwords:
+            assert IKEv2Manager.validate_password(pw) == pw
+            assert len(pw) >= 16
+    
+    @pytest.mark.parametrize("password", ["", 'a"b', "a\nb"])
+    def test_add_eap_user_rejects_bad_password(self, mocker, password):
+        """测试拒绝会破坏 ipsec.secrets 格式的密码"""
+        from nexus_vpn.protocols.ikev2 import IKEv2Manager
+        
+        mock_sudo_run = mocker.patch('nexus_vpn.protocols.ikev2.sudo_run')
+        with pytest.raises(ValueError):
+            IKEv2Manager.add_eap_user("alice", password)
+        mock_sudo_run.assert_not_called()
+    
     def test_create_mobileconfig_structure(self, mocker, temp_dir):
         """测试 create_mobileconfig 生成正确的 XML 结构"""
         from nexus_vpn.protocols.ikev2 import IKEv2Manager
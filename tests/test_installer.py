@@ -46,22 +46,22 @@ class TestInstaller:
         assert installer.proto == "vless"
         assert installer.reality_dests == dests
     
+    STEP_METHODS = ('install_dependencies', 'install_xray_binary', 'install_xray_service',
+                    'setup_sysctl', 'setup_nat', 'setup_apparmor')
+    
     def test_run_calls_all_steps(self, mocker):
         """测试 run 方法调用所有安装步骤"""
         from nexus_vpn.core.installer import Installer
         
         mocker.patch('os.path.exists', return_value=False)
-        mock_deps = mocker.patch.object(Installer, 'install_dependencies')
-        mock_xray = mocker.patch.object(Installer, 'install_xray')
-        mock_network = mocker.patch.object(Installer, 'setup_network')
+        mocks = {name: mocker.patch.object(Installer, name) for name in self.STEP_METHODS}
         mock_pki = mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.init_pki')
         
         installer = Installer("example.com", "vless", "www.microsoft.com:443")
         installer.run()
         
-        mock_deps.assert_called_once()
-        mock_xray.assert_called_once()
-        mock_network.assert_called_once()
+        for mock in mocks.values():
+            mock.assert_called_once()
         mock_pki.assert_called_once_with("example.com")
 
     def test_run_idempotent_detects_existing_install(self, mocker):
@@ -77,25 +77,85 @@ class TestInstaller:
             return False
         
         mocker.patch('os.path.exists', side_effect=mock_exists)
-        mock_deps = mocker.patch.object(Installer, 'install_dependencies')
-        mock_xray = mocker.patch.object(Installer, 'install_xray')
-        mock_network = mocker.patch.object(Installer, 'setup_network')
+        mocks = {name: mocker.patch.object(Installer, name) for name in self.STEP_METHODS}
         mock_pki = mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.init_pki')
+        mock_info = mocker.patch('nexus_vpn.core.installer.log.info')
         
         installer = Installer("example.com", "vless", "www.microsoft.com:443")
         installer.run()
         
         # 所有步骤仍应被调用（幂等执行）
-        mock_deps.assert_called_once()
-        mock_xray.assert_called_once()
-        mock_network.assert_called_once()
+        for mock in mocks.values():
+            mock.assert_called_once()
         mock_pki.assert_called_once()
+        mock_info.assert_any_call("检测到已有安装，执行增量更新...")
+    
+    def test_run_overlaps_independent_steps(self, mocker):
+        """测试下载 Xray、安装依赖与写入 sysctl 同时进行，依赖 apt 的步骤在其之后"""
+        import threading
+        from nexus_vpn.core.installer import Installer
+        
+        mocker.patch('os.path.exists', return_value=False)
+        barrier = threading.Barrier(3, timeout=5)
+        order = []
+        
+        def record(name, wait=False):
+            def step(*args):
+                if wait:
+                    barrier.wait()
+                order.append(name)
+            return step
+        
+        for name in ('install_dependencies', 'install_xray_binary', 'setup_sysctl'):
+            mocker.patch.object(Installer, name, side_effect=record(name, wait=True))
+        for name in ('install_xray_service', 'setup_nat', 'setup_apparmor'):
+            mocker.patch.object(Installer, name, side_effect=record(name))
+        mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.init_pki', side_effect=record('pki'))
+        
+        Installer("example.com", "vless", "www.microsoft.com:443").run()
+        
+        deps = order.index('install_dependencies')
+        assert deps < order.index('setup_nat')
+        assert deps < order.index('pki')
+        assert order.index('install_xray_binary') < order.index('install_xray_service')
+    
+    def test_run_stops_after_failure(self, mocker):
+        """测试步骤失败时抛出原异常，依赖它的步骤不再执行"""
+        import subprocess
+        from nexus_vpn.core.installer import Installer
+        
+        mocker.patch('os.path.exists', return_value=False)
+        error = subprocess.CalledProcessError(1, ["sysctl", "-p"])
+        mocks = {name: mocker.patch.object(Installer, name) for name in self.STEP_METHODS}
+        mocks['install_dependencies'].side_effect = error
+        mock_pki = mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.init_pki')
+        mock_timings = mocker.patch.object(Installer, 'print_timings')
+        
+        with pytest.raises(subprocess.CalledProcessError):
+            Installer("example.com", "vless", "www.microsoft.com:443").run()
+        
+        mocks['setup_nat'].assert_not_called()
+        mock_pki.assert_not_called()
+        results = {r['name']: r['status'] for r in mock_timings.call_args[0][0]}
+        assert results['deps'] == "failed"
+        assert results['pki'] == "skipped"
+    
+    def test_steps_shards_wait_for_nftables(self):
+        """测试分片模式的服务单元在安装依赖（nftables）之后部署"""
+        from nexus_vpn.core.installer import Installer
+        
+        single = {s.name: s for s in Installer("example.com", "vless", [], 1).steps()}
+        sharded = {s.name: s for s in Installer("example.com", "vless", [], 4).steps()}
+        assert single['xray_service'].after == ("xray_binary",)
+        assert "deps" in sharded['xray_service'].after
     
     def test_install_dependencies_apt(self, mocker):
         """测试使用 apt-get 安装依赖"""
         from nexus_vpn.core.installer import Installer
         
         mocker.patch('shutil.which', side_effect=lambda x: '/usr/bin/apt-get' if x == 'apt-get' else None)
+        mocker.patch.object(Installer, '_missing_packages', side_effect=lambda pkgs, rpm=False: list(pkgs))
+        mocker.patch.object(Installer, '_apt_lists_fresh', return_value=False)
         mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run')
         
         installer = Installer("example.com", "vless", "www.microsoft.com:443")
@@ -118,6 +178,7 @@ class TestInstaller:
             return None
         
         mocker.patch('shutil.which', side_effect=which_side_effect)
+        mocker.patch.object(Installer, '_missing_packages', side_effect=lambda pkgs, rpm=False: list(pkgs))
         mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run')
         
         installer = Installer("example.com", "vless", "www.microsoft.com:443")
@@ -125,6 +186,9 @@ class TestInstaller:
         
         calls = [str(c) for c in mock_sudo_run.call_args_list]
         assert any('yum' in str(c) for c in calls)
+        # Debian 专有包名映射为 RPM 包名
+        assert 'iptables-services' in mock_sudo_run.call_args[0][0]
+        assert 'strongswan-pki' not in mock_sudo_run.call_args[0][0]
     
     def test_install_dependencies_handles_error(self, mocker):
         """测试安装依赖时处理错误"""
@@ -132,6 +196,8 @@ class TestInstaller:
         import subprocess
         
         mocker.patch('shutil.which', return_value='/usr/bin/apt-get')
+        mocker.patch.object(Installer, '_missing_packages', side_effect=lambda pkgs, rpm=False: list(pkgs))
+        mocker.patch.object(Installer, '_apt_lists_fresh', return_value=False)
         mocker.patch('nexus_vpn.core.installer.sudo_run', side_effect=subprocess.CalledProcessError(1, 'apt-get'))
         
         installer = Installer("example.com", "vless", "www.microsoft.com:443")
@@ -139,12 +205,117 @@ class TestInstaller:
         # 不应该抛出异常
         installer.install_dependencies()
     
+    def test_install_dependencies_all_installed(self, mocker):
+        """测试依赖均已安装时不调用 apt-get"""
+        from nexus_vpn.core.installer import Installer
+        
+        mocker.patch('shutil.which', side_effect=lambda x: '/usr/bin/apt-get' if x == 'apt-get' else None)
+        mocker.patch.object(Installer, '_missing_packages', return_value=[])
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run')
+        
+        Installer("example.com", "vless", []).install_dependencies()
+        
+        mock_sudo_run.assert_not_called()
+    
+    def test_install_dependencies_fresh_lists(self, mocker):
+        """测试索引在有效期内时跳过 apt-get update，只安装缺失的包"""
+        from nexus_vpn.core.installer import Installer
+        
+        mocker.patch('shutil.which', side_effect=lambda x: '/usr/bin/apt-get' if x == 'apt-get' else None)
+        mocker.patch.object(Installer, '_missing_packages', return_value=["nftables"])
+        mocker.patch.object(Installer, '_apt_lists_fresh', return_value=True)
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run')
+        
+        Installer("example.com", "vless", [], 2).install_dependencies()
+        
+        assert [c[0][0] for c in mock_sudo_run.call_args_list] == [["apt-get", "install", "-y", "nftables"]]
+    
+    def test_install_dependencies_fresh_lists_retry(self, mocker):
+        """测试跳过 update 后安装失败时更新索引并重试"""
+        from nexus_vpn.core.installer import Installer
+        import subprocess
+        
+        mocker.patch('shutil.which', side_effect=lambda x: '/usr/bin/apt-get' if x == 'apt-get' else None)
+        mocker.patch.object(Installer, '_missing_packages', return_value=["curl"])
+        mocker.patch.object(Installer, '_apt_lists_fresh', return_value=True)
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run',
+                                     side_effect=[subprocess.CalledProcessError(100, 'apt-get'), None, None])
+        
+        Installer("example.com", "vless", []).install_dependencies()
+        
+        assert [c[0][0][:2] for c in mock_sudo_run.call_args_list] == \
+            [["apt-get", "install"], ["apt-get", "update"], ["apt-get", "install"]]
+    
+    def test_missing_packages_dpkg(self, mocker):
+        """测试解析 dpkg-query 输出，只有 ii 状态算已安装"""
+        from nexus_vpn.core.installer import Installer
+        
+        mock_run = mocker.patch('nexus_vpn.core.installer.subprocess.run')
+        mock_run.return_value.stdout = "curl\tii \nwget\trc \n"
+        
+        assert Installer._missing_packages(["curl", "wget", "unzip"]) == ["wget", "unzip"]
+        assert mock_run.call_count == 1
+        assert mock_run.call_args[0][0][-3:] == ["curl", "wget", "unzip"]
+    
+    def test_missing_packages_rpm(self, mocker):
+        """测试解析 rpm -q 输出"""
+        from nexus_vpn.core.installer import Installer
+        
+        mock_run = mocker.patch('nexus_vpn.core.installer.subprocess.run')
+        mock_run.return_value.stdout = "curl\npackage strongswan is not installed\n"
+        
+        assert Installer._missing_packages(["curl", "strongswan"], rpm=True) == ["strongswan"]
+    
+    def test_apt_lists_fresh(self, mocker, temp_dir):
+        """测试按 Release 文件的修改时间判断索引是否新鲜"""
+        from nexus_vpn.core.installer import Installer
+        import time
+        
+        mocker.patch.object(Installer, 'APT_LISTS_DIR', temp_dir)
+        mocker.patch.object(Installer, 'APT_UPDATE_STAMP', os.path.join(temp_dir, "stamp"))
+        assert Installer._apt_lists_fresh() is False
+        
+        release = os.path.join(temp_dir, "deb.debian.org_debian_dists_bookworm_InRelease")
+        open(release, "w").close()
+        assert Installer._apt_lists_fresh() is True
+        
+        old = time.time() - Installer.APT_LISTS_MAX_AGE - 60
+        os.utime(release, (old, old))
+        assert Installer._apt_lists_fresh() is False
+    
+    def test_install_dependencies_from_bundle(self, mocker):
+        """测试指定离线安装包时从包内安装，不执行 apt-get update"""
+        from nexus_vpn.core.installer import Installer
+        
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run')
+        bundle = MagicMock()
+        
+        Installer("example.com", "vless", [], bundle=bundle).install_dependencies()
+        
+        bundle.install_packages.assert_called_once()
+        mock_sudo_run.assert_not_called()
+    
+    def test_install_xray_binary_from_bundle(self, mocker):
+        """测试指定离线安装包时使用包内的 Xray 发布包，不下载"""
+        from nexus_vpn.core.installer import Installer
+        
+        mocker.patch('os.path.exists', return_value=False)
+        mock_fetch = mocker.patch('nexus_vpn.core.installer.fetch_verified')
+        mock_install = mocker.patch.object(Installer, '_install_xray_zip')
+        bundle = MagicMock(xray_zip="/tmp/b/xray/Xray-linux-64.zip", xray_version="1.8.6")
+        
+        Installer("example.com", "vless", [], bundle=bundle).install_xray_binary()
+        
+        mock_fetch.assert_not_called()
+        mock_install.assert_called_once_with("/tmp/b/xray/Xray-linux-64.zip", "1.8.6")
+    
     def test_install_xray_already_exists(self, mocker):
         """测试 Xray 已存在时跳过下载"""
         from nexus_vpn.core.installer import Installer
         
         mocker.patch('os.path.exists', return_value=True)
-        mock_urlretrieve = mocker.patch('urllib.request.urlretrieve')
+        mock_fetch = mocker.patch('nexus_vpn.core.installer.fetch_verified')
+        mocker.patch.object(Installer, '_remove_xray_shards')
         mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run')
         mock_sudo_write = mocker.patch('nexus_vpn.core.installer.sudo_write_file')
         
@@ -152,12 +323,88 @@ class TestInstaller:
         installer.install_xray()
         
         # 不应该下载
-        mock_urlretrieve.assert_not_called()
+        mock_fetch.assert_not_called()
         
         # 但应该创建 systemd service
         mock_sudo_write.assert_called()
         mock_sudo_run.assert_called()
     
+    def test_xray_url_mirror(self):
+        """测试镜像地址替换 GitHub 下载根地址"""
+        from nexus_vpn.core.installer import Installer
+        
+        url = Installer.get_xray_download_url("1.8.6", "https://mirror.example.com/xray/")
+        assert url == "https://mirror.example.com/xray/v1.8.6/Xray-linux-64.zip"
+    
+    def test_update_xray_download_failure_keeps_service(self, mocker):
+        """测试下载或校验失败时不停止正在运行的 Xray"""
+        from nexus_vpn.core.installer import Installer
+        from nexus_vpn.utils.download import DownloadError
+        
+        mocker.patch.object(Installer, '_get_current_xray_version', return_value="1.8.4")
+        mocker.patch('nexus_vpn.core.installer.fetch_verified', side_effect=DownloadError("SHA-256 校验失败"))
+        mock_install = mocker.patch.object(Installer, '_download_and_install_xray')
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run')
+        
+        Installer.update_xray("1.8.6", "/srv/cache", "https://mirror.example.com")
+        
+        mock_install.assert_not_called()
+        mock_sudo_run.assert_not_called()
+    
+    def test_update_xray_restarts_all_shards(self, mocker):
+        """测试分片模式下停止、启动并检查所有 nexus-xray@N，不启动单实例单元"""
+        from nexus_vpn.core.installer import Installer
+        
+        mocker.patch.object(Installer, '_get_current_xray_version', return_value="1.8.4")
+        mocker.patch('nexus_vpn.core.installer.fetch_verified')
+        mocker.patch.object(Installer, '_download_and_install_xray')
+        mocker.patch.object(Installer, '_xray_units',
+                            return_value=[("nexus-xray@0", 20000), ("nexus-xray@1", 20001)])
+        mock_healthy = mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager._healthy', return_value=True)
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run')
+        mock_move = mocker.patch('nexus_vpn.core.installer.sudo_move')
+        
+        Installer.update_xray("1.8.6")
+        
+        commands = [c[0][0] for c in mock_sudo_run.call_args_list]
+        assert commands[0] == ["systemctl", "stop", "nexus-xray@0", "nexus-xray@1"]
+        assert commands[1:] == [["systemctl", "start", "nexus-xray@0"], ["systemctl", "start", "nexus-xray@1"]]
+        assert [c[0] for c in mock_healthy.call_args_list] == [("nexus-xray@0", 20000), ("nexus-xray@1", 20001)]
+        mock_move.assert_not_called()
+    
+    def test_update_xray_health_failure_rolls_back(self, mocker):
+        """测试任一分片健康检查失败时恢复旧二进制并重启全部分片"""
+        from nexus_vpn.core.installer import Installer
+        
+        mocker.patch.object(Installer, '_get_current_xray_version', return_value="1.8.4")
+        mocker.patch('nexus_vpn.core.installer.fetch_verified')
+        mocker.patch.object(Installer, '_download_and_install_xray')
+        mocker.patch.object(Installer, '_xray_units',
+                            return_value=[("nexus-xray@0", 20000), ("nexus-xray@1", 20001)])
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager._healthy', side_effect=[True, False])
+        mocker.patch('nexus_vpn.core.installer.os.path.exists', return_value=True)
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run')
+        mock_move = mocker.patch('nexus_vpn.core.installer.sudo_move')
+        
+        Installer.update_xray("1.8.6")
+        
+        mock_move.assert_called_once_with("/usr/local/bin/xray.bak", "/usr/local/bin/xray")
+        assert mock_sudo_run.call_args[0][0] == ["systemctl", "restart", "nexus-xray@0", "nexus-xray@1"]
+    
+    def test_xray_units_from_config(self, mocker):
+        """测试按部署的配置确定单元与端口"""
+        from nexus_vpn.core.installer import Installer
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        mocker.patch.object(V2RayManager, 'config_exists', return_value=False)
+        assert Installer._xray_units() == [("nexus-xray", None)]
+        
+        mocker.patch.object(V2RayManager, 'config_exists', return_value=True)
+        mocker.patch.object(V2RayManager, '_load_base', return_value={"inbounds": [{"port": 443}]})
+        mocker.patch.object(V2RayManager, '_shard_count', return_value=2)
+        assert Installer._xray_units() == [("nexus-xray@0", V2RayManager.SHARD_BASE_PORT),
+                                           ("nexus-xray@1", V2RayManager.SHARD_BASE_PORT + 1)]
+    
     def test_install_xray_downloads_and_extracts(self, mocker, temp_dir):
         """测试下载并解压 Xray"""
         from nexus_vpn.core.installer import Installer
@@ -175,7 +422,8 @@ class TestInstaller:
             return True
         
         mocker.patch('os.path.exists', side_effect=mock_exists)
-        mocker.patch('urllib.request.urlretrieve')
+        mock_fetch = mocker.patch('nexus_vpn.core.installer.fetch_verified', return_value=zip_path)
+        mocker.patch.object(Installer, '_remove_xray_shards')
         mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run')
         mock_sudo_write = mocker.patch('nexus_vpn.core.installer.sudo_write_file')
         mock_sudo_move = mocker.patch('nexus_vpn.core.installer.sudo_move')
@@ -194,6 +442,8 @@ class TestInstaller:
         installer = Installer("example.com", "vless", "www.microsoft.com:443")
         installer.install_xray()
         
+        mock_fetch.assert_called_once_with(Installer.get_xray_download_url(Installer.XRAY_VERSION), cache_dir=None)
+        
         # 验证 systemd 命令被调用
         calls = [str(c) for c in mock_sudo_run.call_args_list]
         assert any('daemon-reload' in c for c in calls)
@@ -232,6 +482,59 @@ class TestInstaller:
         calls = [str(c) for c in mock_sudo_run.call_args_list]
         assert any('sysctl' in c for c in calls)
     
+    def test_setup_sysctl_profile(self, mocker, temp_dir):
+        """测试写入 sysctl.d 档位并只加载该文件，连接跟踪模块开机先加载"""
+        from nexus_vpn.core.installer import Installer
+        
+        mocker.patch('nexus_vpn.core.installer.LEGACY_SYSCTL_CONF', os.path.join(temp_dir, "sysctl.conf"))
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run',
+                                     return_value=MagicMock(returncode=0, stderr=""))
+        mock_sudo_write = mocker.patch('nexus_vpn.core.installer.sudo_write_file')
+        
+        Installer("example.com", "vless", []).setup_sysctl()
+        
+        written = {c.args[0]: c.args[1] for c in mock_sudo_write.call_args_list}
+        profile = written["/etc/sysctl.d/90-nexus-vpn.conf"]
+        assert "net.netfilter.nf_conntrack_max = " in profile
+        assert "net.ipv4.ip_local_reserved_ports = 20443-20698" in profile
+        assert written["/etc/modules-load.d/nexus-vpn.conf"] == "nf_conntrack\n"
+        assert written["/etc/modprobe.d/nexus-vpn.conf"].startswith("options nf_conntrack hashsize=")
+        calls = [c.args[0] for c in mock_sudo_run.call_args_list]
+        assert ["sysctl", "-e", "-p", "/etc/sysctl.d/90-nexus-vpn.conf"] in calls
+        assert calls.index(["modprobe", "nf_conntrack"]) < calls.index(["sysctl", "-e", "-p", "/etc/sysctl.d/90-nexus-vpn.conf"])
+    
+    def test_setup_sysctl_partial_failure_warns(self, mocker, temp_dir):
+        """测试个别参数不可写时只给出警告"""
+        from nexus_vpn.core.installer import Installer
+        
+        mocker.patch('nexus_vpn.core.installer.LEGACY_SYSCTL_CONF', os.path.join(temp_dir, "sysctl.conf"))
+        mocker.patch('nexus_vpn.core.installer.sudo_run', return_value=MagicMock(
+            returncode=255, stderr="sysctl: permission denied on key \"net.netfilter.nf_conntrack_buckets\""))
+        mocker.patch('nexus_vpn.core.installer.sudo_write_file')
+        mock_warning = mocker.patch('nexus_vpn.core.installer.log.warning')
+        
+        Installer("example.com", "vless", []).setup_sysctl()
+        
+        assert "nf_conntrack_buckets" in mock_warning.call_args[0][0]
+    
+    def test_remove_legacy_sysctl(self, mocker, temp_dir):
+        """测试删除旧版本写入 /etc/sysctl.conf 的设置，保留用户自己的配置"""
+        from nexus_vpn.core.installer import Installer
+        
+        path = os.path.join(temp_dir, "sysctl.conf")
+        with open(path, "w") as f:
+            f.write("# user\nnet.ipv4.tcp_syncookies=1\nnet.core.default_qdisc=cake\n\n"
+                    "# NexusVPN settings\nnet.ipv4.ip_forward=1\nnet.ipv6.conf.all.forwarding=1\n"
+                    "net.core.default_qdisc=fq\nnet.ipv4.tcp_congestion_control=bbr\n")
+        mocker.patch('nexus_vpn.core.installer.sudo_read_file', side_effect=lambda p: open(p).read())
+        mocker.patch('nexus_vpn.core.installer.sudo_write_file',
+                     side_effect=lambda p, content: open(p, "w").write(content))
+        
+        Installer._remove_legacy_sysctl(path)
+        
+        with open(path) as f:
+            assert f.read() == "# user\nnet.ipv4.tcp_syncookies=1\nnet.core.default_qdisc=cake\n"
+    
     def test_setup_network_configures_iptables(self, mocker):
         """测试配置 iptables NAT"""
         from nexus_vpn.core.installer import Installer
@@ -274,3 +577,242 @@ class TestInstaller:
         
         # 验证文件删除
         assert mock_sudo_remove.called
+        assert any('nexus_vpn' in c and 'delete' in c for c in calls)
+
+    def test_cleanup_removes_kernel_tuning(self, mocker):
+        """测试卸载删除 sysctl 档位、modules-load.d 与 modprobe.d 配置"""
+        from nexus_vpn.core.installer import Installer
+        from nexus_vpn.core.kernel_tuning import SYSCTL_PROFILE_PATH, MODULES_LOAD_PATH, MODPROBE_PATH
+        
+        mocker.patch('nexus_vpn.core.installer.sudo_run')
+        mock_sudo_remove = mocker.patch('nexus_vpn.core.installer.sudo_remove')
+        
+        Installer.cleanup()
+        
+        removed = [c[0][0] for c in mock_sudo_remove.call_args_list]
+        for path in (SYSCTL_PROFILE_PATH, MODULES_LOAD_PATH, MODPROBE_PATH):
+            assert path in removed
+
+    def test_cleanup_removes_nic_unit(self, mocker):
+        """测试卸载时禁用并删除网卡调优单元，然后 daemon-reload"""
+        from nexus_vpn.core.installer import Installer
+        from nexus_vpn.core.nic_tuning import NicTuner
+        
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run')
+        mock_sudo_remove = mocker.patch('nexus_vpn.core.installer.sudo_remove')
+        
+        Installer.cleanup()
+        
+        commands = [c[0][0] for c in mock_sudo_run.call_args_list]
+        assert ["systemctl", "disable", NicTuner.SERVICE_NAME] in commands
+        assert commands[-1] == ["systemctl", "daemon-reload"]
+        assert NicTuner.SERVICE_PATH in [c[0][0] for c in mock_sudo_remove.call_args_list]
+
+    def test_render_shard_ruleset(self):
+        """测试分片分流规则的渲染"""
+        from nexus_vpn.core.installer import Installer
+        
+        ruleset = Installer.render_shard_ruleset(3)
+        
+        assert "delete table inet nexus_xray" in ruleset
+        assert "type nat hook prerouting priority dstnat" in ruleset
+        assert ("tcp dport 443 fib daddr type local redirect to :numgen inc mod 3 "
+                "map { 0 : 20443, 1 : 20444, 2 : 20445 }") in ruleset
+    
+    def test_render_nat_ruleset(self):
+        """测试 NAT 规则：SNAT 到检测到的地址，并放行客户端出网的转发"""
+        from nexus_vpn.core.installer import Installer
+        
+        ruleset = Installer.render_nat_ruleset("eth0", "203.0.113.10")
+        
+        assert ruleset.index("table inet nexus_vpn") < ruleset.index("delete table inet nexus_vpn")
+        assert "type nat hook postrouting priority srcnat" in ruleset
+        assert 'ip saddr 10.10.10.0/24 oifname "eth0" snat ip to 203.0.113.10' in ruleset
+        assert "masquerade" not in ruleset
+        assert "type filter hook forward priority filter" in ruleset
+        assert "ct state established,related accept" in ruleset
+        assert 'ip saddr 10.10.10.0/24 oifname "eth0" accept' in ruleset
+        assert 'ip daddr 10.10.10.0/24 iifname "eth0" drop' in ruleset
+        assert "ip6" not in ruleset
+    
+    def test_render_nat_ruleset_fallbacks(self):
+        """测试未检测到 IPv4 地址时回退为 masquerade，有 IPv6 地址时转换 IPv6"""
+        from nexus_vpn.core.installer import Installer
+        
+        ruleset = Installer.render_nat_ruleset("ens3", None, "2001:db8::10")
+        
+        assert 'ip saddr 10.10.10.0/24 oifname "ens3" masquerade' in ruleset
+        assert 'ip6 saddr fd00:10:10:10::/64 oifname "ens3" snat ip6 to 2001:db8::10' in ruleset
+        assert 'ip6 daddr fd00:10:10:10::/64 iifname "ens3" drop' in ruleset
+    
+    def test_iface_address(self, mocker):
+        """测试解析 ip -o addr 输出"""
+        from nexus_vpn.core.installer import Installer
+        
+        mock_run = mocker.patch('nexus_vpn.core.installer.subprocess.run')
+        mock_run.return_value.stdout = ("2: eth0    inet 203.0.113.10/24 brd 203.0.113.255 scope global eth0\\"
+                                        "       valid_lft forever preferred_lft forever\n")
+        assert Installer._iface_address("eth0") == "203.0.113.10"
+        mock_run.return_value.stdout = ""
+        assert Installer._iface_address("eth0", 6) is None
+    
+    def test_setup_nat_nftables(self, mocker, temp_dir):
+        """测试有 nft 时一次 nft -f 加载规则文件并注册开机加载"""
+        from nexus_vpn.core.installer import Installer
+        
+        mocker.patch.object(Installer, 'NAT_NFT_PATH', os.path.join(temp_dir, "nat.nft"))
+        mocker.patch('shutil.which', side_effect=lambda x: '/usr/sbin/nft' if x == 'nft' else None)
+        mocker.patch.object(Installer, '_default_iface', return_value="eth0")
+        mocker.patch.object(Installer, '_iface_address',
+                            side_effect=lambda iface, family=4: "203.0.113.10" if family == 4 else None)
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run')
+        mock_sudo_write = mocker.patch('nexus_vpn.core.installer.sudo_write_file')
+        mocker.patch('nexus_vpn.core.installer.sudo_makedirs')
+        
+        Installer("example.com", "vless", []).setup_nat()
+        
+        written = {c.args[0]: c.args[1] for c in mock_sudo_write.call_args_list}
+        assert "snat ip to 203.0.113.10" in written[Installer.NAT_NFT_PATH]
+        assert f"ExecStart=/usr/sbin/nft -f {Installer.NAT_NFT_PATH}" in written[Installer.NAT_UNIT_PATH]
+        calls = [c.args[0] for c in mock_sudo_run.call_args_list]
+        assert calls.count(["nft", "-f", Installer.NAT_NFT_PATH]) == 1
+        assert ["systemctl", "enable", "nexus-vpn-nat"] in calls
+        # 只删除旧的 iptables 规则，不再添加
+        assert not any(c[0] == "iptables" and "-A" in c for c in calls)
+        assert not any(c[0] == "netfilter-persistent" for c in calls)
+    
+    def test_setup_nat_nft_failure_falls_back(self, mocker, temp_dir):
+        """测试 nft -f 失败时回退到 iptables MASQUERADE"""
+        from nexus_vpn.core.installer import Installer
+        import subprocess
+        
+        mocker.patch.object(Installer, 'NAT_NFT_PATH', os.path.join(temp_dir, "nat.nft"))
+        mocker.patch('shutil.which', side_effect=lambda x: '/usr/sbin/nft' if x == 'nft' else None)
+        mocker.patch.object(Installer, '_default_iface', return_value="eth0")
+        mocker.patch.object(Installer, '_iface_address', return_value=None)
+        mocker.patch('nexus_vpn.core.installer.sudo_write_file')
+        mocker.patch('nexus_vpn.core.installer.sudo_makedirs')
+        
+        def run(args, **kwargs):
+            if args[:2] == ["nft", "-f"]:
+                raise subprocess.CalledProcessError(1, args)
+            return MagicMock(returncode=0)
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run', side_effect=run)
+        
+        Installer("example.com", "vless", []).setup_nat()
+        
+        mock_sudo_run.assert_any_call(
+            ["iptables", "-t", "nat", "-A", "POSTROUTING", "-s", "10.10.10.0/24", "-o", "eth0", "-j", "MASQUERADE"],
+            check=True
+        )
+        mock_sudo_run.assert_any_call(["nft", "delete", "table", "inet", "nexus_vpn"], stderr=subprocess.DEVNULL)
+    
+    def test_render_nat_ruleset_flowtable(self):
+        """测试 flowtable 声明在出口网卡上，客户端 TCP/UDP 连接加入快速路径"""
+        from nexus_vpn.core.installer import Installer
+        
+        ruleset = Installer.render_nat_ruleset("eth0", "203.0.113.10", "2001:db8::10", flowtable=True)
+        
+        assert 'flowtable ft {\n        hook ingress priority 0; devices = { "eth0" };' in ruleset
+        flow = "ip saddr 10.10.10.0/24 meta l4proto { tcp, udp } flow add @ft"
+        assert flow in ruleset
+        assert "ip6 saddr fd00:10:10:10::/64 meta l4proto { tcp, udp } flow add @ft" in ruleset
+        # flow add 必须在 established 放行规则之前，否则不会被执行
+        assert ruleset.index(flow) < ruleset.index("ct state established,related accept")
+        assert "flowtable" not in Installer.render_nat_ruleset("eth0", "203.0.113.10")
+    
+    def test_setup_nat_flowtable_unsupported(self, mocker, temp_dir):
+        """测试内核不支持 flowtable 时去掉 flowtable 重新加载，仍使用 nftables"""
+        from nexus_vpn.core.installer import Installer
+        import subprocess
+        
+        nft_path = os.path.join(temp_dir, "nat.nft")
+        mocker.patch.object(Installer, 'NAT_NFT_PATH', nft_path)
+        mocker.patch('shutil.which', side_effect=lambda x: '/usr/sbin/nft' if x == 'nft' else None)
+        mocker.patch.object(Installer, '_default_iface', return_value="eth0")
+        mocker.patch.object(Installer, '_iface_address', return_value=None)
+        mocker.patch('nexus_vpn.core.installer.sudo_makedirs')
+        loaded = []
+        
+        def write(path, content):
+            with open(path, "w") as f:
+                f.write(content)
+        mocker.patch('nexus_vpn.core.installer.sudo_write_file', side_effect=write)
+        
+        def run(args, **kwargs):
+            if args[:2] == ["nft", "-f"]:
+                content = open(args[2]).read()
+                loaded.append(content)
+                if "flowtable" in content:
+                    raise subprocess.CalledProcessError(1, args, stderr="Error: Could not process rule: No such file or directory")
+            return MagicMock(returncode=0)
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run', side_effect=run)
+        
+        Installer("example.com", "vless", [], flow_offload=True).setup_nat()
+        
+        assert len(loaded) == 2
+        assert "flowtable" not in open(nft_path).read()
+        assert not any(c.args[0][0] == "iptables" and "-A" in c.args[0] for c in mock_sudo_run.call_args_list)
+    
+    def test_setup_nat_keeps_existing_flowtable(self, mocker, temp_dir):
+        """测试未指定 flow_offload 时沿用现有规则文件的设置"""
+        from nexus_vpn.core.installer import Installer
+        
+        nft_path = os.path.join(temp_dir, "nat.nft")
+        with open(nft_path, "w") as f:
+            f.write(Installer.render_nat_ruleset("eth0", flowtable=True))
+        mocker.patch.object(Installer, 'NAT_NFT_PATH', nft_path)
+        mocker.patch('shutil.which', side_effect=lambda x: '/usr/sbin/nft' if x == 'nft' else None)
+        mocker.patch.object(Installer, '_default_iface', return_value="eth0")
+        mock_setup = mocker.patch.object(Installer, '_setup_nft_nat', return_value=True)
+        
+        Installer("example.com", "vless", []).setup_nat()
+        mock_setup.assert_called_with("eth0", True)
+        
+        Installer("example.com", "vless", [], flow_offload=False).setup_nat()
+        mock_setup.assert_called_with("eth0", False)
+    
+    def test_flow_offload_status(self, mocker, temp_dir):
+        """测试统计连接跟踪表中被卸载的连接"""
+        from nexus_vpn.core.installer import Installer
+        
+        nft_path = os.path.join(temp_dir, "nat.nft")
+        mocker.patch.object(Installer, 'NAT_NFT_PATH', nft_path)
+        assert Installer.flow_offload_status() == {"configured": False, "active": False, "flows": None}
+        
+        with open(nft_path, "w") as f:
+            f.write(Installer.render_nat_ruleset("eth0", flowtable=True))
+        mocker.patch('shutil.which', return_value=None)
+        conntrack = ("ipv4     2 tcp      6 src=10.10.10.2 dst=1.1.1.1 sport=5 dport=443 [OFFLOAD] mark=0 use=2\n"
+                     "ipv4     2 udp      17 30 src=10.10.10.3 dst=8.8.8.8 sport=5 dport=53 [HW_OFFLOAD] mark=0 use=2\n"
+                     "ipv4     2 tcp      6 431999 ESTABLISHED src=10.0.0.1 dst=10.0.0.2 [ASSURED] mark=0 use=1\n")
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run',
+                                     side_effect=[MagicMock(returncode=0), MagicMock(returncode=0, stdout=conntrack)])
+        
+        assert Installer.flow_offload_status() == {"configured": True, "active": True, "flows": 2}
+        assert mock_sudo_run.call_args_list[0].args[0] == ["nft", "list", "flowtable", "inet", "nexus_vpn", "ft"]
+        assert mock_sudo_run.call_args_list[1].args[0] == ["cat", "/proc/net/nf_conntrack"]
+    
+    def test_install_xray_shards(self, mocker, temp_dir):
+        """测试分片模式写入模板单元并启用每个实例"""
+        from nexus_vpn.core.installer import Installer
+        
+        mocker.patch('os.path.exists', return_value=True)
+        mocker.patch.object(Installer, 'SHARD_NFT_PATH', os.path.join(temp_dir, "xray-shards.nft"))
+        mocker.patch.object(Installer, '_disable_xray_shards')
+        mock_sudo_run = mocker.patch('nexus_vpn.core.installer.sudo_run')
+        mock_sudo_write = mocker.patch('nexus_vpn.core.installer.sudo_write_file')
+        mocker.patch('nexus_vpn.core.installer.sudo_makedirs')
+        
+        installer = Installer("example.com", "vless", "www.microsoft.com:443", xray_shards=4)
+        installer.install_xray()
+        
+        written = {c.args[0]: c.args[1] for c in mock_sudo_write.call_args_list}
+        assert "mod 4" in written[Installer.SHARD_NFT_PATH]
+        unit = written[Installer.SHARD_UNIT_PATH]
+        assert "-confdir" in unit and "shards/%i\n" in unit
+        assert f"ExecStartPre=-/usr/sbin/nft -f {Installer.SHARD_NFT_PATH}" in unit
+        mock_sudo_run.assert_any_call(
+            ["systemctl", "enable", "nexus-xray@0", "nexus-xray@1", "nexus-xray@2", "nexus-xray@3"],
+            check=True
+        )
@@ -0,0 +1,85 @@
+"""测试 nexus_vpn.core.kernel_tuning 模块"""
+import os
+
+
+class TestKernelTuning:
+    """内核参数档位测试"""
+
+    def test_profile_scales_with_memory_and_cores(self):
+        """测试缓冲与连接跟踪表随内存增长、队列随核数增长，并受上下限约束"""
+        from nexus_vpn.core.kernel_tuning import build_profile
+
+        small = build_profile(mem_bytes=512 << 20, cpus=1)
+        large = build_profile(mem_bytes=8 << 30, cpus=8)
+        huge = build_profile(mem_bytes=256 << 30, cpus=128)
+
+        assert small["net.core.rmem_max"] == str(4 << 20)
+        assert large["net.core.rmem_max"] == str(32 << 20)
+        assert huge["net.core.rmem_max"] == str(64 << 20)
+        assert large["net.ipv4.tcp_rmem"] == f"4096 131072 {32 << 20}"
+        assert small["net.core.netdev_max_backlog"] == "4096"
+        assert large["net.core.netdev_max_backlog"] == "16384"
+        assert huge["net.core.netdev_max_backlog"] == "65536"
+        assert small["net.core.somaxconn"] == "4096"
+        assert huge["net.core.somaxconn"] == "65535"
+        assert small["net.netfilter.nf_conntrack_max"] == "65536"
+        assert large["net.netfilter.nf_conntrack_max"] == "524288"
+        assert large["net.netfilter.nf_conntrack_buckets"] == "131072"
+        assert huge["net.netfilter.nf_conntrack_max"] == "2097152"
+        assert large["net.ipv4.tcp_fastopen"] == "3"
+        assert large["net.ipv4.ip_local_port_range"] == "10240 65535"
+        # 原有的转发与 BBR 设置仍在档位中
+        assert large["net.ipv4.ip_forward"] == "1"
+        assert large["net.ipv4.tcp_congestion_control"] == "bbr"
+        assert "net.ipv4.ip_local_reserved_ports" not in large
+
+    def test_conntrack_buckets_page_aligned(self):
+        """测试按内存算出的桶数取整到 512 的倍数（与内核实际使用的值一致）"""
+        from nexus_vpn.core.kernel_tuning import build_profile
+
+        profile = build_profile(mem_bytes=8_000_000_000, cpus=4)
+        assert profile["net.netfilter.nf_conntrack_max"] == "488281"
+        assert profile["net.netfilter.nf_conntrack_buckets"] == "122368"
+        assert build_profile(mem_bytes=1 << 30, cpus=1)["net.netfilter.nf_conntrack_buckets"] == "16384"
+
+    def test_reserved_ports(self):
+        """测试保留端口"""
+        from nexus_vpn.core.kernel_tuning import build_profile
+
+        profile = build_profile(mem_bytes=1 << 30, cpus=2, reserved_ports="20443-20698")
+        assert profile["net.ipv4.ip_local_reserved_ports"] == "20443-20698"
+
+    def test_render_and_parse(self):
+        """测试渲染的文件可以解析回同一档位"""
+        from nexus_vpn.core.kernel_tuning import build_profile, render_profile, parse_profile
+
+        profile = build_profile(mem_bytes=2 << 30, cpus=2)
+        text = render_profile(profile, mem_bytes=2 << 30, cpus=2)
+
+        assert text.startswith("# 由 nexus-vpn 生成")
+        assert "# 按 2048 MB 内存、2 核计算" in text
+        assert "net.ipv4.tcp_wmem = 4096 65536 8388608\n" in text
+        assert parse_profile(text) == profile
+
+    def test_read_live(self, temp_dir):
+        """测试从 /proc/sys 结构读取，不存在的键为 None"""
+        from nexus_vpn.core.kernel_tuning import read_live
+
+        os.makedirs(os.path.join(temp_dir, "net", "ipv4"))
+        with open(os.path.join(temp_dir, "net", "ipv4", "tcp_rmem"), "w") as f:
+            f.write("4096\t131072\t6291456\n")
+
+        live = read_live(["net.ipv4.tcp_rmem", "net.netfilter.nf_conntrack_max"], root=temp_dir)
+        assert live == {"net.ipv4.tcp_rmem": "4096\t131072\t6291456", "net.netfilter.nf_conntrack_max": None}
+
+    def test_drift(self):
+        """测试忽略空白差异，报告不同值与不可读的键"""
+        from nexus_vpn.core.kernel_tuning import drift
+
+        profile = {"net.ipv4.tcp_rmem": "4096 131072 8388608", "net.core.somaxconn": "4096",
+                   "net.netfilter.nf_conntrack_max": "65536"}
+        live = {"net.ipv4.tcp_rmem": "4096\t131072\t8388608", "net.core.somaxconn": "128",
+                "net.netfilter.nf_conntrack_max": None}
+
+        assert drift(profile, live) == [("net.core.somaxconn", "4096", "128"),
+                                        ("net.netfilter.nf_conntrack_max", "65536", None)]
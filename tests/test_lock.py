@@ -0,0 +1,71 @@
+"""测试 nexus_vpn.utils.lock 模块"""
+import threading
+import pytest
+
+
+class TestLockManager:
+    """资源锁与操作日志测试"""
+
+    def test_same_resource_serializes(self):
+        """测试同一资源的锁互斥，超时后抛出 LockTimeout"""
+        from nexus_vpn.utils.lock import LockManager, LockTimeout
+
+        with LockManager.lock("xray"):
+            with pytest.raises(LockTimeout):
+                with LockManager.lock("xray", timeout=0.2):
+                    pass
+
+    def test_different_resources_do_not_block(self):
+        """测试不同资源的锁互不影响"""
+        from nexus_vpn.utils.lock import LockManager
+
+        acquired = threading.Event()
+
+        def other():
+            with LockManager.lock("ipsec", timeout=1):
+                acquired.set()
+
+        with LockManager.lock("xray"):
+            t = threading.Thread(target=other)
+            t.start()
+            t.join(2)
+        assert acquired.is_set()
+
+    def test_replays_interrupted_journal(self, mocker):
+        """测试崩溃留下的日志由下一个持锁者重放并清除"""
+        from nexus_vpn.utils.lock import LockManager
+
+        LockManager._ensure_dir()
+        LockManager._write_journal("xray", {"op": "add_user", "pid": 1, "users": ["alice"]})
+        recover = mocker.MagicMock()
+
+        with LockManager.transaction("xray", recover, "remove_user", users=["bob"]) as entry:
+            assert LockManager.read_journal("xray") == entry
+            assert entry["users"] == ["bob"]
+
+        recover.assert_called_once_with({"op": "add_user", "pid": 1, "users": ["alice"]}, True)
+        assert LockManager.read_journal("xray") is None
+
+    def test_exception_recovers_and_clears(self, mocker):
+        """测试操作抛出异常时恢复资源文件并清除日志"""
+        from nexus_vpn.utils.lock import LockManager
+
+        recover = mocker.MagicMock()
+        with pytest.raises(RuntimeError):
+            with LockManager.transaction("ipsec", recover, "add_eap_user"):
+                raise RuntimeError("boom")
+
+        assert recover.call_args[0][0]["op"] == "add_eap_user"
+        assert recover.call_args[0][1] is False
+        assert LockManager.read_journal("ipsec") is None
+
+    def test_failed_recovery_keeps_journal(self, mocker):
+        """测试恢复失败时保留日志，下次操作重试"""
+        from nexus_vpn.utils.lock import LockManager
+
+        recover = mocker.MagicMock(side_effect=OSError("disk full"))
+        with pytest.raises(RuntimeError):
+            with LockManager.transaction("ipsec", recover, "add_eap_user"):
+                raise RuntimeError("boom")
+
+        assert LockManager.read_journal("ipsec")["op"] == "add_eap_user"
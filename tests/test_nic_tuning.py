@@ -0,0 +1,205 @@
+"""测试 nexus_vpn.core.nic_tuning 模块"""
+import os
+import sys
+from unittest.mock import MagicMock
+import pytest
+from nexus_vpn.core.nic_tuning import NicTuner, parse_cpu_list, cpu_mask, mask_cpus, RPS_SOCK_FLOW_ENTRIES
+
+ETHTOOL_L = """Channel parameters for eth0:
+Pre-set maximums:
+RX:		n/a
+TX:		n/a
+Other:		n/a
+Combined:	{maximum}
+Current hardware settings:
+RX:		n/a
+TX:		n/a
+Other:		n/a
+Combined:	{current}
+"""
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def make_tree(root, cpus=4, rx=1, tx=1, irqs=(24, 25)):
+    """单队列、中断都在 CPU0 的假 sysfs / procfs"""
+    sysfs, proc = os.path.join(root, "sys"), os.path.join(root, "proc")
+    net = os.path.join(sysfs, "class", "net", "eth0")
+    write(os.path.join(sysfs, "devices", "system", "cpu", "online"), f"0-{cpus - 1}\n")
+    for q in range(rx):
+        write(os.path.join(net, "queues", f"rx-{q}", "rps_cpus"), "0\n")
+        write(os.path.join(net, "queues", f"rx-{q}", "rps_flow_cnt"), "0\n")
+    for q in range(tx):
+        write(os.path.join(net, "queues", f"tx-{q}", "xps_cpus"), "0\n")
+    for irq in irqs:
+        write(os.path.join(net, "device", "msi_irqs", str(irq)), "msi\n")
+        write(os.path.join(proc, "irq", str(irq), "smp_affinity_list"), "0\n")
+    header = "".join(f"CPU{i:<8}" for i in range(cpus))
+    write(os.path.join(proc, "softirqs"),
+          f"          {header}\n      NET_TX: {' '.join(['1'] * cpus)}\n"
+          f"      NET_RX: 900 {' '.join(['0'] * (cpus - 1))}\n")
+    write(os.path.join(proc, "sys", "net", "core", "rps_sock_flow_entries"), "0\n")
+    return NicTuner("eth0", sysfs_root=sysfs, proc_root=proc)
+
+
+@pytest.fixture
+def local_writes(mocker):
+    """把 sudo_write_file 换成直接写入假目录树"""
+    def sudo_write_file(path, content):
+        write(path, content)
+    return mocker.patch('nexus_vpn.core.nic_tuning.sudo_write_file', side_effect=sudo_write_file)
+
+
+@pytest.fixture
+def no_ethtool(mocker):
+    mocker.patch('nexus_vpn.core.nic_tuning.shutil.which', return_value=None)
+
+
+class TestMasks:
+    """CPU 列表与掩码转换测试"""
+
+    def test_parse_cpu_list(self):
+        assert parse_cpu_list("0-3,6\n") == [0, 1, 2, 3, 6]
+        assert parse_cpu_list("5") == [5]
+
+    def test_cpu_mask(self):
+        assert cpu_mask([0, 1, 2, 3]) == "0000000f"
+        assert cpu_mask([]) == "00000000"
+
+    def test_cpu_mask_over_32_cpus(self):
+        """测试超过 32 个 CPU 时按 32 位分组"""
+        assert cpu_mask([0, 32, 33]) == "00000003,00000001"
+        assert mask_cpus("00000003,00000001") == [0, 32, 33]
+
+
+class TestSnapshot:
+    """读取假目录树测试"""
+
+    def test_snapshot(self, temp_dir, no_ethtool):
+        tuner = make_tree(temp_dir, rx=2, tx=2)
+        snap = tuner.snapshot()
+
+        assert tuner.exists()
+        assert snap["cpus"] == [0, 1, 2, 3]
+        assert snap["channels"] is None
+        assert snap["rps"] == {0: "0", 1: "0"}
+        assert snap["irqs"] == {24: "0", 25: "0"}
+        assert snap["net_rx"] == [900, 0, 0, 0]
+
+    def test_distribution(self, temp_dir, no_ethtool):
+        """测试所有中断与 NET_RX 都集中在 CPU0"""
+        rows = NicTuner.distribution(make_tree(temp_dir).snapshot())
+        assert rows[0] == {"cpu": 0, "irqs": 2, "rps": 0, "xps": 0, "net_rx": 900}
+        assert rows[3] == {"cpu": 3, "irqs": 0, "rps": 0, "xps": 0, "net_rx": 0}
+
+    def test_channels(self, mocker, temp_dir):
+        mocker.patch('nexus_vpn.core.nic_tuning.shutil.which', return_value="/usr/sbin/ethtool")
+        mocker.patch('nexus_vpn.core.nic_tuning.subprocess.run',
+                     return_value=MagicMock(returncode=0, stdout=ETHTOOL_L.format(maximum=8, current=1)))
+        assert make_tree(temp_dir).channels() == (8, 1)
+
+    def test_channels_unsupported(self, mocker, temp_dir):
+        """测试网卡不支持 ethtool -l 时返回 None"""
+        mocker.patch('nexus_vpn.core.nic_tuning.shutil.which', return_value="/usr/sbin/ethtool")
+        mocker.patch('nexus_vpn.core.nic_tuning.subprocess.run',
+                     return_value=MagicMock(returncode=95, stdout=""))
+        assert make_tree(temp_dir).channels() is None
+
+
+class TestPlan:
+    """NicTuner.plan 测试"""
+
+    def test_single_queue_uses_rps(self, temp_dir, no_ethtool):
+        """测试队列少于 CPU 时 RPS 覆盖全部 CPU 并启用 RFS"""
+        plan = NicTuner.plan(make_tree(temp_dir).snapshot())
+
+        assert plan["channels"] is None
+        assert plan["rps"] == {0: "0000000f"}
+        assert plan["rps_flow_cnt"] == {0: RPS_SOCK_FLOW_ENTRIES}
+        assert plan["sock_flow_entries"] == RPS_SOCK_FLOW_ENTRIES
+        assert plan["xps"] == {0: "0000000f"}
+        assert plan["irqs"] == {24: 0, 25: 1}
+
+    def test_queue_per_cpu_disables_rps(self, temp_dir, no_ethtool):
+        """测试每个 CPU 都有队列时关闭 RPS，XPS 一对一"""
+        plan = NicTuner.plan(make_tree(temp_dir, rx=4, tx=4).snapshot())
+
+        assert plan["rps"] == {q: "0" for q in range(4)}
+        assert plan["rps_flow_cnt"] == {}
+        assert plan["sock_flow_entries"] is None
+        assert plan["xps"] == {0: "00000001", 1: "00000002", 2: "00000004", 3: "00000008"}
+
+    def test_raises_channels_up_to_cpu_count(self, temp_dir, no_ethtool):
+        snap = make_tree(temp_dir).snapshot()
+        snap["channels"] = (8, 1)
+        assert NicTuner.plan(snap)["channels"] == 4
+        snap["channels"] = (2, 2)
+        assert NicTuner.plan(snap)["channels"] is None
+
+
+class TestApply:
+    """写入与调优测试"""
+
+    def test_apply_writes_tree(self, temp_dir, no_ethtool, local_writes):
+        tuner = make_tree(temp_dir)
+        failed = tuner.apply(NicTuner.plan(tuner.snapshot()))
+        after = tuner.snapshot()
+
+        assert failed == []
+        assert after["rps"] == {0: "0000000f"}
+        assert after["irqs"] == {24: "0", 25: "1"}
+        with open(os.path.join(temp_dir, "proc", "sys", "net", "core", "rps_sock_flow_entries")) as f:
+            assert f.read() == f"{RPS_SOCK_FLOW_ENTRIES}\n"
+
+    def test_apply_collects_failures(self, mocker, temp_dir, no_ethtool):
+        """测试不可写的中断记录为失败，不中断其余写入"""
+        def sudo_write_file(path, content):
+            if path.endswith(os.path.join("25", "smp_affinity_list")):
+                raise OSError("Input/output error")
+            write(path, content)
+        mocker.patch('nexus_vpn.core.nic_tuning.sudo_write_file', side_effect=sudo_write_file)
+        tuner = make_tree(temp_dir)
+
+        failed = tuner.apply(NicTuner.plan(tuner.snapshot()))
+        assert failed == [os.path.join(temp_dir, "proc", "irq", "25", "smp_affinity_list")]
+        assert tuner.snapshot()["irqs"][24] == "0"
+
+    def test_tune_replans_after_channel_change(self, mocker, temp_dir, local_writes):
+        """测试 ethtool -L 成功后按新的队列布局计算掩码"""
+        tuner = make_tree(temp_dir)
+        mocker.patch('nexus_vpn.core.nic_tuning.shutil.which', return_value="/usr/sbin/ethtool")
+        current = {"n": 1}
+        mocker.patch('nexus_vpn.core.nic_tuning.subprocess.run',
+                     side_effect=lambda *a, **k: MagicMock(
+                         returncode=0, stdout=ETHTOOL_L.format(maximum=4, current=current["n"])))
+
+        def sudo_run(args, **kwargs):
+            # 模拟驱动在调整后创建新的队列与中断
+            current["n"] = 4
+            make_tree(temp_dir, rx=4, tx=4, irqs=(24, 25, 26, 27))
+            return MagicMock(returncode=0, stderr="")
+        run = mocker.patch('nexus_vpn.core.nic_tuning.sudo_run', side_effect=sudo_run)
+
+        result = tuner.tune()
+
+        run.assert_called_once_with(["ethtool", "-L", "eth0", "combined", "4"], capture_output=True, text=True)
+        assert result["plan"]["channels"] == 4
+        assert result["before"]["channels"] == (4, 1)
+        assert result["after"]["channels"] == (4, 4)
+        assert result["after"]["irqs"] == {24: "0", 25: "1", 26: "2", 27: "3"}
+        assert result["after"]["rps"] == {q: "0" for q in range(4)}
+
+    def test_persist(self, mocker, temp_dir):
+        write_file = mocker.patch('nexus_vpn.core.nic_tuning.sudo_write_file')
+        run = mocker.patch('nexus_vpn.core.nic_tuning.sudo_run')
+
+        NicTuner("eth0").persist()
+
+        path, unit = write_file.call_args[0]
+        assert path == NicTuner.SERVICE_PATH
+        assert f"ExecStart={sys.executable} -m nexus_vpn.cli tune nic --iface eth0 --no-persist" in unit
+        assert run.call_args_list[-1][0][0] == ["systemctl", "enable", NicTuner.SERVICE_NAME]
@@ -0,0 +1,61 @@
+"""测试 nexus_vpn.core.reality_mgr 模块"""
+
+
+def _result(dest, ms=None, ok=True):
+    return {"dest": dest, "ok": ok, "tcp_ms": ms / 2 if ok else None,
+            "tls_ms": ms / 2 if ok else None, "error": None if ok else "timeout"}
+
+
+class TestRealityManager:
+    """Reality 目标选择与监控测试"""
+
+    def test_order_dests(self, mocker):
+        """测试按探测结果排序候选目标"""
+        from nexus_vpn.core.reality_mgr import RealityManager
+
+        mocker.patch('nexus_vpn.protocols.reality_probe.rank', return_value=[
+            _result("b:443", 10), _result("a:443", 80), _result("c:443", ok=False)])
+
+        assert RealityManager.order_dests(["a:443", "b:443", "c:443"]) == ["b:443", "a:443", "c:443"]
+
+    def test_order_dests_all_failed_keeps_order(self, mocker):
+        """测试全部探测失败时保持原顺序"""
+        from nexus_vpn.core.reality_mgr import RealityManager
+
+        mocker.patch('nexus_vpn.protocols.reality_probe.rank', return_value=[
+            _result("a:443", ok=False), _result("b:443", ok=False)])
+
+        assert RealityManager.order_dests(("b:443", "a:443")) == ["b:443", "a:443"]
+
+    def test_single_dest_not_probed(self, mocker):
+        """测试单个目标不探测"""
+        from nexus_vpn.core.reality_mgr import RealityManager
+
+        mock_rank = mocker.patch('nexus_vpn.protocols.reality_probe.rank')
+
+        assert RealityManager.order_dests(("a:443",)) == ["a:443"]
+        mock_rank.assert_not_called()
+
+    def test_check_switches_degraded_dest(self, mocker):
+        """测试当前目标劣化时切换"""
+        from nexus_vpn.core.reality_mgr import RealityManager
+
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.get_reality_dests', return_value=["a:443", "b:443"])
+        mocker.patch('nexus_vpn.protocols.reality_probe.rank', return_value=[
+            _result("b:443", 20), _result("a:443", ok=False)])
+        mock_set = mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.set_reality_dests')
+
+        assert RealityManager.check() is True
+        mock_set.assert_called_once_with(["b:443", "a:443"])
+
+    def test_check_keeps_healthy_dest(self, mocker):
+        """测试当前目标正常时不切换"""
+        from nexus_vpn.core.reality_mgr import RealityManager
+
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.get_reality_dests', return_value=["a:443", "b:443"])
+        mocker.patch('nexus_vpn.protocols.reality_probe.rank', return_value=[
+            _result("b:443", 40), _result("a:443", 50)])
+        mock_set = mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.set_reality_dests')
+
+        assert RealityManager.check() is False
+        mock_set.assert_not_called()
@@ -0,0 +1,140 @@
+"""测试 nexus_vpn.protocols.reality_probe 模块"""
+import socket
+import ssl
+import subprocess
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def self_signed_cert(tmp_path_factory):
+    """用 openssl 生成本地 TLS 替身服务使用的自签名证书"""
+    tmp = tmp_path_factory.mktemp("tls")
+    cert, key = str(tmp / "cert.pem"), str(tmp / "key.pem")
+    subprocess.run([
+        "openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+        "-nodes", "-keyout", key, "-out", cert, "-days", "1", "-subj", "/CN=localhost",
+    ], check=True, capture_output=True)
+    return cert, key
+
+
+class TLSStandIn:
+    """本地 TLS 替身服务：可设置握手前延迟与最高 TLS 版本"""
+
+    def __init__(self, cert, key, delay=0.0, max_version=None):
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(cert, key)
+        if max_version:
+            self.context.maximum_version = max_version
+        self.delay = delay
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(8)
+        self.dest = f"127.0.0.1:{self.sock.getsockname()[1]}"
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            time.sleep(self.delay)
+            try:
+                with self.context.wrap_socket(conn, server_side=True) as tls:
+                    tls.recv(1)
+            except (OSError, ssl.SSLError):
+                pass
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def tls_servers(self_signed_cert):
+    servers = []
+
+    def start(**kwargs):
+        server = TLSStandIn(*self_signed_cert, **kwargs)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def _closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"127.0.0.1:{s.getsockname()[1]}"
+
+
+class TestRealityProbe:
+    """Reality 目标探测测试"""
+
+    def test_split_dest(self):
+        """测试解析 host:port"""
+        from nexus_vpn.protocols.reality_probe import split_dest
+
+        assert split_dest("www.apple.com:443") == ("www.apple.com", 443)
+        assert split_dest("www.apple.com") == ("www.apple.com", 443)
+        assert split_dest("[2001:db8::1]:8443") == ("2001:db8::1", 8443)
+
+    def test_probe_tls13(self, tls_servers):
+        """测试探测 TLS 1.3 替身服务"""
+        from nexus_vpn.protocols.reality_probe import probe
+
+        server = tls_servers()
+        result = probe(server.dest, attempts=2)
+
+        assert result["ok"] is True
+        assert result["tcp_ms"] >= 0 and result["tls_ms"] > 0
+
+    def test_probe_rejects_tls12(self, tls_servers):
+        """测试只支持 TLS 1.2 的目标被判定为不可用"""
+        from nexus_vpn.protocols.reality_probe import probe
+
+        server = tls_servers(max_version=ssl.TLSVersion.TLSv1_2)
+        result = probe(server.dest, attempts=1)
+
+        assert result["ok"] is False
+
+    def test_probe_unreachable(self):
+        """测试不可达目标"""
+        from nexus_vpn.protocols.reality_probe import probe
+
+        result = probe(_closed_port(), timeout=1, attempts=1)
+
+        assert result["ok"] is False
+        assert result["error"]
+
+    def test_rank_orders_by_latency(self, tls_servers):
+        """测试按握手延迟排序，失败的目标排在最后"""
+        from nexus_vpn.protocols.reality_probe import rank
+
+        slow = tls_servers(delay=0.15)
+        fast = tls_servers()
+        dead = _closed_port()
+
+        results = rank([dead, slow.dest, fast.dest], timeout=2, attempts=1)
+
+        assert [r["dest"] for r in results] == [fast.dest, slow.dest, dead]
+
+    def test_should_switch(self):
+        """测试切换阈值"""
+        from nexus_vpn.protocols.reality_probe import should_switch
+
+        def result(dest, ms, ok=True):
+            return {"dest": dest, "ok": ok, "tcp_ms": ms / 2 if ok else None,
+                    "tls_ms": ms / 2 if ok else None, "error": None if ok else "timeout"}
+
+        assert should_switch(result("a", 0, ok=False), result("b", 50)) is True
+        assert should_switch(result("a", 100), result("b", 50)) is True
+        # 比例超过但差值太小，不切换
+        assert should_switch(result("a", 12), result("b", 5)) is False
+        assert should_switch(result("a", 60), result("b", 50)) is False
+        assert should_switch(result("a", 60), result("a", 60)) is False
@@ -0,0 +1,213 @@
+"""测试 nexus_vpn.core.registry 模块"""
+import pytest
+
+
+class TestUserRegistry:
+    """用户注册表测试"""
+
+    def test_add_get_and_order(self):
+        """测试添加、查询与按添加顺序遍历"""
+        from nexus_vpn.core.registry import UserRegistry
+
+        with UserRegistry.open(write=True) as reg:
+            reg.add("v2ray", "bob", "uuid-b", "xtls-rprx-vision")
+            reg.add("v2ray", "alice", "uuid-a")
+
+        with UserRegistry.open() as reg:
+            assert reg.count("v2ray") == 2
+            assert reg.get("v2ray", "alice")['uuid'] == "uuid-a"
+            assert reg.get("v2ray", "carol") is None
+            assert reg.first("v2ray")['username'] == "bob"
+            assert [u['username'] for u in reg.iter_users("v2ray")] == ["bob", "alice"]
+
+    def test_duplicates_rejected(self):
+        """测试用户名或 UUID 重复时拒绝添加"""
+        from nexus_vpn.core.registry import UserRegistry, DuplicateUserError
+
+        with UserRegistry.open(write=True) as reg:
+            reg.add("v2ray", "alice", "uuid-a")
+            with pytest.raises(DuplicateUserError):
+                reg.add("v2ray", "alice", "uuid-x")
+            with pytest.raises(DuplicateUserError):
+                reg.add("v2ray", "bob", "uuid-a")
+            # 不同协议可以有同名用户
+            reg.add("ikev2-eap", "alice")
+            assert reg.count("v2ray") == 1
+
+    def test_import_ignores_duplicates(self):
+        """测试批量导入忽略重复项"""
+        from nexus_vpn.core.registry import UserRegistry
+
+        with UserRegistry.open(write=True) as reg:
+            imported = reg.import_users("v2ray", [
+                {"username": "alice", "uuid": "uuid-a"}, {"username": "alice", "uuid": "uuid-b"},
+                {"username": "bob", "uuid": "uuid-a"}, {"username": "carol", "uuid": "uuid-c"},
+            ])
+            assert imported == 2
+            assert [u['username'] for u in reg.iter_users("v2ray")] == ["alice", "carol"]
+
+    def test_remove(self):
+        """测试删除只返回实际存在的用户"""
+        from nexus_vpn.core.registry import UserRegistry
+
+        with UserRegistry.open(write=True) as reg:
+            reg.add("v2ray", "alice", "uuid-a")
+            reg.add("v2ray", "bob", "uuid-b")
+            assert reg.remove("v2ray", ["alice", "nobody"]) == ["alice"]
+            assert reg.count("v2ray") == 1
+
+    def test_rollback_on_error(self):
+        """测试会话内出错时回滚"""
+        from nexus_vpn.core.registry import UserRegistry
+
+        with pytest.raises(RuntimeError):
+            with UserRegistry.open(write=True) as reg:
+                reg.add("v2ray", "alice", "uuid-a")
+                raise RuntimeError("boom")
+
+        with UserRegistry.open() as reg:
+            assert reg.count("v2ray") == 0
+
+    def test_concurrent_writers(self):
+        """测试多个写者并发添加用户时互不覆盖"""
+        from concurrent.futures import ThreadPoolExecutor
+        from nexus_vpn.core.registry import UserRegistry
+
+        def add(i):
+            with UserRegistry.open(write=True) as reg:
+                reg.add("v2ray", f"user{i}", f"uuid-{i}")
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(add, range(40)))
+
+        with UserRegistry.open() as reg:
+            assert reg.count("v2ray") == 40
+
+    def test_non_root_opens_in_place(self, mocker):
+        """测试非 root 且已有权限时原地打开，不调用 sudo"""
+        from nexus_vpn.core.registry import UserRegistry
+
+        mocker.patch('nexus_vpn.core.registry.need_sudo', return_value=True)
+        mock_grant = mocker.patch('nexus_vpn.core.registry.sudo_grant_group')
+        import os
+        os.makedirs(os.path.dirname(UserRegistry.DB_PATH), exist_ok=True)
+
+        with UserRegistry.open(write=True) as reg:
+            reg.add("v2ray", "alice", "uuid-a")
+        with UserRegistry.open() as reg:
+            assert reg.get("v2ray", "alice")['uuid'] == "uuid-a"
+
+        mock_grant.assert_not_called()
+
+    def test_non_root_grants_group_access(self, mocker):
+        """测试非 root 无权限时只调整组权限，不复制或替换数据库"""
+        from nexus_vpn.core.registry import UserRegistry
+
+        mocker.patch('nexus_vpn.core.registry.os.access', return_value=False)
+        mocker.patch('nexus_vpn.core.registry.os.path.exists', return_value=True)
+        mock_run = mocker.patch('nexus_vpn.utils.sudo.sudo_run')
+        mocker.patch('nexus_vpn.core.registry.sudo_makedirs')
+
+        UserRegistry._grant_access("/var/lib/nexus-vpn/users.db")
+
+        commands = [c[0][0] for c in mock_run.call_args_list]
+        assert ["chmod", "g+rwxs", "/var/lib/nexus-vpn"] in commands
+        assert ["chmod", "660", "/var/lib/nexus-vpn/users.db"] in commands
+        assert not any("/etc/nexus-vpn" in cmd for cmd in commands)
+        assert not any(cmd[0] in ("cp", "install", "mv") for cmd in commands)
+
+    def test_database_not_world_readable(self):
+        """测试新建和已有的数据库都限制为 0600（含 EAP 密码）"""
+        import os
+        import stat
+        from nexus_vpn.core.registry import UserRegistry
+
+        with UserRegistry.open(write=True) as reg:
+            reg.add("ikev2-eap", "bob", secret="pw")
+        assert stat.S_IMODE(os.stat(UserRegistry.DB_PATH).st_mode) == 0o600
+
+        os.chmod(UserRegistry.DB_PATH, 0o644)
+        with UserRegistry.open() as reg:
+            assert reg.get("ikev2-eap", "bob")['secret'] == "pw"
+        assert stat.S_IMODE(os.stat(UserRegistry.DB_PATH).st_mode) == 0o600
+
+    def test_non_root_database_group_shared(self, mocker):
+        """测试非 root 共享时数据库为 0660"""
+        import os
+        import stat
+        from nexus_vpn.core.registry import UserRegistry
+
+        mocker.patch('nexus_vpn.core.registry.need_sudo', return_value=True)
+        os.makedirs(os.path.dirname(UserRegistry.DB_PATH))
+
+        with UserRegistry.open(write=True) as reg:
+            reg.add("ikev2-eap", "bob", secret="pw")
+        assert stat.S_IMODE(os.stat(UserRegistry.DB_PATH).st_mode) == 0o660
+
+    def test_moves_legacy_database(self, temp_dir):
+        """测试旧版 /etc/nexus-vpn/users.db 迁到独立目录，并收回旧目录的组写权限"""
+        import os
+        import stat
+        from nexus_vpn.core.registry import UserRegistry
+
+        legacy_dir = os.path.dirname(UserRegistry.LEGACY_DB_PATH)
+        os.makedirs(legacy_dir)
+        os.chmod(legacy_dir, 0o2775)
+        with UserRegistry._connect(UserRegistry.LEGACY_DB_PATH, write=True) as reg:
+            reg.add("v2ray", "alice", "uuid-a")
+
+        with UserRegistry.open() as reg:
+            assert reg.get("v2ray", "alice")['uuid'] == "uuid-a"
+        assert not os.path.exists(UserRegistry.LEGACY_DB_PATH)
+        assert os.path.exists(UserRegistry.DB_PATH)
+        assert stat.S_IMODE(os.stat(legacy_dir).st_mode) == 0o755
+
+    def test_migrates_old_schema(self):
+        """测试旧版数据库打开时补齐 expires_at/flags/last_seen 等列"""
+        import os
+        import sqlite3
+        from nexus_vpn.core.registry import UserRegistry
+
+        os.makedirs(os.path.dirname(UserRegistry.DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(UserRegistry.DB_PATH)
+        conn.execute("CREATE TABLE users (type TEXT NOT NULL, username TEXT NOT NULL, uuid TEXT, flow TEXT, "
+                     "created_at INTEGER NOT NULL, PRIMARY KEY (type, username))")
+        conn.execute("INSERT INTO users VALUES ('v2ray', 'alice', 'uuid-a', NULL, 1)")
+        conn.commit()
+        conn.close()
+
+        with UserRegistry.open(write=True) as reg:
+            user = reg.get("v2ray", "alice")
+            assert user['flags'] == 0
+            assert user['expires_at'] is None
+            reg.touch("v2ray", ["alice"], now=1234)
+            assert reg.get("v2ray", "alice")['last_seen'] == 1234
+
+    def test_counts_and_active(self):
+        """测试按类型计数与有效状态判断"""
+        from nexus_vpn.core.registry import UserRegistry, FLAG_DISABLED
+
+        with UserRegistry.open(write=True) as reg:
+            reg.add("v2ray", "alice", "uuid-a")
+            reg.add("ikev2-eap", "bob", secret="pw", expires_at=100)
+            reg.add("ikev2-cert", "carol", flags=FLAG_DISABLED)
+            assert reg.counts() == {"v2ray": 1, "ikev2-eap": 1, "ikev2-cert": 1}
+            assert UserRegistry.is_active(reg.get("v2ray", "alice"))
+            assert UserRegistry.is_active(reg.get("ikev2-eap", "bob"), now=50)
+            assert not UserRegistry.is_active(reg.get("ikev2-eap", "bob"), now=100)
+            assert not UserRegistry.is_active(reg.get("ikev2-cert", "carol"))
+
+    def test_query_filters_and_pages(self):
+        """测试按类型、用户名通配符筛选并分页"""
+        from nexus_vpn.core.registry import UserRegistry
+
+        with UserRegistry.open(write=True) as reg:
+            for i in range(5):
+                reg.add("v2ray", f"team-{i}", f"uuid-{i}")
+            reg.add("ikev2-eap", "team-eap", secret="pw")
+            reg.add("ikev2-cert", "other")
+
+            names = [u['username'] for u in reg.query(["v2ray", "ikev2-eap"], "team-*", limit=3, offset=2)]
+            assert names == ["team-2", "team-3", "team-4"]
+            rows = list(reg.query(["ikev2-eap", "ikev2-cert"]))
+            assert [(u['type'], u['username']) for u in rows] == [("ikev2-eap", "team-eap"), ("ikev2-cert", "other")]
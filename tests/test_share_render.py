@@ -0,0 +1,91 @@
+"""测试 nexus_vpn.protocols.share_render 模块"""
+import json
+import os
+
+import pytest
+
+
+def _links(n, sni="www.example.com"):
+    return {f"user{i}": f"vless://uuid-{i}@example.com:443?sni={sni}#user{i}" for i in range(n)}
+
+
+class TestRenderShareFiles:
+    """批量渲染测试"""
+
+    def test_parallel_render(self, temp_dir):
+        """测试多进程渲染生成全部文件与清单"""
+        from nexus_vpn.protocols.share_render import render_share_files
+
+        links = _links(4)
+        assert render_share_files(links, temp_dir, workers=2) == (4, 0)
+
+        for name, link in links.items():
+            with open(os.path.join(temp_dir, f"{name}.txt")) as f:
+                assert f.read() == link + "\n"
+            with open(os.path.join(temp_dir, f"{name}.svg")) as f:
+                assert f.read().startswith("<?xml")
+        with open(os.path.join(temp_dir, "links.txt")) as f:
+            assert len(f.readlines()) == 4
+        with open(os.path.join(temp_dir, ".manifest.json")) as f:
+            assert set(json.load(f)) == set(links)
+
+    def test_unchanged_links_skipped(self, mocker, temp_dir):
+        """测试链接未变化的用户跳过，变化的用户重新渲染"""
+        from nexus_vpn.protocols import share_render
+
+        links = _links(3)
+        share_render.render_share_files(links, temp_dir, workers=1)
+
+        spy = mocker.spy(share_render, '_render_one')
+        links["user1"] = links["user1"].replace("uuid-1", "uuid-x")
+        assert share_render.render_share_files(links, temp_dir, workers=1) == (1, 2)
+        assert spy.call_count == 1
+        assert spy.call_args.args[0][1] == os.path.join(temp_dir, "user1")
+
+        # 图片被删除时即使链接未变也重新生成
+        os.remove(os.path.join(temp_dir, "user2.svg"))
+        assert share_render.render_share_files(links, temp_dir, workers=1) == (1, 2)
+
+    def test_prune_removes_stale_users(self, temp_dir):
+        """测试导出全部用户时清理已删除用户的文件"""
+        from nexus_vpn.protocols.share_render import render_share_files
+
+        render_share_files(_links(3), temp_dir, workers=1)
+        render_share_files(_links(2), temp_dir, workers=1, prune=True)
+
+        assert not os.path.exists(os.path.join(temp_dir, "user2.txt"))
+        assert not os.path.exists(os.path.join(temp_dir, "user2.svg"))
+        assert os.path.exists(os.path.join(temp_dir, "user1.svg"))
+
+    def test_incremental_keeps_other_entries(self, temp_dir):
+        """测试不清理时保留清单中其他用户的记录"""
+        from nexus_vpn.protocols.share_render import render_share_files
+
+        render_share_files(_links(2), temp_dir, workers=1)
+        render_share_files({"new": "vless://new@example.com:443#new"}, temp_dir, workers=1)
+
+        with open(os.path.join(temp_dir, ".manifest.json")) as f:
+            assert set(json.load(f)) == {"user0", "user1", "new"}
+        with open(os.path.join(temp_dir, "links.txt")) as f:
+            assert [line.split("\t")[0] for line in f] == ["user0", "user1", "new"]
+
+    def test_removed_users_dropped(self, temp_dir):
+        """测试增量渲染时删除的用户从清单、links.txt 与目录中去掉"""
+        from nexus_vpn.protocols.share_render import render_share_files
+
+        render_share_files(_links(3), temp_dir, workers=1)
+        render_share_files({"new": "vless://new@example.com:443#new"}, temp_dir, workers=1, removed=["user1"])
+
+        assert not os.path.exists(os.path.join(temp_dir, "user1.txt"))
+        assert not os.path.exists(os.path.join(temp_dir, "user1.svg"))
+        with open(os.path.join(temp_dir, ".manifest.json")) as f:
+            assert set(json.load(f)) == {"user0", "user2", "new"}
+        with open(os.path.join(temp_dir, "links.txt")) as f:
+            assert [line.split("\t")[0] for line in f] == ["user0", "user2", "new"]
+
+    def test_unknown_format(self, temp_dir):
+        """测试不支持的图片格式"""
+        from nexus_vpn.protocols.share_render import render_share_files
+
+        with pytest.raises(ValueError):
+            render_share_files(_links(1), temp_dir, image_format="gif")
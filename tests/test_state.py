@@ -0,0 +1,73 @@
+"""测试 nexus_vpn.core.state 模块"""
+import json
+from unittest.mock import MagicMock
+
+
+class TestServerState:
+    """服务器元数据缓存测试"""
+
+    def test_load_missing_or_corrupt(self):
+        """测试缓存不存在或损坏时返回空字典"""
+        import os
+        from nexus_vpn.core.state import ServerState
+
+        assert ServerState.load() == {}
+        os.makedirs(os.path.dirname(ServerState.PATH), exist_ok=True)
+        with open(ServerState.PATH, "w") as f:
+            f.write("{broken")
+        assert ServerState.load() == {}
+
+    def test_collect_from_config(self, mocker, mock_xray_config):
+        """测试从 Xray 配置采集 Reality 参数与端口"""
+        from nexus_vpn.core.state import ServerState
+        from nexus_vpn.protocols.v2ray import V2RayManager
+
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mocker.patch.object(ServerState, 'local_public_ips', return_value=["203.0.113.7"])
+        mock_lookup = mocker.patch.object(ServerState, 'lookup_public_ip')
+
+        state = ServerState.collect("vpn.example.com", lookup=False)
+
+        assert state["domain"] == "vpn.example.com"
+        assert state["public_ips"] == ["203.0.113.7"]
+        assert state["reality"]["public_key"] == "hSDwCYkwp1R0i33ctD73Wg2_Og0mOBr066SpjqqbTmo"
+        assert state["reality"]["short_ids"] == ["abcd1234"]
+        assert state["ports"] == {"ikev2": [500, 4500], "vless": 443}
+        mock_lookup.assert_not_called()
+
+    def test_refresh_keeps_cached_domain(self, mocker):
+        """测试刷新时未指定域名则保留缓存的域名，并合并外部查询到的出口 IP"""
+        from nexus_vpn.core.state import ServerState
+
+        ServerState.save({"domain": "cached.example.com"})
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.config_exists', return_value=False)
+        mocker.patch.object(ServerState, 'local_public_ips', return_value=["203.0.113.7"])
+        mocker.patch.object(ServerState, 'lookup_public_ip', return_value="198.51.100.1")
+
+        state = ServerState.refresh()
+
+        assert state["domain"] == "cached.example.com"
+        assert state["public_ips"] == ["203.0.113.7", "198.51.100.1"]
+        with open(ServerState.PATH) as f:
+            assert json.load(f) == state
+
+    def test_local_public_ips_skips_private(self, mocker):
+        """测试只返回全局单播地址"""
+        from nexus_vpn.core.state import ServerState
+
+        output = json.dumps([{"addr_info": [
+            {"local": "10.0.0.5"}, {"local": "1.2.3.4"}, {"local": "2606:4700::1111"}, {"local": "fe80::1"},
+        ]}])
+        mocker.patch('nexus_vpn.core.state.subprocess.run', return_value=MagicMock(stdout=output))
+
+        assert ServerState.local_public_ips() == ["1.2.3.4", "2606:4700::1111"]
+
+    def test_lookup_public_ip_rejects_garbage(self, mocker):
+        """测试外部服务返回的不是 IP 时返回 None"""
+        from nexus_vpn.core.state import ServerState
+
+        response = MagicMock()
+        response.__enter__.return_value.read.return_value = b"<html>blocked</html>"
+        mocker.patch('urllib.request.urlopen', return_value=response)
+
+        assert ServerState.lookup_public_ip() is None
@@ -0,0 +1,143 @@
+"""测试 nexus_vpn.core.stats_mgr 模块"""
+import os
+import json
+import pytest
+from unittest.mock import MagicMock
+
+
+class TestStatsManager:
+    """StatsManager 类测试"""
+
+    def test_parse_user_stats(self):
+        """测试解析 Xray 用户计数器"""
+        from nexus_vpn.core.stats_mgr import StatsManager
+
+        raw = {
+            "user>>>alice>>>traffic>>>uplink": 100,
+            "user>>>alice>>>traffic>>>downlink": 2000,
+            "user>>>bob>>>traffic>>>downlink": 5,
+            "inbound>>>vless-in>>>traffic>>>uplink": 999,
+        }
+
+        assert StatsManager.parse_user_stats(raw) == {"alice": [100, 2000], "bob": [0, 5]}
+
+    def test_record_accumulates_and_rolls(self, mocker, temp_dir):
+        """测试累计总量并只保留最近 MAX_SAMPLES 条采样"""
+        from nexus_vpn.core.stats_mgr import StatsManager
+
+        path = os.path.join(temp_dir, "nexus", "traffic.json")
+        mocker.patch.object(StatsManager, 'HISTORY_PATH', path)
+        mocker.patch.object(StatsManager, 'MAX_SAMPLES', 2)
+
+        StatsManager.record({"alice": [1, 2]}, now=1)
+        StatsManager.record({"alice": [10, 20], "bob": [0, 0]}, now=2)
+        history = StatsManager.record({"bob": [5, 5]}, now=3)
+
+        assert history["totals"] == {"alice": [11, 22], "bob": [5, 5]}
+        assert history["samples"] == [[2, {"alice": [10, 20]}], [3, {"bob": [5, 5]}]]
+        with open(path) as f:
+            content = f.read()
+        assert " " not in content  # 紧凑格式
+        assert json.loads(content) == history
+
+    def test_record_updates_last_seen(self, mocker, temp_dir):
+        """测试有流量的用户更新注册表中的最后在线时间"""
+        from nexus_vpn.core.stats_mgr import StatsManager
+        from nexus_vpn.core.registry import UserRegistry
+
+        mocker.patch.object(StatsManager, 'HISTORY_PATH', os.path.join(temp_dir, "nexus", "traffic.json"))
+        with UserRegistry.open(write=True) as reg:
+            reg.add("v2ray", "alice", "uuid-a")
+            reg.add("v2ray", "bob", "uuid-b")
+
+        StatsManager.record({"alice": [1, 2], "bob": [0, 0]}, now=1000)
+
+        with UserRegistry.open() as reg:
+            assert reg.get("v2ray", "alice")['last_seen'] == 1000
+            assert reg.get("v2ray", "bob")['last_seen'] is None
+
+    def test_top_users_sorted(self):
+        """测试按累计总量降序排列并截取前 N 个"""
+        from nexus_vpn.core.stats_mgr import StatsManager
+
+        history = {"totals": {"a": [1, 1], "b": [50, 50], "c": [10, 0]}}
+        rows = StatsManager.top_users(history, {"b": [3, 4]}, 2)
+
+        assert rows == [("b", [3, 4], [50, 50]), ("c", [0, 0], [10, 0])]
+
+    def test_collect_queries_with_reset(self, mocker):
+        """测试一次批量查询并清零计数器"""
+        from nexus_vpn.core.stats_mgr import StatsManager
+
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.get_api_addresses', return_value=["127.0.0.1:10085"])
+        mock_client = MagicMock()
+        mock_client.__enter__.return_value.query_stats.return_value = {"user>>>alice>>>traffic>>>uplink": 7}
+        mock_cls = mocker.patch('nexus_vpn.core.stats_mgr.XrayApiClient', return_value=mock_client)
+
+        assert StatsManager.collect() == ({"alice": [7, 0]}, [])
+        mock_cls.assert_called_once_with("127.0.0.1:10085")
+        mock_client.__enter__.return_value.query_stats.assert_called_once_with("user>>>", reset=True)
+
+    def test_collect_partial_shard_failure(self, mocker):
+        """测试单个分片失败时仍返回其他分片已清零的计数，并报告失败分片"""
+        from nexus_vpn.core.stats_mgr import StatsManager
+        from nexus_vpn.protocols.xray_api import XrayApiError
+
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.get_api_addresses',
+                     return_value=["127.0.0.1:10085", "127.0.0.1:10086"])
+        ok = MagicMock()
+        ok.__enter__.return_value.query_stats.return_value = {"user>>>alice>>>traffic>>>downlink": 9}
+        bad = MagicMock()
+        bad.__enter__.side_effect = XrayApiError("连接被拒绝")
+        mocker.patch('nexus_vpn.core.stats_mgr.XrayApiClient', side_effect=[ok, bad])
+
+        deltas, failed = StatsManager.collect()
+
+        assert deltas == {"alice": [0, 9]}
+        assert [address for address, _ in failed] == ["127.0.0.1:10086"]
+
+    def test_collect_all_shards_failed(self, mocker):
+        """测试所有分片都失败时报错"""
+        from nexus_vpn.core.stats_mgr import StatsManager
+        from nexus_vpn.protocols.xray_api import XrayApiError
+
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.get_api_addresses', return_value=["127.0.0.1:10085"])
+        bad = MagicMock()
+        bad.__enter__.side_effect = XrayApiError("连接被拒绝")
+        mocker.patch('nexus_vpn.core.stats_mgr.XrayApiClient', return_value=bad)
+
+        with pytest.raises(XrayApiError, match="127.0.0.1:10085"):
+            StatsManager.collect()
+
+    def test_show_records_partial_result(self, mocker):
+        """测试部分分片失败时仍记录已收集的增量并警告"""
+        from nexus_vpn.core.stats_mgr import StatsManager
+        from nexus_vpn.protocols.xray_api import XrayApiError
+
+        mocker.patch.object(StatsManager, 'collect',
+                            return_value=({"alice": [1, 2]}, [("127.0.0.1:10086", XrayApiError("超时"))]))
+        mock_record = mocker.patch.object(StatsManager, 'record', return_value={"totals": {"alice": [1, 2]}})
+        mock_warning = mocker.patch('nexus_vpn.core.stats_mgr.log.warning')
+
+        StatsManager.show()
+
+        mock_record.assert_called_once_with({"alice": [1, 2]})
+        assert "127.0.0.1:10086" in mock_warning.call_args[0][0]
+
+    def test_collect_without_api(self, mocker):
+        """测试旧配置未启用 API 时报错"""
+        from nexus_vpn.core.stats_mgr import StatsManager
+        from nexus_vpn.protocols.xray_api import XrayApiError
+
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.get_api_addresses', return_value=[])
+
+        with pytest.raises(XrayApiError):
+            StatsManager.collect()
+
+    def test_format_bytes(self):
+        """测试流量单位格式化"""
+        from nexus_vpn.core.stats_mgr import format_bytes
+
+        assert format_bytes(512) == "512 B"
+        assert format_bytes(1536) == "1.5 KiB"
+        assert format_bytes(3 * 1024 ** 3) == "3.0 GiB"
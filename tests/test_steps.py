@@ -0,0 +1,73 @@
+"""测试 nexus_vpn.utils.steps 模块"""
+import time
+import threading
+import pytest
+
+
+class TestRunSteps:
+    """run_steps 测试"""
+    
+    def test_dependencies_run_in_order(self):
+        """测试依赖的步骤先完成，结果按声明顺序返回"""
+        from nexus_vpn.utils.steps import Step, run_steps
+        
+        order = []
+        steps = [
+            Step("c", lambda: order.append("c"), after=["a", "b"]),
+            Step("a", lambda: order.append("a")),
+            Step("b", lambda: order.append("b"), after=["a"]),
+        ]
+        
+        results = run_steps(steps)
+        
+        assert order == ["a", "b", "c"]
+        assert [r['name'] for r in results] == ["c", "a", "b"]
+        assert all(r['status'] == "ok" and r['seconds'] >= 0 for r in results)
+    
+    def test_independent_steps_overlap(self):
+        """测试互不依赖的步骤并发执行"""
+        from nexus_vpn.utils.steps import Step, run_steps
+        
+        steps = [Step(name, lambda: time.sleep(0.2)) for name in "abcd"]
+        
+        start = time.perf_counter()
+        run_steps(steps, max_workers=4)
+        
+        assert time.perf_counter() - start < 0.6
+    
+    def test_failure_skips_pending_steps(self):
+        """测试失败后不再启动新步骤，已在运行的步骤执行完毕"""
+        from nexus_vpn.utils.steps import Step, StepFailed, run_steps
+        
+        finished = threading.Event()
+        
+        def fail():
+            raise RuntimeError("boom")
+        
+        steps = [
+            Step("fail", fail, title="会失败"),
+            Step("slow", lambda: (time.sleep(0.1), finished.set())),
+            Step("after", lambda: pytest.fail("不应执行"), after=["fail"]),
+        ]
+        
+        with pytest.raises(StepFailed) as exc:
+            run_steps(steps)
+        
+        assert isinstance(exc.value.error, RuntimeError)
+        assert exc.value.step.name == "fail"
+        assert finished.is_set()
+        assert [r['status'] for r in exc.value.results] == ["failed", "ok", "skipped"]
+    
+    @pytest.mark.parametrize("steps", [
+        [("a", ["missing"])],
+        [("a", ["b"]), ("b", ["a"])],
+        [("a", []), ("a", [])],
+    ])
+    def test_invalid_graph(self, steps):
+        """测试依赖不存在、成环与重名时拒绝执行"""
+        from nexus_vpn.utils.steps import Step, run_steps
+        
+        called = []
+        with pytest.raises(ValueError):
+            run_steps([Step(name, lambda: called.append(1), after=after) for name, after in steps])
+        assert called == []
@@ -23,9 +23,24 @@ class TestUserManager:
         
         mock_add.assert_called_once_with('testuser')
     
+    def test_add_v2ray_user_duplicate(self, mocker):
+        """测试添加已存在的 V2Ray 用户时不输出连接信息"""
+        from nexus_vpn.core.user_mgr import UserManager
+        
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.add_user', return_value=None)
+        mock_print = mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.print_connection_info')
+        mock_domain = mocker.patch.object(UserManager, '_get_v2ray_domain')
+        
+        UserManager.add('v2ray', 'testuser')
+        
+        mock_print.assert_not_called()
+        mock_domain.assert_not_called()
+    
     def test_add_ikev2_cert_user(self, mocker, temp_dir):
         """测试添加 IKEv2 证书用户"""
+        import time
         from nexus_vpn.core.user_mgr import UserManager
+        from nexus_vpn.core.registry import UserRegistry
         
         p12_path = os.path.join(temp_dir, "testuser.p12")
         with open(p12_path, 'wb') as f:
@@ -54,6 +69,8 @@ class TestUserManager:
         
         mock_issue.assert_called_once_with('testuser')
         mock_get_domain.assert_called_once()
+        with UserRegistry.open() as reg:
+            assert reg.get('ikev2-cert', 'testuser')['expires_at'] > time.time()
         mock_mobileconfig.assert_called_once_with('testuser', 'example.com', p12_path)
         
         # 验证 mobileconfig 文件被创建
@@ -64,16 +81,32 @@ class TestUserManager:
         """测试添加 IKEv2 EAP 用户"""
         from nexus_vpn.core.user_mgr import UserManager
         
-        mocker.patch('click.prompt', return_value='testpassword')
         mock_add_eap = mocker.patch(
             'nexus_vpn.protocols.ikev2.IKEv2Manager.add_eap_user'
         )
         mocker.patch.object(UserManager, '_get_domain', return_value='example.com')
         
-        UserManager.add('ikev2-eap', 'testuser')
+        UserManager.add('ikev2-eap', 'testuser', 'testpassword')
         
         mock_add_eap.assert_called_once_with('testuser', 'testpassword')
     
+    def test_add_ikev2_eap_user_prompts_hidden(self, mocker):
+        """测试未指定密码时隐藏输入提示，直接回车自动生成"""
+        from nexus_vpn.core.user_mgr import UserManager
+        
+        mock_prompt = mocker.patch('click.prompt', return_value='typed')
+        mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.generate_password', return_value='generated')
+        mock_add_eap = mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.add_eap_user')
+        mocker.patch.object(UserManager, '_get_domain', return_value='example.com')
+        
+        UserManager.add('ikev2-eap', 'testuser')
+        mock_add_eap.assert_called_with('testuser', 'typed')
+        assert mock_prompt.call_args[1]['hide_input'] is True
+        
+        mock_prompt.return_value = ''
+        UserManager.add('ikev2-eap', 'testuser')
+        mock_add_eap.assert_called_with('testuser', 'generated')
+    
     def test_remove_v2ray_user(self, mocker):
         """测试删除 V2Ray 用户"""
         from nexus_vpn.core.user_mgr import UserManager
@@ -154,6 +187,143 @@ class TestUserManager:
         # 不应该抛出异常
         UserManager.list_users()
     
+    def test_list_users_reads_registry(self, mocker, temp_dir, mock_ipsec_secrets):
+        """测试首次列出时把证书与 EAP 用户导入注册表，之后不再扫描 PKI 目录"""
+        from nexus_vpn.core.user_mgr import UserManager
+        from nexus_vpn.core.registry import UserRegistry
+        from nexus_vpn.protocols.ikev2 import IKEv2Manager
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        pki_dir = os.path.join(temp_dir, "pki")
+        os.makedirs(os.path.join(pki_dir, "certs"))
+        for name in ("server", "alice"):
+            open(os.path.join(pki_dir, "certs", f"{name}.crt"), "w").close()
+        mocker.patch('nexus_vpn.core.cert_mgr.CertManager.PKI_DIR', pki_dir)
+        mocker.patch.object(IKEv2Manager, 'SECRETS_FILE', mock_ipsec_secrets)
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', '/nonexistent')
+        
+        UserManager.list_users()
+        
+        with UserRegistry.open() as reg:
+            assert reg.counts() == {"ikev2-cert": 1, "ikev2-eap": 2}
+            assert reg.get("ikev2-eap", "testuser1")['secret'] == "password1"
+        
+        mock_glob = mocker.patch('nexus_vpn.protocols.ikev2.glob.glob')
+        UserManager.list_users()
+        mock_glob.assert_not_called()
+    
+    @pytest.fixture
+    def registry_users(self, mocker):
+        """注册表中预置三种用户（不读取系统配置）"""
+        from nexus_vpn.core.registry import UserRegistry, FLAG_DISABLED
+        
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.config_exists', return_value=False)
+        mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager._read_secrets', return_value="")
+        mocker.patch('nexus_vpn.core.cert_mgr.CertManager.PKI_DIR', '/nonexistent')
+        with UserRegistry.open(write=True) as reg:
+            reg.add("v2ray", "alice", "uuid-a")
+            reg.add("v2ray", "bob", "uuid-b", flags=FLAG_DISABLED)
+            reg.add("ikev2-eap", "alina", secret="s3cret", expires_at=1)
+            reg.add("ikev2-cert", "carol")
+    
+    def test_list_users_jsonl_filter(self, registry_users, capsys):
+        """测试 jsonl 输出、子串筛选与状态，且不输出 EAP 密码"""
+        import json
+        from nexus_vpn.core.user_mgr import UserManager
+        
+        UserManager.list_users("jsonl", pattern="ali")
+        
+        out = capsys.readouterr().out
+        rows = [json.loads(line) for line in out.splitlines()]
+        assert [(r['type'], r['username'], r['status']) for r in rows] == [
+            ("v2ray", "alice", "active"), ("ikev2-eap", "alina", "expired")]
+        assert "s3cret" not in out
+    
+    def test_list_users_csv_type_and_paging(self, registry_users, capsys):
+        """测试 csv 输出、按类型筛选与分页"""
+        import csv
+        from nexus_vpn.core.user_mgr import UserManager, LIST_FIELDS
+        
+        UserManager.list_users("csv", vpn_types=("v2ray",), limit=1, offset=1)
+        
+        rows = list(csv.reader(capsys.readouterr().out.splitlines()))
+        assert rows[0] == list(LIST_FIELDS)
+        assert rows[1][:4] == ["v2ray", "bob", "uuid-b", "disabled"]
+        assert len(rows) == 2
+    
+    def test_list_users_json_array(self, registry_users, capsys):
+        """测试 json 输出为合法数组，空结果为 []"""
+        import json
+        from nexus_vpn.core.user_mgr import UserManager
+        
+        UserManager.list_users("json", vpn_types=("ikev2-cert",))
+        assert [u['username'] for u in json.loads(capsys.readouterr().out)] == ["carol"]
+        
+        UserManager.list_users("json", pattern="nobody")
+        assert json.loads(capsys.readouterr().out) == []
+    
+    def test_list_users_bootstraps_sections_concurrently(self, mocker, registry_users, capsys):
+        """测试三类用户的初始化并发执行（串行时 Barrier 会超时）"""
+        import threading
+        from nexus_vpn.core.user_mgr import UserManager
+        
+        barrier = threading.Barrier(3, timeout=5)
+        for target in ('nexus_vpn.protocols.v2ray.V2RayManager._bootstrap',
+                       'nexus_vpn.protocols.ikev2.IKEv2Manager._bootstrap_cert',
+                       'nexus_vpn.protocols.ikev2.IKEv2Manager._bootstrap_eap'):
+            mocker.patch(target, side_effect=lambda reg: barrier.wait())
+        
+        UserManager.list_users()
+        
+        out = capsys.readouterr().out
+        assert "Error" not in out
+        assert out.index("alice") < out.index("carol") < out.index("alina")
+    
+    def test_list_users_section_error(self, mocker, registry_users, capsys):
+        """测试某一类读取失败时其他类型照常输出"""
+        from nexus_vpn.core.user_mgr import UserManager
+        
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager._bootstrap', side_effect=OSError("sudo 失败"))
+        mock_error = mocker.patch('nexus_vpn.core.user_mgr.log.error')
+        
+        UserManager.list_users()
+        out = capsys.readouterr().out
+        assert "sudo 失败" in out
+        assert "alice" not in out
+        assert "carol" in out and "alina" in out
+        
+        UserManager.list_users("jsonl")
+        rows = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert {r["type"] for r in rows} == {"ikev2-cert", "ikev2-eap"}
+        mock_error.assert_called_once()
+    
+    @pytest.mark.parametrize("output_format", ["json", "jsonl", "csv"])
+    def test_list_users_machine_output_stdout_only(self, mocker, registry_users, capsys, output_format):
+        """测试机器可读格式的 stdout 完整可解析，日志写到 stderr"""
+        import csv
+        from nexus_vpn.core.user_mgr import UserManager, log
+        
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager._bootstrap',
+                     side_effect=lambda reg: log.info("已从 Xray 配置导入 2 个用户到注册表"))
+        mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager._bootstrap_eap', side_effect=OSError("sudo 失败"))
+        
+        UserManager.list_users(output_format)
+        captured = capsys.readouterr()
+        
+        if output_format == "json":
+            rows = json.loads(captured.out)
+        elif output_format == "jsonl":
+            rows = [json.loads(line) for line in captured.out.splitlines()]
+        else:
+            rows = list(csv.DictReader(captured.out.splitlines()))
+        assert [r["username"] for r in rows] == ["alice", "bob", "carol"]
+        assert "已从 Xray 配置导入" in captured.err
+        assert "sudo 失败" in captured.err
+        
+        # 之后的日志恢复输出到 stdout
+        log.info("done")
+        assert "done" in capsys.readouterr().out
+    
     def test_get_domain_from_ipsec_conf(self, mocker, mock_ipsec_conf):
         """测试从 ipsec.conf 获取域名"""
         from nexus_vpn.core.user_mgr import UserManager
@@ -168,30 +338,196 @@ conn IKEv2-Cert
         result = UserManager._get_domain()
         assert result == "vpn.example.com"
     
-    def test_get_domain_fallback_to_ip(self, mocker):
-        """测试获取域名失败时回退到 IP"""
+    def test_get_domain_prefers_state_cache(self, mocker, temp_dir):
+        """测试优先使用 state.json 中缓存的域名"""
         from nexus_vpn.core.user_mgr import UserManager
-        
-        # 模拟文件不存在
+        from nexus_vpn.core.state import ServerState
+
+        ServerState.save({"domain": "cached.example.com", "public_ips": ["1.2.3.4"]})
+        mock_read = mocker.patch('nexus_vpn.core.state.sudo_read_file')
+
+        assert UserManager._get_domain() == "cached.example.com"
+        assert UserManager._get_v2ray_domain() == "cached.example.com"
+        mock_read.assert_not_called()
+
+    def test_get_domain_fallback_to_cached_ip(self, mocker):
+        """测试配置中没有域名时回退到缓存的公网 IP，不请求外部服务"""
+        from nexus_vpn.core.user_mgr import UserManager
+        from nexus_vpn.core.state import ServerState
+
+        ServerState.save({"domain": None, "public_ips": ["1.2.3.4"]})
+        mocker.patch('nexus_vpn.core.state.sudo_read_file', side_effect=OSError)
+        mock_urlopen = mocker.patch('urllib.request.urlopen')
+
+        assert UserManager._get_domain() == "1.2.3.4"
+        mock_urlopen.assert_not_called()
+
+    def test_get_domain_all_fail(self, mocker):
+        """测试所有获取域名方法都失败时返回默认值"""
+        from nexus_vpn.core.user_mgr import UserManager
+
         mocker.patch('builtins.open', side_effect=OSError)
+        mock_urlopen = mocker.patch('urllib.request.urlopen')
+
+        result = UserManager._get_domain()
+        assert result == "your-server-ip"
+        mock_urlopen.assert_not_called()
+
+    def test_import_users_v2ray(self, mocker, temp_dir):
+        """测试从 CSV 批量导入 V2Ray 用户"""
+        from nexus_vpn.core.user_mgr import UserManager
+        
+        csv_path = os.path.join(temp_dir, "users.csv")
+        with open(csv_path, 'w') as f:
+            f.write("username,action\n# 注释\nalice\nbob,add\n\ncarol,del\n")
+        
+        infos = {name: {"uuid": f"uuid-{name}", "public_key": "pk", "short_id": "ab", "sni": "sni", "port": 443}
+                 for name in ("alice", "bob")}
+        mock_update = mocker.patch(
+            'nexus_vpn.protocols.v2ray.V2RayManager.update_users',
+            return_value=(infos, ["carol"])
+        )
+        mock_write = mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.write_share_files', return_value=2)
+        mocker.patch.object(UserManager, '_get_v2ray_domain', return_value='example.com')
+        out = os.path.join(temp_dir, "out")
+        
+        UserManager.import_users('v2ray', csv_path, out)
+        
+        mock_update.assert_called_once_with(add=["alice", "bob"], remove=["carol"])
+        mock_write.assert_called_once_with('example.com', infos, out, "svg", None, removed=["carol"])
+        with open(os.path.join(out, "credentials.json")) as f:
+            credentials = json.load(f)
+        assert [c["username"] for c in credentials] == ["alice", "bob"]
+        assert credentials[0]["uuid"] == "uuid-alice"
+        assert credentials[0]["link"].startswith("vless://uuid-alice@example.com:443")
+        assert oct(os.stat(os.path.join(out, "credentials.json")).st_mode & 0o777) == "0o600"
+    
+    def test_import_users_delete_only_prunes_share_files(self, mocker, temp_dir):
+        """测试只有 del 行时删除被撤销用户的链接文件，并从 links.txt 中去掉"""
+        from nexus_vpn.core.user_mgr import UserManager
+        from nexus_vpn.protocols.share_render import render_share_files
+        
+        out = os.path.join(temp_dir, "out")
+        render_share_files({"alice": "vless://a@example.com:443#alice", "carol": "vless://c@example.com:443#carol"},
+                           out, workers=1)
+        csv_path = os.path.join(temp_dir, "users.csv")
+        with open(csv_path, 'w') as f:
+            f.write("carol,del\n")
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.update_users', return_value=({}, ["carol"]))
+        
+        UserManager.import_users('v2ray', csv_path, out)
+        
+        assert not os.path.exists(os.path.join(out, "carol.txt"))
+        assert not os.path.exists(os.path.join(out, "carol.svg"))
+        assert os.path.exists(os.path.join(out, "alice.svg"))
+        with open(os.path.join(out, "links.txt")) as f:
+            assert [line.split("\t")[0] for line in f] == ["alice"]
+    
+    def test_import_users_mixed_types(self, mocker, temp_dir):
+        """测试混合类型导入：按类型分组，每组一次批量操作"""
+        from nexus_vpn.core.user_mgr import UserManager
+        
+        csv_path = os.path.join(temp_dir, "team.csv")
+        with open(csv_path, 'w') as f:
+            f.write("type,username,password\n"
+                    "v2ray,alice,\n"
+                    "ikev2-eap,bob,s3cret\n"
+                    "ikev2-eap,carol,\n"
+                    "ikev2-cert,dave,\n"
+                    "v2ray,erin,\n")
+        
+        mock_v2ray = mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.update_users', return_value=({}, []))
+        mock_eap = mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.update_eap_users',
+                                return_value=(["bob", "carol"], []))
+        mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.generate_password', return_value='generated')
+        p12 = os.path.join(temp_dir, "dave.p12")
+        mock_issue = mocker.patch('nexus_vpn.core.cert_mgr.CertManager.issue_user_cert', return_value=p12)
+        mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.create_mobileconfig', return_value='<plist/>')
+        mocker.patch.object(UserManager, '_get_domain', return_value='vpn.example.com')
+        out = os.path.join(temp_dir, "out")
+        
+        UserManager.import_users(None, csv_path, out)
+        
+        mock_v2ray.assert_called_once_with(add=["alice", "erin"], remove=[])
+        mock_eap.assert_called_once_with(add={"bob": "s3cret", "carol": "generated"}, remove=[])
+        mock_issue.assert_called_once_with("dave")
+        assert os.path.exists(os.path.join(out, "dave.mobileconfig"))
+        from nexus_vpn.core.registry import UserRegistry
+        with UserRegistry.open() as reg:
+            assert reg.get('ikev2-cert', 'dave') is not None
+        with open(os.path.join(out, "credentials.json")) as f:
+            credentials = {c["username"]: c for c in json.load(f)}
+        assert credentials["bob"]["password"] == "s3cret"
+        assert credentials["carol"]["password"] == "generated"
+        assert credentials["dave"]["profile"] == os.path.join(out, "dave.mobileconfig")
+    
+    def test_import_users_merges_credentials(self, mocker, temp_dir):
+        """测试多次导入时凭据清单保留之前的用户，删除的用户被移除"""
+        from nexus_vpn.core.user_mgr import UserManager
+        
+        mocker.patch.object(UserManager, '_get_domain', return_value='vpn.example.com')
+        mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.update_eap_users',
+                     side_effect=[(["bob", "carol"], []), (["dan"], ["bob"])])
+        out = os.path.join(temp_dir, "out")
+        first = os.path.join(temp_dir, "first.json")
+        with open(first, 'w') as f:
+            json.dump([{"type": "ikev2-eap", "username": "bob"}, {"type": "ikev2-eap", "username": "carol"}], f)
+        second = os.path.join(temp_dir, "second.json")
+        with open(second, 'w') as f:
+            json.dump([{"type": "ikev2-eap", "username": "dan", "password": "pw"},
+                       {"type": "ikev2-eap", "username": "bob", "action": "del"}], f)
+        
+        UserManager.import_users(None, first, out)
+        UserManager.import_users(None, second, out)
+        
+        with open(os.path.join(out, "credentials.json")) as f:
+            assert [c["username"] for c in json.load(f)] == ["carol", "dan"]
+    
+    @pytest.mark.parametrize("content", [
+        "type,username,password\nv2ray,alice,secret\n",          # 只有 EAP 可以指定密码
+        "type,username\nv2ray,alice\nv2ray,alice\n",            # 重复
+        "username\nalice\n",                                    # 未指定类型
+        "type,username\nwireguard,alice\n",                     # 未知类型
+        "type,username,password\nikev2-eap,alice,a\"b\n",       # 密码含引号
+    ])
+    def test_import_users_rejects_invalid_rows(self, mocker, temp_dir, content):
+        """测试无效记录导致整个文件被拒绝"""
+        from nexus_vpn.core.user_mgr import UserManager
         
-        # 模拟 urllib 请求
-        mock_response = MagicMock()
-        mock_response.read.return_value = b"1.2.3.4"
-        mock_response.__enter__ = lambda s: mock_response
-        mock_response.__exit__ = MagicMock(return_value=False)
+        csv_path = os.path.join(temp_dir, "users.csv")
+        with open(csv_path, 'w') as f:
+            f.write(content)
+        mock_v2ray = mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.update_users')
+        mock_eap = mocker.patch('nexus_vpn.protocols.ikev2.IKEv2Manager.update_eap_users')
         
-        mocker.patch('urllib.request.urlopen', return_value=mock_response)
+        UserManager.import_users(None, csv_path, temp_dir)
         
-        result = UserManager._get_domain()
-        assert result == "1.2.3.4"
+        mock_v2ray.assert_not_called()
+        mock_eap.assert_not_called()
+        assert not os.path.exists(os.path.join(temp_dir, "credentials.json"))
     
-    def test_get_domain_all_fail(self, mocker):
-        """测试所有获取域名方法都失败时返回默认值"""
+    def test_import_users_rejects_invalid_name(self, mocker, temp_dir):
+        """测试导入文件包含非法用户名时整批拒绝"""
         from nexus_vpn.core.user_mgr import UserManager
         
-        mocker.patch('builtins.open', side_effect=OSError)
-        mocker.patch('urllib.request.urlopen', side_effect=Exception("Network error"))
+        csv_path = os.path.join(temp_dir, "users.csv")
+        with open(csv_path, 'w') as f:
+            f.write("alice\n../evil\n")
         
-        result = UserManager._get_domain()
-        assert result == "your-server-ip"
+        mock_update = mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.update_users')
+        
+        UserManager.import_users('v2ray', csv_path, temp_dir)
+        
+        mock_update.assert_not_called()
+    
+    def test_export_users_v2ray(self, mocker, temp_dir):
+        """测试导出所有 V2Ray 用户"""
+        from nexus_vpn.core.user_mgr import UserManager
+        
+        mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.get_all_user_info', return_value={"admin": {}})
+        mock_write = mocker.patch('nexus_vpn.protocols.v2ray.V2RayManager.write_share_files', return_value=1)
+        mocker.patch.object(UserManager, '_get_v2ray_domain', return_value='example.com')
+        
+        UserManager.export_users('v2ray', temp_dir, "png", 4)
+        
+        mock_write.assert_called_once_with('example.com', {"admin": {}}, temp_dir, "png", 4, prune=True)
@@ -25,12 +25,10 @@ class TestV2RayManager:
         config_path = os.path.join(temp_dir, "xray", "config.json")
         mocker.patch.object(V2RayManager, 'CONFIG_PATH', config_path)
         
-        # Mock xray x25519 命令
-        mock_check_output = mocker.patch('subprocess.check_output')
-        mock_check_output.side_effect = [
-            b"Private key: test_private_key_123\nPublic key: test_public_key_456\n",
-            b"abcd1234\n"  # short_id
-        ]
+        # Mock 密钥生成
+        mocker.patch('nexus_vpn.protocols.v2ray.generate_keypair',
+                     return_value=("test_private_key_123", "test_public_key_456"))
+        mocker.patch('secrets.token_hex', return_value="abcd1234")
         
         mock_run = mocker.patch('subprocess.run')
         mock_run.return_value = MagicMock(returncode=0)
@@ -50,9 +48,11 @@ class TestV2RayManager:
         assert result["sni"] == "www.microsoft.com"
         
         # 验证配置文件
-        assert os.path.exists(config_path)
-        with open(config_path, 'r') as f:
-            config = json.load(f)
+        confdir = os.path.join(temp_dir, "xray", "conf.d")
+        assert os.path.exists(os.path.join(confdir, "00-base.json"))
+        assert os.path.exists(os.path.join(confdir, "20-vless.json"))
+        assert not os.path.exists(config_path)
+        config = V2RayManager.load_config()
         
         assert "inbounds" in config
         assert "outbounds" in config
@@ -66,11 +66,9 @@ class TestV2RayManager:
         config_path = os.path.join(temp_dir, "xray", "config.json")
         mocker.patch.object(V2RayManager, 'CONFIG_PATH', config_path)
         
-        mock_check_output = mocker.patch('subprocess.check_output')
-        mock_check_output.side_effect = [
-            b"Private key: priv\nPublic key: pub\n",
-            b"1234\n"
-        ]
+        mocker.patch('nexus_vpn.protocols.v2ray.generate_keypair',
+                     return_value=("priv", "pub"))
+        mocker.patch('secrets.token_hex', return_value="1234")
         
         # 直接 mock sudo_run 并验证调用
         mock_sudo_run = mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
@@ -90,8 +88,7 @@ class TestV2RayManager:
         
         V2RayManager.add_user("newuser")
         
-        with open(mock_xray_config, 'r') as f:
-            config = json.load(f)
+        config = V2RayManager.load_config()
         
         clients = config['inbounds'][0]['settings']['clients']
         emails = [c.get('email') for c in clients]
@@ -99,6 +96,42 @@ class TestV2RayManager:
         assert "newuser" in emails
         mock_sudo_run.assert_called_with(["systemctl", "restart", "nexus-xray"], check=True)
     
+    def test_concurrent_add_user(self, mocker, mock_xray_config):
+        """测试并发添加用户时不会丢失任何一次更新"""
+        import json
+        from concurrent.futures import ThreadPoolExecutor
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mocker.patch.object(V2RayManager, '_apply_user_changes')
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(V2RayManager.add_user, [f"user{i}" for i in range(16)]))
+        
+        with open(mock_xray_config) as f:
+            clients = json.load(f)['inbounds'][0]['settings']['clients']
+        assert len(clients) == 18
+        assert {f"user{i}" for i in range(16)} <= {c['email'] for c in clients}
+    
+    def test_recover_interrupted_rewrites_and_restarts(self, mocker, mock_xray_config):
+        """测试重放崩溃日志时由注册表重写配置并重启"""
+        import json
+        from nexus_vpn.core.registry import UserRegistry
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mock_restart = mocker.patch.object(V2RayManager, '_restart')
+        # 模拟注册表已提交、配置文件尚未写入时崩溃
+        with V2RayManager._registry(write=True) as reg:
+            reg.add("v2ray", "crashed", "uuid-c")
+        
+        V2RayManager._recover({"op": "add_user"}, True)
+        
+        with open(mock_xray_config) as f:
+            emails = [c['email'] for c in json.load(f)['inbounds'][0]['settings']['clients']]
+        assert emails == ["admin", "testuser", "crashed"]
+        mock_restart.assert_called_once()
+    
     def test_add_user_preserves_existing(self, mocker, mock_xray_config):
         """测试 add_user 保留现有用户"""
         from nexus_vpn.protocols.v2ray import V2RayManager
@@ -108,13 +141,11 @@ class TestV2RayManager:
         mocker.patch('uuid.uuid4', return_value=MagicMock(__str__=lambda x: "new-uuid"))
         
         # 读取原始用户
-        with open(mock_xray_config, 'r') as f:
-            original_clients = json.load(f)['inbounds'][0]['settings']['clients']
+        original_clients = V2RayManager.load_config()['inbounds'][0]['settings']['clients']
         
         V2RayManager.add_user("brandnewuser")
         
-        with open(mock_xray_config, 'r') as f:
-            new_clients = json.load(f)['inbounds'][0]['settings']['clients']
+        new_clients = V2RayManager.load_config()['inbounds'][0]['settings']['clients']
         
         # 验证原始用户仍存在
         for orig in original_clients:
@@ -132,8 +163,7 @@ class TestV2RayManager:
         
         V2RayManager.remove_user("testuser")
         
-        with open(mock_xray_config, 'r') as f:
-            config = json.load(f)
+        config = V2RayManager.load_config()
         
         clients = config['inbounds'][0]['settings']['clients']
         emails = [c.get('email') for c in clients]
@@ -210,11 +240,9 @@ class TestV2RayManager:
         config_path = os.path.join(temp_dir, "xray", "config.json")
         mocker.patch.object(V2RayManager, 'CONFIG_PATH', config_path)
         
-        mock_check_output = mocker.patch('subprocess.check_output')
-        mock_check_output.side_effect = [
-            b"Private key: priv_key\nPublic key: pub_key\n",
-            b"1234\n"
-        ]
+        mocker.patch('nexus_vpn.protocols.v2ray.generate_keypair',
+                     return_value=("priv_key", "pub_key"))
+        mocker.patch('secrets.token_hex', return_value="1234")
         
         mocker.patch('subprocess.run')
         mocker.patch('uuid.uuid4', return_value=MagicMock(__str__=lambda x: "test-uuid"))
@@ -222,8 +250,7 @@ class TestV2RayManager:
         dests = ["www.microsoft.com:443", "www.apple.com:443", "www.google.com:443"]
         result = V2RayManager.create_config("example.com", dests, preserve_users=False)
         
-        with open(config_path, 'r') as f:
-            config = json.load(f)
+        config = V2RayManager.load_config()
         
         reality_settings = config['inbounds'][0]['streamSettings']['realitySettings']
         
@@ -243,22 +270,16 @@ class TestV2RayManager:
         mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
         
         # 读取原始用户
-        with open(mock_xray_config, 'r') as f:
-            original_config = json.load(f)
+        original_config = V2RayManager.load_config()
         original_clients = original_config['inbounds'][0]['settings']['clients']
         original_private_key = original_config['inbounds'][0]['streamSettings']['realitySettings']['privateKey']
         
-        mock_check_output = mocker.patch('subprocess.check_output')
-        # 模拟从私钥推导公钥
-        mock_check_output.return_value = b"Public key: derived_pub_key\n"
-        
         mocker.patch('subprocess.run')
         
         # 使用新的 reality_dests 重新生成配置
         result = V2RayManager.create_config("example.com", "www.apple.com:443", preserve_users=True)
         
-        with open(mock_xray_config, 'r') as f:
-            new_config = json.load(f)
+        new_config = V2RayManager.load_config()
         
         new_clients = new_config['inbounds'][0]['settings']['clients']
         new_private_key = new_config['inbounds'][0]['streamSettings']['realitySettings']['privateKey']
@@ -280,19 +301,16 @@ class TestV2RayManager:
         
         mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
         
-        mock_check_output = mocker.patch('subprocess.check_output')
-        mock_check_output.side_effect = [
-            b"Private key: new_priv_key\nPublic key: new_pub_key\n",
-            b"5678\n"
-        ]
+        mocker.patch('nexus_vpn.protocols.v2ray.generate_keypair',
+                     return_value=("new_priv_key", "new_pub_key"))
+        mocker.patch('secrets.token_hex', return_value="5678")
         
         mocker.patch('subprocess.run')
         mocker.patch('uuid.uuid4', return_value=MagicMock(__str__=lambda x: "new-admin-uuid"))
         
         result = V2RayManager.create_config("example.com", "www.apple.com:443", preserve_users=False)
         
-        with open(mock_xray_config, 'r') as f:
-            new_config = json.load(f)
+        new_config = V2RayManager.load_config()
         
         new_clients = new_config['inbounds'][0]['settings']['clients']
         
@@ -310,11 +328,9 @@ class TestV2RayManager:
         config_path = os.path.join(temp_dir, "xray", "config.json")
         mocker.patch.object(V2RayManager, 'CONFIG_PATH', config_path)
         
-        mock_check_output = mocker.patch('subprocess.check_output')
-        mock_check_output.side_effect = [
-            b"Private key: priv\nPublic key: pub\n",
-            b"1234\n"
-        ]
+        mocker.patch('nexus_vpn.protocols.v2ray.generate_keypair',
+                     return_value=("priv", "pub"))
+        mocker.patch('secrets.token_hex', return_value="1234")
         
         mocker.patch('subprocess.run')
         mocker.patch('uuid.uuid4', return_value=MagicMock(__str__=lambda x: "uuid"))
@@ -322,8 +338,403 @@ class TestV2RayManager:
         # 传入单个字符串而非列表
         result = V2RayManager.create_config("example.com", "www.example.com:443", preserve_users=False)
         
-        with open(config_path, 'r') as f:
-            config = json.load(f)
+        config = V2RayManager.load_config()
         
         assert config['inbounds'][0]['streamSettings']['realitySettings']['dest'] == "www.example.com:443"
         assert config['inbounds'][0]['streamSettings']['realitySettings']['serverNames'] == ["www.example.com"]
+
+    def test_create_config_enables_api(self, mocker, temp_dir):
+        """测试 create_config 在回环地址启用 API 入口"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        config_path = os.path.join(temp_dir, "xray", "config.json")
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', config_path)
+        
+        mocker.patch('nexus_vpn.protocols.v2ray.generate_keypair',
+                     return_value=("priv", "pub"))
+        mocker.patch('secrets.token_hex', return_value="1234")
+        mocker.patch('subprocess.run')
+        
+        V2RayManager.create_config("example.com", "www.example.com:443", preserve_users=False)
+        
+        config = V2RayManager.load_config()
+        
+        assert config['api']['services'] == ["HandlerService", "StatsService"]
+        assert config['inbounds'][0]['tag'] == V2RayManager.INBOUND_TAG
+        api_inbound = config['inbounds'][1]
+        assert api_inbound['tag'] == V2RayManager.API_TAG
+        assert api_inbound['listen'] == "127.0.0.1"
+        assert config['routing']['rules'][0]['outboundTag'] == V2RayManager.API_TAG
+        assert config['stats'] == {}
+        assert config['policy']['levels']['0'] == {"statsUserUplink": True, "statsUserDownlink": True}
+
+    def test_create_config_caches_public_key(self, mocker, temp_dir):
+        """测试 create_config 在 nexus 元数据中缓存公钥且不调用子进程"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        from nexus_vpn.utils.x25519 import public_key_from_private
+        
+        config_path = os.path.join(temp_dir, "xray", "config.json")
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', config_path)
+        mock_check_output = mocker.patch('subprocess.check_output')
+        mocker.patch('subprocess.run')
+        
+        result = V2RayManager.create_config("example.com", "www.example.com:443", preserve_users=False)
+        
+        config = V2RayManager.load_config()
+        
+        priv_key = config['inbounds'][0]['streamSettings']['realitySettings']['privateKey']
+        assert config['nexus']['public_key'] == public_key_from_private(priv_key)
+        assert result['public_key'] == config['nexus']['public_key']
+        assert len(result['short_id']) == 8
+        mock_check_output.assert_not_called()
+    
+    def test_add_user_caches_public_key(self, mocker, mock_xray_config):
+        """测试 add_user 不调用子进程并为旧配置补上公钥缓存"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+        mock_check_output = mocker.patch('subprocess.check_output')
+        
+        info = V2RayManager.add_user("newuser")
+        
+        config = V2RayManager.load_config()
+        
+        assert info['public_key'] == "hSDwCYkwp1R0i33ctD73Wg2_Og0mOBr066SpjqqbTmo"
+        assert config['nexus']['public_key'] == info['public_key']
+        mock_check_output.assert_not_called()
+    
+    def test_get_user_info_uses_cached_public_key(self, mocker, mock_xray_config):
+        """测试 get_user_info 直接使用缓存的公钥"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        with open(mock_xray_config, 'r') as f:
+            config = json.load(f)
+        config['nexus'] = {"domain": "example.com", "public_key": "cached-pub"}
+        with open(mock_xray_config, 'w') as f:
+            json.dump(config, f)
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mock_derive = mocker.patch('nexus_vpn.protocols.v2ray.public_key_from_private')
+        
+        info = V2RayManager.get_user_info("testuser")
+        
+        assert info['uuid'] == "test-uuid-2"
+        assert info['public_key'] == "cached-pub"
+        mock_derive.assert_not_called()
+
+    def test_update_users_single_write_and_restart(self, mocker, mock_xray_config):
+        """测试 update_users 批量增删只写一次配置、只重启一次"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        import nexus_vpn.protocols.v2ray as v2ray_mod
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mock_sudo_run = mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+        mock_write = mocker.patch.object(v2ray_mod, 'sudo_write_file', wraps=v2ray_mod.sudo_write_file)
+        
+        infos, removed = V2RayManager.update_users(add=["u1", "u2", "admin"], remove=["testuser"])
+        
+        assert sorted(infos) == ["u1", "u2"]  # admin 已存在，被跳过
+        assert removed == ["testuser"]
+        # 只写一次配置；其余写入是重启成功后保存的最近可用配置
+        live_writes = [c for c in mock_write.call_args_list if "last-good" not in c.args[0]]
+        assert len(live_writes) == 1
+        mock_sudo_run.assert_called_once_with(["systemctl", "restart", "nexus-xray"], check=True)
+        
+        emails = [c['email'] for c in V2RayManager.load_config()['inbounds'][0]['settings']['clients']]
+        assert emails == ["admin", "u1", "u2"]
+    
+    def test_update_users_noop(self, mocker, mock_xray_config):
+        """测试没有实际变更时不写配置也不重启"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mock_sudo_run = mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+        
+        assert V2RayManager.update_users(add=["admin"], remove=["ghost"]) == ({}, [])
+        mock_sudo_run.assert_not_called()
+    
+    def test_write_share_files(self, temp_dir):
+        """测试为每个用户写出链接与 SVG 二维码"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        info = {"uuid": "u-1", "public_key": "pk", "short_id": "1234", "sni": "www.example.com", "port": 443}
+        out = os.path.join(temp_dir, "export")
+        
+        count = V2RayManager.write_share_files("example.com", {"alice": info}, out)
+        
+        assert count == 1
+        with open(os.path.join(out, "alice.txt")) as f:
+            link = f.read().strip()
+        assert link.startswith("vless://u-1@example.com:443")
+        assert link.endswith("#alice")
+        assert os.path.exists(os.path.join(out, "alice.svg"))
+        with open(os.path.join(out, "links.txt")) as f:
+            assert f.read() == f"alice\t{link}\n"
+
+    def test_shards_share_users_and_keys(self, mocker, mock_xray_config):
+        """测试分片模式下每个实例的用户和密钥一致，仅端口不同"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mock_sudo_run = mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+        
+        V2RayManager.create_config("example.com", "www.example.com:443", shards=2)
+        V2RayManager.add_user("newuser")
+        
+        shards_dir = os.path.join(os.path.dirname(mock_xray_config), "shards")
+        master = V2RayManager.load_config()
+        for i in range(2):
+            with open(os.path.join(shards_dir, str(i), "00-base.json")) as f:
+                base = json.load(f)
+            with open(os.path.join(shards_dir, str(i), "20-vless.json")) as f:
+                vless = json.load(f)['inbounds'][0]
+            assert vless['port'] == 20443 + i
+            assert base['inbounds'][0]['port'] == 10085 + i
+            assert vless['settings'] == master['inbounds'][0]['settings']
+            assert vless['streamSettings'] == master['inbounds'][0]['streamSettings']
+        assert master['inbounds'][0]['port'] == 443
+        assert any(c['email'] == "newuser" for c in master['inbounds'][0]['settings']['clients'])
+        
+        # 分片逐个重启
+        restarts = [c.args[0] for c in mock_sudo_run.call_args_list if c.args[0][:2] == ["systemctl", "restart"]]
+        assert restarts[-2:] == [["systemctl", "restart", "nexus-xray@0"], ["systemctl", "restart", "nexus-xray@1"]]
+    
+    def test_shards_api_addresses(self):
+        """测试分片模式下每个实例都有独立的 API 地址"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        cfg = {
+            "nexus": {"shards": 3},
+            "inbounds": [{"tag": "vless-in"}, {"tag": "api", "listen": "127.0.0.1", "port": 10085}]
+        }
+        
+        assert V2RayManager._api_addresses(cfg) == ["127.0.0.1:10085", "127.0.0.1:10086", "127.0.0.1:10087"]
+        assert V2RayManager.service_units(cfg) == ["nexus-xray@0", "nexus-xray@1", "nexus-xray@2"]
+
+    def test_profile_survives_user_changes(self, mocker, mock_xray_config):
+        """测试调优档位在 add_user / remove_user / 重新生成配置后保留"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+        mocker.patch('nexus_vpn.protocols.xray_tuning.total_memory_bytes', return_value=2 << 30)
+        mocker.patch('nexus_vpn.protocols.xray_tuning.cpu_count', return_value=2)
+        
+        V2RayManager.create_config("example.com", "www.example.com:443", profile="high-throughput")
+        V2RayManager.add_user("newuser")
+        V2RayManager.remove_user("testuser")
+        V2RayManager.create_config("example.com", "www.apple.com:443")
+        
+        config = V2RayManager.load_config()
+        
+        assert config['nexus']['profile'] == "high-throughput"
+        level = config['policy']['levels']['0']
+        assert level['statsUserUplink'] is True
+        assert level['handshake'] == 4
+        assert level['bufferSize'] == 256
+        assert config['inbounds'][0]['streamSettings']['sockopt']['tcpFastOpen'] is True
+        assert config['outbounds'][0]['streamSettings']['sockopt']['mark'] == 0x4E58
+
+    def test_user_change_rewrites_only_inbound_file(self, mocker, mock_xray_config):
+        """测试 confdir 布局下用户变更只重写紧凑的 VLESS 入站文件"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        import nexus_vpn.protocols.v2ray as v2ray_mod
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+        V2RayManager.create_config("example.com", "www.example.com:443")
+        
+        mocker.patch.object(V2RayManager, '_apply_user_changes')
+        mock_write = mocker.patch.object(v2ray_mod, 'sudo_write_file', wraps=v2ray_mod.sudo_write_file)
+        V2RayManager.add_user("newuser")
+        V2RayManager.remove_user("testuser")
+        
+        confdir = V2RayManager.confdir()
+        inbound_path = os.path.join(confdir, "20-vless.json")
+        # 先写临时文件再原子替换
+        assert [c.args[0] for c in mock_write.call_args_list] == [inbound_path + ".tmp"] * 2
+        assert not os.path.exists(inbound_path + ".tmp")
+        with open(inbound_path) as f:
+            content = f.read()
+        assert "\n" not in content
+        inbounds = json.loads(content)['inbounds']
+        assert [c['email'] for c in inbounds[0]['settings']['clients']] == ["admin", "newuser"]
+        
+        with open(os.path.join(confdir, "00-base.json")) as f:
+            base = json.load(f)
+        assert [i['tag'] for i in base['inbounds']] == ["api"]
+        assert "streamSettings" not in json.dumps(base['inbounds'])
+
+    def test_legacy_config_migrated_to_confdir(self, mocker, mock_xray_config):
+        """测试旧版单文件配置：install 前整体写回，install 后迁移并备份"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+        
+        V2RayManager.add_user("newuser")
+        assert not os.path.exists(V2RayManager.confdir())
+        with open(mock_xray_config) as f:
+            assert any(c['email'] == "newuser" for c in json.load(f)['inbounds'][0]['settings']['clients'])
+        
+        V2RayManager.create_config("example.com", "www.example.com:443")
+        assert not os.path.exists(mock_xray_config)
+        assert os.path.exists(mock_xray_config + ".bak")
+        emails = [c['email'] for c in V2RayManager.load_config()['inbounds'][0]['settings']['clients']]
+        assert emails == ["admin", "testuser", "newuser"]
+
+    def test_add_user_rejects_duplicate(self, mocker, mock_xray_config):
+        """测试重复添加同名用户被拒绝且不改动配置"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        import nexus_vpn.protocols.v2ray as v2ray_mod
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mock_sudo_run = mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+        mock_write = mocker.patch.object(v2ray_mod, 'sudo_write_file', wraps=v2ray_mod.sudo_write_file)
+        
+        assert V2RayManager.add_user("testuser") is None
+        
+        mock_write.assert_not_called()
+        mock_sudo_run.assert_not_called()
+        assert [c[0] for c in V2RayManager.get_clients()] == ["admin", "testuser"]
+
+    def test_registry_bootstrap_dedupes_legacy_clients(self, mocker, mock_xray_config):
+        """测试从旧配置初始化注册表时去掉重复用户"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        with open(mock_xray_config) as f:
+            config = json.load(f)
+        clients = config['inbounds'][0]['settings']['clients']
+        clients.append({"id": "test-uuid-3", "flow": "xtls-rprx-vision", "email": "testuser"})
+        with open(mock_xray_config, 'w') as f:
+            json.dump(config, f)
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        
+        assert V2RayManager.get_clients() == [("admin", "test-uuid-1"), ("testuser", "test-uuid-2")]
+
+    def test_lookups_do_not_parse_client_file(self, mocker, mock_xray_config):
+        """测试 confdir 布局下查询与删除不需要解析用户所在的入站文件"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+        V2RayManager.create_config("example.com", "www.example.com:443")
+        
+        # 入站文件损坏也不影响基于注册表的查询，下一次写入会重新渲染
+        with open(os.path.join(V2RayManager.confdir(), "20-vless.json"), 'w') as f:
+            f.write("{corrupt")
+        
+        assert V2RayManager.get_user_info("testuser")['uuid'] == "test-uuid-2"
+        V2RayManager.remove_user("testuser")
+        with open(os.path.join(V2RayManager.confdir(), "20-vless.json")) as f:
+            clients = json.load(f)['inbounds'][0]['settings']['clients']
+        assert [c['email'] for c in clients] == ["admin"]
+
+    def test_set_reality_dests(self, mocker, mock_xray_config):
+        """测试切换 Reality 目标保留用户并记录候选顺序"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mock_sudo_run = mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+        
+        # 旧配置没有候选列表时由 dest/serverNames 还原
+        assert V2RayManager.get_reality_dests() == ["www.microsoft.com:443"]
+        
+        V2RayManager.create_config("example.com", ["a.example:443", "b.example:8443"])
+        V2RayManager.set_reality_dests(["b.example:8443", "a.example:443"])
+        
+        config = V2RayManager.load_config()
+        reality_settings = config['inbounds'][0]['streamSettings']['realitySettings']
+        assert reality_settings['dest'] == "b.example:8443"
+        assert reality_settings['serverNames'] == ["b.example", "a.example"]
+        assert V2RayManager.get_reality_dests() == ["b.example:8443", "a.example:443"]
+        assert [c['email'] for c in config['inbounds'][0]['settings']['clients']] == ["admin", "testuser"]
+        mock_sudo_run.assert_called_with(["systemctl", "restart", "nexus-xray"], check=True)
+
+
+class TestApplyPipeline:
+    """配置校验、原子替换、健康检查与回滚"""
+
+    def test_validation_failure_leaves_config_untouched(self, mocker, mock_xray_config, temp_dir):
+        """测试 xray run -test 未通过时不改动现有配置也不重启"""
+        from nexus_vpn.protocols.v2ray import V2RayManager, XrayConfigError
+        
+        xray_bin = os.path.join(temp_dir, "xray-bin")
+        open(xray_bin, 'w').close()
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mocker.patch.object(V2RayManager, 'XRAY_BIN', xray_bin)
+        mock_sudo_run = mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+        mock_sudo_run.return_value = MagicMock(returncode=1, stdout="", stderr="invalid inbound")
+        with open(mock_xray_config) as f:
+            original = f.read()
+        
+        with pytest.raises(XrayConfigError, match="invalid inbound"):
+            V2RayManager.create_config("example.com", "www.example.com:443")
+        
+        assert mock_sudo_run.call_args.args[0][:3] == [xray_bin, "run", "-test"]
+        assert not os.path.exists(V2RayManager.confdir())
+        assert not os.path.exists(os.path.join(temp_dir, "xray", "conf.d.staging"))
+        with open(mock_xray_config) as f:
+            assert f.read() == original
+
+    def test_missing_xray_binary_warns(self, mocker, mock_xray_config):
+        """测试找不到 xray 时明确提示跳过校验"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        mocker.patch.object(V2RayManager, 'XRAY_BIN', "/nonexistent/xray")
+        mock_warning = mocker.patch('nexus_vpn.protocols.v2ray.log.warning')
+        
+        V2RayManager._validate({})
+        
+        assert "跳过配置校验" in mock_warning.call_args.args[0]
+
+    def test_success_saves_last_good(self, mocker, mock_xray_config, temp_dir):
+        """测试健康检查通过后保存最近一次可用配置"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+        
+        V2RayManager.create_config("example.com", "www.example.com:443")
+        
+        last_good = os.path.join(temp_dir, "xray", "conf.d.last-good")
+        with open(os.path.join(last_good, "20-vless.json")) as f:
+            assert json.load(f) == {"inbounds": [V2RayManager.load_config()['inbounds'][0]]}
+
+    def test_health_failure_rolls_back(self, mocker, mock_xray_config, mock_xray_health):
+        """测试重启后健康检查失败时回滚到上一次可用配置"""
+        from nexus_vpn.protocols.v2ray import V2RayManager, XrayConfigError
+        
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mock_sudo_run = mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+        V2RayManager.create_config("example.com", "www.apple.com:443")
+        
+        mock_xray_health.return_value = False
+        with pytest.raises(XrayConfigError, match="已回滚"):
+            V2RayManager.set_reality_dests(["www.example.com:443"])
+        
+        reality_settings = V2RayManager.load_config()['inbounds'][0]['streamSettings']['realitySettings']
+        assert reality_settings['dest'] == "www.apple.com:443"
+        mock_sudo_run.assert_called_with(["systemctl", "restart", "nexus-xray"])
+
+    def test_healthy_checks_unit_and_port(self, mocker, mock_xray_health):
+        """测试健康检查同时要求单元 active 与端口可连接"""
+        import socket
+        from nexus_vpn.protocols.v2ray import V2RayManager
+        
+        mocker.stop(mock_xray_health)
+        mocker.patch.object(V2RayManager, 'HEALTH_TIMEOUT', 0)
+        mock_run = mocker.patch('nexus_vpn.protocols.v2ray.subprocess.run')
+        mock_run.return_value = MagicMock(returncode=0)
+        
+        with socket.socket() as server:
+            server.bind(("127.0.0.1", 0))
+            server.listen(1)
+            port = server.getsockname()[1]
+            assert V2RayManager._healthy("nexus-xray", port) is True
+        assert V2RayManager._healthy("nexus-xray", port) is False
+        
+        mock_run.return_value = MagicMock(returncode=3)
+        assert V2RayManager._healthy("nexus-xray", port) is False
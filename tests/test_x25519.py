@@ -0,0 +1,41 @@
+"""测试 nexus_vpn.utils.x25519 模块"""
+import pytest
+
+# RFC 7748 6.1 中 Alice 的密钥对
+ALICE_PRIVATE = "dwdtCnMYpX08FsFyUbJmRd9ML4frwJkqsXf7pR25LCo"
+ALICE_PUBLIC = "hSDwCYkwp1R0i33ctD73Wg2_Og0mOBr066SpjqqbTmo"
+
+
+class TestX25519:
+    """X25519 密钥工具测试"""
+
+    def test_scalar_mult_rfc_vector(self):
+        """测试 RFC 7748 5.2 的标量乘法向量"""
+        from nexus_vpn.utils.x25519 import scalar_mult
+
+        scalar = bytes.fromhex("a546e36bf0527c9d3b16154b82465edd62144c0ac1fc5a18506a2244ba449ac4")
+        u = bytes.fromhex("e6db6867583030db3594c1a424b15f7c726624ec26b3353b10a903a6d0ab1c4c")
+        expected = "c3da55379de9c6908e94ea4df28d084f32eccf03491c71f754b4075577a28552"
+        assert scalar_mult(scalar, u).hex() == expected
+
+    def test_public_key_from_private(self):
+        """测试从私钥推导公钥"""
+        from nexus_vpn.utils.x25519 import public_key_from_private
+
+        assert public_key_from_private(ALICE_PRIVATE) == ALICE_PUBLIC
+
+    def test_generate_keypair_consistent(self):
+        """测试生成的密钥对可互相推导且为 43 字符无填充 base64"""
+        from nexus_vpn.utils.x25519 import generate_keypair, public_key_from_private
+
+        priv, pub = generate_keypair()
+        assert len(priv) == 43 and len(pub) == 43
+        assert "=" not in priv
+        assert public_key_from_private(priv) == pub
+
+    def test_invalid_key_length(self):
+        """测试无效长度的密钥"""
+        from nexus_vpn.utils.x25519 import decode_key
+
+        with pytest.raises(ValueError):
+            decode_key("dGVzdA")
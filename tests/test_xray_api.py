@@ -0,0 +1,189 @@
+"""测试 nexus_vpn.protocols.xray_api 模块"""
+import json
+from concurrent import futures
+
+import grpc
+import pytest
+
+
+class FakeHandlerService:
+    """本地替身 gRPC 服务，记录收到的 AlterInbound 请求"""
+
+    def __init__(self, fail=False):
+        self.requests = []
+        self.fail = fail
+
+    def alter_inbound(self, request, context):
+        self.requests.append(request)
+        if self.fail:
+            context.abort(grpc.StatusCode.UNKNOWN, "user already exists")
+        return b""
+
+
+@pytest.fixture
+def fake_xray_api():
+    """启动一个监听随机端口的替身 HandlerService"""
+    from nexus_vpn.protocols.xray_api import HANDLER_SERVICE
+
+    service = FakeHandlerService()
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    handler = grpc.method_handlers_generic_handler(HANDLER_SERVICE, {
+        "AlterInbound": grpc.unary_unary_rpc_method_handler(service.alter_inbound),
+    })
+    server.add_generic_rpc_handlers((handler,))
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    service.address = f"127.0.0.1:{port}"
+    yield service
+    server.stop(None)
+
+
+class TestEncoding:
+    """protobuf 手工编码测试"""
+
+    def test_encode_remove_user_wire_format(self):
+        """测试 RemoveUserOperation 的线格式"""
+        from nexus_vpn.protocols.xray_api import encode_remove_user, REMOVE_USER_OPERATION
+
+        data = encode_remove_user("t", "a")
+        type_name = REMOVE_USER_OPERATION.encode()
+        typed = b"\x0a" + bytes([len(type_name)]) + type_name + b"\x12\x03\x0a\x01a"
+        assert data == b"\x0a\x01t" + b"\x12" + bytes([len(typed)]) + typed
+
+    def test_encode_add_user_contains_account(self):
+        """测试 AddUserOperation 包含 VLESS 账户信息"""
+        from nexus_vpn.protocols.xray_api import encode_add_user, VLESS_ACCOUNT, ADD_USER_OPERATION
+
+        client = {"id": "uuid-1", "flow": "xtls-rprx-vision", "email": "alice"}
+        data = encode_add_user("vless-in", client)
+
+        assert data.startswith(b"\x0a\x08vless-in")
+        for part in (b"uuid-1", b"xtls-rprx-vision", b"alice",
+                     VLESS_ACCOUNT.encode(), ADD_USER_OPERATION.encode()):
+            assert part in data
+
+    def test_varint_multibyte(self):
+        """测试多字节 varint 编码"""
+        from nexus_vpn.protocols.xray_api import _varint
+
+        assert _varint(1) == b"\x01"
+        assert _varint(300) == b"\xac\x02"
+
+
+class TestXrayApiClient:
+    """XrayApiClient 与替身服务交互测试"""
+
+    def test_add_and_remove_user(self, fake_xray_api):
+        """测试 add_user / remove_user 发送 AlterInbound 请求"""
+        from nexus_vpn.protocols.xray_api import XrayApiClient, encode_add_user, encode_remove_user
+
+        client = {"id": "uuid-1", "flow": "xtls-rprx-vision", "email": "alice"}
+        with XrayApiClient(fake_xray_api.address) as api:
+            api.add_user("vless-in", client)
+            api.remove_user("vless-in", "alice")
+
+        assert fake_xray_api.requests == [
+            encode_add_user("vless-in", client),
+            encode_remove_user("vless-in", "alice"),
+        ]
+
+    def test_rpc_error_raises(self, fake_xray_api):
+        """测试服务端返回错误时抛出 XrayApiError"""
+        from nexus_vpn.protocols.xray_api import XrayApiClient, XrayApiError
+
+        fake_xray_api.fail = True
+        with XrayApiClient(fake_xray_api.address) as api:
+            with pytest.raises(XrayApiError):
+                api.remove_user("vless-in", "alice")
+
+
+class TestV2RayHotReload:
+    """V2RayManager 通过 API 热更新用户"""
+
+    @staticmethod
+    def _enable_api(config_path, address):
+        with open(config_path) as f:
+            cfg = json.load(f)
+        host, port = address.rsplit(":", 1)
+        cfg['inbounds'][0]['tag'] = "vless-in"
+        cfg['inbounds'].append({
+            "tag": "api", "listen": host, "port": int(port),
+            "protocol": "dokodemo-door", "settings": {"address": host}
+        })
+        with open(config_path, 'w') as f:
+            json.dump(cfg, f)
+
+    def test_add_user_without_restart(self, mocker, mock_xray_config, fake_xray_api):
+        """测试启用 API 时 add_user 不重启服务"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+
+        self._enable_api(mock_xray_config, fake_xray_api.address)
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mock_sudo_run = mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+
+        V2RayManager.add_user("newuser")
+
+        assert len(fake_xray_api.requests) == 1
+        assert b"newuser" in fake_xray_api.requests[0]
+        mock_sudo_run.assert_not_called()
+        clients = V2RayManager.load_config()['inbounds'][0]['settings']['clients']
+        assert any(c['email'] == "newuser" for c in clients)
+
+    def test_remove_user_without_restart(self, mocker, mock_xray_config, fake_xray_api):
+        """测试启用 API 时 remove_user 不重启服务"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+
+        self._enable_api(mock_xray_config, fake_xray_api.address)
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mock_sudo_run = mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+
+        V2RayManager.remove_user("testuser")
+
+        assert len(fake_xray_api.requests) == 1
+        assert b"testuser" in fake_xray_api.requests[0]
+        mock_sudo_run.assert_not_called()
+
+    def test_api_failure_falls_back_to_restart(self, mocker, mock_xray_config, fake_xray_api):
+        """测试 API 调用失败时回退到重启服务"""
+        from nexus_vpn.protocols.v2ray import V2RayManager
+
+        fake_xray_api.fail = True
+        self._enable_api(mock_xray_config, fake_xray_api.address)
+        mocker.patch.object(V2RayManager, 'CONFIG_PATH', mock_xray_config)
+        mock_sudo_run = mocker.patch('nexus_vpn.protocols.v2ray.sudo_run')
+
+        V2RayManager.remove_user("testuser")
+
+        mock_sudo_run.assert_called_with(["systemctl", "restart", "nexus-xray"], check=True)
+
+
+class TestStatsQuery:
+    """StatsService 查询测试"""
+
+    def test_query_stats_against_stand_in(self):
+        """测试 QueryStats 请求编码与响应解码"""
+        from nexus_vpn.protocols.xray_api import (
+            XrayApiClient, STATS_SERVICE, encode_query_stats, _field_bytes, _field_varint
+        )
+
+        received = []
+
+        def query_stats(request, context):
+            received.append(request)
+            stat = _field_bytes(1, "user>>>alice>>>traffic>>>uplink") + _field_varint(2, 123456)
+            return _field_bytes(1, stat)
+
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=1))
+        server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(STATS_SERVICE, {
+            "QueryStats": grpc.unary_unary_rpc_method_handler(query_stats),
+        }),))
+        port = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        try:
+            with XrayApiClient(f"127.0.0.1:{port}") as api:
+                result = api.query_stats("user>>>", reset=True)
+        finally:
+            server.stop(None)
+
+        assert received == [encode_query_stats("user>>>", reset=True)]
+        assert result == {"user>>>alice>>>traffic>>>uplink": 123456}
@@ -0,0 +1,72 @@
+"""测试 nexus_vpn.protocols.xray_tuning 模块"""
+import pytest
+
+
+class TestXrayTuning:
+    """Xray 调优档位测试"""
+
+    def test_buffer_scales_with_memory_and_cores(self):
+        """测试缓冲随内存增大、随核数（并发）增多而减小，并受档位上下限约束"""
+        from nexus_vpn.protocols.xray_tuning import buffer_size_kb
+
+        small = buffer_size_kb("high-throughput", 512 << 20, 1)
+        large = buffer_size_kb("high-throughput", 64 << 30, 2)
+        crowded = buffer_size_kb("high-throughput", 64 << 30, 32)
+
+        assert small == 128
+        assert large == 1024  # 触顶
+        assert crowded < large
+        assert buffer_size_kb("low-memory", 64 << 30, 2) == 64
+
+    def test_unknown_memory_uses_lower_bound(self):
+        """测试无法获取内存时使用档位下限"""
+        from nexus_vpn.protocols.xray_tuning import buffer_size_kb
+
+        assert buffer_size_kb("mobile", 0, 4) == 32
+
+    def test_build_tuning(self):
+        """测试档位生成 policy 与 sockopt"""
+        from nexus_vpn.protocols.xray_tuning import build_tuning, SOCKET_MARK
+
+        tuning = build_tuning("mobile", mem_bytes=2 << 30, cpus=2, congestion_controls=["reno", "cubic", "bbr"])
+
+        assert tuning["policy"]["handshake"] == 8
+        assert tuning["policy"]["connIdle"] == 600
+        assert tuning["policy"]["bufferSize"] == 179
+        assert tuning["inbound_sockopt"]["tcpFastOpen"] is True
+        assert tuning["inbound_sockopt"]["tcpKeepAliveIdle"] == 30
+        assert tuning["inbound_sockopt"]["tcpcongestion"] == "bbr"
+        assert "mark" not in tuning["inbound_sockopt"]
+        assert tuning["outbound_sockopt"]["mark"] == SOCKET_MARK
+
+    def test_no_bbr_keeps_default_congestion(self, temp_dir):
+        """测试内核不支持 bbr 时不设置 tcpcongestion"""
+        import os
+        from nexus_vpn.protocols.xray_tuning import build_tuning
+        from nexus_vpn.utils.host import available_congestion_controls
+
+        path = os.path.join(temp_dir, "tcp_available_congestion_control")
+        with open(path, "w") as f:
+            f.write("reno cubic\n")
+        controls = available_congestion_controls(path)
+
+        tuning = build_tuning("high-throughput", mem_bytes=2 << 30, cpus=2, congestion_controls=controls)
+
+        assert controls == ["reno", "cubic"]
+        assert "tcpcongestion" not in tuning["inbound_sockopt"]
+        assert "tcpcongestion" not in tuning["outbound_sockopt"]
+        assert tuning["inbound_sockopt"]["tcpFastOpen"] is True
+
+    def test_unreadable_congestion_list(self, temp_dir):
+        """测试无法读取可用算法列表时返回空列表"""
+        import os
+        from nexus_vpn.utils.host import available_congestion_controls
+
+        assert available_congestion_controls(os.path.join(temp_dir, "missing")) == []
+
+    def test_unknown_profile(self):
+        """测试未知档位"""
+        from nexus_vpn.protocols.xray_tuning import build_tuning
+
+        with pytest.raises(ValueError):
+            build_tuning("turbo")